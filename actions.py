@@ -1,7 +1,64 @@
 import random
 
+import numpy as np
+
 from warehouse_parameters import N_ROBOTS
 
+VALID_ACTIONS = ('O', 'U', 'D', 'L', 'R', 'SU', 'SD', 'SL', 'SR')
+
+# the integer code of each action, which is its index in VALID_ACTIONS
+ACTION_CODES = {action: code for code, action in enumerate(VALID_ACTIONS)}
+STAY, UP, DOWN, LEFT, RIGHT, STACK_UP, STACK_DOWN, STACK_LEFT, STACK_RIGHT = range(len(VALID_ACTIONS))
+
+NUM_JOINT_ACTIONS = len(VALID_ACTIONS)**N_ROBOTS
+
+# the weight of the code of each robot in the enumeration of the actions, as
+# Python ints since they do not fit in 64 bits for 21 or more robots
+ENUM_WEIGHTS = tuple(len(VALID_ACTIONS)**k for k in range(N_ROBOTS - 1, -1, -1))
+
+# the largest number of joint actions that are decoded in advance. Larger
+# numbers of joint actions are decoded one at a time.
+MAX_DECODE_TABLE = 1000000
+
+def _decode_table():
+    """
+    Returns the codes of the actions of each robot for every enumeration of
+    the actions, or None if there are more than MAX_DECODE_TABLE.
+
+    Returns
+    -------
+    NumPy Array or None
+        An array with 1 row per enumeration and 1 column per robot.
+
+    """
+    if NUM_JOINT_ACTIONS > MAX_DECODE_TABLE:
+        return None
+    nums = np.arange(NUM_JOINT_ACTIONS, dtype=np.int64)[:, None]
+    weights = np.array(ENUM_WEIGHTS, dtype=np.int64)
+    return (nums // weights % len(VALID_ACTIONS)).astype(np.int8)
+
+DECODE_TABLE = _decode_table()
+
+def decode(num):
+    """
+    Returns the code of the action of each robot for an enumeration of the
+    actions. This is the inverse of Actions.enum.
+
+    Parameters
+    ----------
+    num : int
+        Enumeration value.
+
+    Returns
+    -------
+    [int]
+        The code of the action of each robot.
+
+    """
+    if DECODE_TABLE is not None:
+        return DECODE_TABLE[num].tolist()
+    return [num // w % len(VALID_ACTIONS) for w in ENUM_WEIGHTS]
+
 class Actions:
     """
     The actions that the robots will take, chosen by the central agent.
@@ -17,16 +74,27 @@ class Actions:
         SL : Move left with a stack.
         SR : Move right with a stack.
     
+    The policies return the cached Actions object of each enumeration, see
+    by_enum. These objects cannot be modified, and their enumeration and
+    codes are computed once.
+    
     Attributes
     ----------
     valid_actions : [str]
         A list of the valid actions for a robot to take. This list does not 
         change.
-    actions : [str]
+    actions : [str] or (str)
         A list containing 1 action per robot. The length of actions is equal 
-        to N_ROBOTS.
+        to N_ROBOTS. It is a tuple for the cached Actions objects.
     """
     
+    valid_actions = list(VALID_ACTIONS)
+    
+    # the cached Actions object of each enumeration, see by_enum
+    _cached = {}
+    _enum = None
+    _codes = None
+    
     def __init__(self):
         """
         Creates a new Actions object.
@@ -40,10 +108,45 @@ class Actions:
         None.
 
         """
-        self.valid_actions = ['O', 'U', 'D', 'L', 'R', 'SU', 'SD', 'SL', 'SR']
         self.actions = random.choices(self.valid_actions, k=N_ROBOTS)
         return
     
+    @staticmethod
+    def by_enum(num):
+        """
+        Returns the cached Actions object of an enumeration value, creating 
+        it the first time it is used.
+
+        Parameters
+        ----------
+        num : int
+            Enumeration value.
+
+        Returns
+        -------
+        Actions
+            An Actions object that cannot be modified.
+
+        """
+        a = Actions._cached.get(num)
+        if a is None:
+            if not 0 <= num < NUM_JOINT_ACTIONS:
+                raise ValueError('Invalid action enumeration: ' + str(num))
+            a = Actions.__new__(Actions)
+            a._codes = tuple(decode(num))
+            a.actions = tuple(VALID_ACTIONS[code] for code in a._codes)
+            a._enum = num
+            Actions._cached[num] = a
+        return a
+    
+    def _check_mutable(self):
+        """
+        Raises an error if this is a cached Actions object.
+        """
+        if self._enum is not None:
+            raise AttributeError('cached Actions objects cannot be modified')
+        return
+    
     def set_action(self, robot_idx, action):
         """
         Sets the action of one robot.
@@ -65,6 +168,7 @@ class Actions:
 
         """
         ## RAISE EXCEPTION
+        self._check_mutable()
         if robot_idx in range(N_ROBOTS):
             if action in self.valid_actions:
                 self.actions[robot_idx] = action
@@ -94,6 +198,7 @@ class Actions:
 
         """
         ## RAISE EXCEPTION
+        self._check_mutable()
         if action in self.valid_actions:
             self.actions = [action] * N_ROBOTS
             return True
@@ -117,12 +222,28 @@ class Actions:
             The enumeration of the list of actions.
 
         """
+        if self._enum is not None:
+            return self._enum
         enum = 0
-        for i in range(N_ROBOTS):
-            coeff = len(self.valid_actions)**(N_ROBOTS - 1 - i)
-            enum += self.valid_actions.index(self.actions[i]) * coeff
+        for code in self.codes():
+            enum = enum * len(VALID_ACTIONS) + code
         return enum
     
+    def codes(self):
+        """
+        Returns the integer code of the action of each robot, see 
+        ACTION_CODES.
+
+        Returns
+        -------
+        [int] or (int)
+            The code of the action of each robot.
+
+        """
+        if self._codes is not None:
+            return self._codes
+        return [ACTION_CODES[action] for action in self.actions]
+    
     def set_by_enum(self, num):
         """
         Set the action according to an enumeration value.
@@ -138,11 +259,9 @@ class Actions:
             Boolean value indicating if the action was successfully set.
 
         """
-        num_actions = len(self.valid_actions)
-        if num in range(num_actions ** N_ROBOTS):
-            for i in range(N_ROBOTS):
-                action_idx = int(num / num_actions**(N_ROBOTS - 1 - i)) % num_actions
-                self.set_action(i, self.valid_actions[action_idx])
+        self._check_mutable()
+        if 0 <= num < NUM_JOINT_ACTIONS:
+            self.actions = [VALID_ACTIONS[code] for code in decode(num)]
             return True
         else:
             return False
@@ -157,4 +276,4 @@ class Actions:
             The string representation of an Actions object.
 
         """
-        return str(self.actions)
\ No newline at end of file
+        return str(list(self.actions))
\ No newline at end of file
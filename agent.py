@@ -1,6 +1,8 @@
 import copy
 import random
 
+import numpy as np
+
 from actions import Actions
 from tables import Tables
 from warehouse_parameters import N_ROBOTS
@@ -15,7 +17,7 @@ class Agent:
         The tables used for training.
     """
     
-    def __init__(self):
+    def __init__(self, tables=None):
         """
         Creates an Agent object.
         
@@ -23,15 +25,20 @@ class Agent:
         also keeps track of q-value estimates, visits, and which actions do 
         not change the robot/stack locations.
 
+        Parameters
+        ----------
+        tables : Tables, optional
+            The tables of the agent. Defaults to new tables.
+
         Returns
         -------
         None.
 
         """
-        self.tables = Tables()
+        self.tables = Tables() if tables is None else tables
         return
     
-    def min_visits_policy(self, current_state):
+    def min_visits_policy(self, current_state, snum=None):
         """
         Selects the action that has been tried the least.
 
@@ -39,6 +46,8 @@ class Agent:
         ----------
         current_state : State
             The state the agent is currently in.
+        snum : int, optional
+            The enumeration of the current state, if it is already known.
 
         Returns
         -------
@@ -46,14 +55,11 @@ class Agent:
             The actions that should be taken if following this policy.
 
         """
-        snum = current_state.enum()
-        min_visits = min(self.tables.visits[snum])
-        anum = list(self.tables.visits[snum]).index(min_visits)
-        a = Actions()
-        a.set_by_enum(anum)
-        return a
+        if snum is None:
+            snum = current_state.enum()
+        return Actions.by_enum(int(np.argmin(self.tables.visits[snum])))
     
-    def greedy_policy(self, current_state):
+    def greedy_policy(self, current_state, snum=None):
         """
         Selects the action that has the lowest q-value estimate.
 
@@ -61,6 +67,8 @@ class Agent:
         ----------
         current_state : State
             The state the agent is currently in.
+        snum : int, optional
+            The enumeration of the current state, if it is already known.
 
         Returns
         -------
@@ -68,12 +76,9 @@ class Agent:
             The actions that should be taken if following this policy.
 
         """
-        snum = current_state.enum()
-        min_qval = min(self.tables.qvals[snum])
-        anum = list(self.tables.qvals[snum]).index(min_qval)
-        a = Actions()
-        a.set_by_enum(anum)
-        return a
+        if snum is None:
+            snum = current_state.enum()
+        return Actions.by_enum(int(np.argmin(self.tables.qvals[snum])))
     
     def random_policy(self, current_state):
         """
@@ -88,7 +93,7 @@ class Agent:
         a = Actions()
         return a
     
-    def epsilon_greedy_policy(self, current_state, epsilon):
+    def epsilon_greedy_policy(self, current_state, epsilon, snum=None):
         """
         Act randomly with probability epsilon. Otherwise act greedily.
 
@@ -98,6 +103,8 @@ class Agent:
             The current state the agent is in.
         epsilon : float
             The probability that the agent should act randomly.
+        snum : int, optional
+            The enumeration of the current state, if it is already known.
 
         Returns
         -------
@@ -108,7 +115,7 @@ class Agent:
         if random.random() < epsilon:
             return self.random_policy(current_state)
         else:
-            return self.greedy_policy(current_state)
+            return self.greedy_policy(current_state, snum)
         
     def baseline_policy(self, current_state):
         """
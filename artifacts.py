@@ -0,0 +1,436 @@
+"""
+A local store of trained tables, keyed by the configuration they were
+trained with.
+
+Each stored set of tables is an artifact in Artifacts/<key>/<version>/,
+where key is a hash of every parameter that affects the q-values (the
+warehouse, the order probability and the learning parameters) and version
+is the time it was stored. Artifacts/index.jsonl has 1 line of metadata per
+artifact: its key, version, configuration, number of training iterations,
+score, timestamp and format. Queries only read the index, and the tables of
+an artifact are only opened when they are used, as read-only memory maps
+where the format allows it, e.g.
+
+    python artifacts.py list N_ROWS=3 N_COLS=2
+    python artifacts.py best
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+import warehouse_parameters
+
+# the parameters that determine the q-values that training converges to
+CONFIG_PARAMS = ('N_ROWS', 'N_COLS', 'N_ROBOTS', 'N_STACKS', 'N_ITEMS', 'ORDER_PROB',
+                 'LEARNING_RATE', 'DISCOUNT_FACTOR', 'TD_METHOD', 'TRACE_LAMBDA', 'N_STEP',
+                 'QVALS_DTYPE', 'QVALS_INIT', 'VISITS_DTYPE')
+
+TABLE_NAMES = ('qvals', 'visits', 'same_locs')
+
+def current_config():
+    """
+    Returns the parameters of the current configuration.
+
+    Returns
+    -------
+    dict
+        The value of each parameter in CONFIG_PARAMS.
+
+    """
+    return {name: getattr(warehouse_parameters, name) for name in CONFIG_PARAMS}
+
+
+def config_key(config):
+    """
+    Returns the key of a configuration.
+
+    Parameters
+    ----------
+    config : dict
+        The value of each parameter in CONFIG_PARAMS.
+
+    Returns
+    -------
+    str
+        The first 16 hexadecimal digits of the SHA-256 hash of the
+        configuration.
+
+    """
+    text = json.dumps(config, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def table_format(tables):
+    """
+    Returns the format that the tables are stored in.
+
+    Parameters
+    ----------
+    tables : Tables
+        The tables.
+
+    Returns
+    -------
+    str
+        'dense', 'sparse', or 'memmap-robots' or 'memmap-stacks' for the
+        memmap backend, which stores the rows in the order of its files.
+
+    """
+    if tables.backend == 'memmap':
+        return 'memmap-' + tables.qvals.row_order
+    return tables.backend
+
+
+class Artifact:
+    """
+    A stored set of tables. The metadata is read from the index and the
+    tables are only opened when they are first used.
+
+    Attributes
+    ----------
+    key : str
+        The key of the configuration.
+    version : str
+        The version of the artifact.
+    config : dict
+        The configuration that the tables were trained with.
+    iterations : int or None
+        The number of time steps the tables were trained for.
+    score : float or None
+        The score of the greedy policy of the tables.
+    timestamp : float
+        The time the artifact was stored, in seconds since the epoch.
+    format : str
+        The format of the tables, see table_format.
+    path : str
+        The directory of the artifact.
+    """
+
+    def __init__(self, record, root):
+        """
+        Creates an Artifact from its line of the index.
+
+        Parameters
+        ----------
+        record : dict
+            The metadata of the artifact.
+        root : str
+            The directory of the store.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.key = record['key']
+        self.version = record['version']
+        self.config = record['config']
+        self.iterations = record['iterations']
+        self.score = record['score']
+        self.timestamp = record['timestamp']
+        self.format = record['format']
+        self.path = os.path.join(root, self.key, self.version)
+        self._tables = {}
+        return
+
+    def file(self, name):
+        """
+        Returns the file of a table.
+
+        Parameters
+        ----------
+        name : str
+            The name of the table, 'qvals', 'visits' or 'same_locs'.
+
+        Returns
+        -------
+        str
+            The path of the file.
+
+        """
+        extension = '.npz' if self.format == 'sparse' else '.npy'
+        return os.path.join(self.path, name + extension)
+
+    def table(self, name):
+        """
+        Opens a table. The .npy files of the dense and memmap formats are
+        opened as read-only memory maps, and the .npz files of the sparse
+        format as NpzFiles with the keys and rows of the allocated rows.
+
+        Parameters
+        ----------
+        name : str
+            The name of the table, 'qvals', 'visits' or 'same_locs'.
+
+        Returns
+        -------
+        NumPy Array or NpzFile
+            The table.
+
+        """
+        if name not in self._tables:
+            path = self.file(name)
+            if path.endswith('.npz'):
+                self._tables[name] = np.load(path)
+            else:
+                self._tables[name] = np.load(path, mmap_mode='r')
+        return self._tables[name]
+
+    @property
+    def qvals(self):
+        """
+        The q-values, see table.
+        """
+        return self.table('qvals')
+
+    def restore(self, tables):
+        """
+        Overwrites tables with the stored tables. The tables must have the
+        format of the artifact.
+
+        Parameters
+        ----------
+        tables : Tables
+            The tables to overwrite.
+
+        Returns
+        -------
+        None.
+
+        """
+        if table_format(tables) != self.format:
+            raise ValueError("artifact " + self.key + '/' + self.version + " is stored as "
+                             + self.format + ", not " + table_format(tables))
+        if self.format == 'dense':
+            tables.qvals = np.array(self.table('qvals'), dtype=tables.qvals.dtype)
+            tables.visits = np.array(self.table('visits'), dtype=tables.visits.dtype)
+            tables.same_locs = np.array(self.table('same_locs'))
+        else:
+            tables.qvals.load(self.file('qvals'))
+            tables.visits.load(self.file('visits'))
+            if self.format == 'sparse':
+                tables.same_locs.load(self.file('same_locs'))
+            else:
+                tables.same_locs = np.load(self.file('same_locs'))
+        tables.visited = (np.count_nonzero(tables.visits) if self.format == 'dense'
+                          else tables.visits.count_nonzero())
+        return
+
+    def __repr__(self):
+        """
+        Returns the string representation of an Artifact object.
+
+        Returns
+        -------
+        str
+            The key, version, iterations and score of the artifact.
+
+        """
+        return (self.key + '/' + self.version + ': iterations = ' + str(self.iterations)
+                + ', score = ' + str(self.score) + ', format = ' + self.format)
+
+
+class ArtifactStore:
+    """
+    A directory of artifacts with an index of their metadata.
+
+    Attributes
+    ----------
+    root : str
+        The directory of the store.
+    """
+
+    def __init__(self, root='Artifacts'):
+        """
+        Opens a store, creating its directory if it does not exist.
+
+        Parameters
+        ----------
+        root : str
+            The directory of the store.
+
+        Returns
+        -------
+        None.
+
+        """
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self._index = os.path.join(root, 'index.jsonl')
+        return
+
+    def put(self, tables, iterations=None, score=None, config=None):
+        """
+        Stores tables as a new artifact.
+
+        Parameters
+        ----------
+        tables : Tables
+            The tables to store.
+        iterations : int, optional
+            The number of time steps the tables were trained for. Defaults to
+            the last row of the performance table that was not added by a
+            ShadowEvaluator.
+        score : float, optional
+            The score of the greedy policy of the tables. Defaults to the same
+            row of the performance table.
+        config : dict, optional
+            The configuration that the tables were trained with. Defaults to
+            the current configuration.
+
+        Returns
+        -------
+        Artifact
+            The stored artifact.
+
+        """
+        if config is None:
+            config = current_config()
+        performance = tables.performance
+        if 'source' in performance.columns:
+            performance = performance[performance['source'] != 'shadow']
+        if len(performance) > 0:
+            if iterations is None:
+                iterations = int(performance.iloc[-1]['iters'])
+            if score is None:
+                score = float(performance.iloc[-1]['score'])
+        timestamp = time.time()
+        record = {'key': config_key(config),
+                  'version': time.strftime('%Y%m%d_%H%M%S', time.localtime(timestamp))
+                             + '_%06d' % (timestamp % 1 * 1e6),
+                  'config': config,
+                  'iterations': iterations,
+                  'score': score,
+                  'timestamp': timestamp,
+                  'format': table_format(tables)}
+        artifact = Artifact(record, self.root)
+        os.makedirs(artifact.path)
+        if artifact.format == 'dense':
+            for name in TABLE_NAMES:
+                np.save(artifact.file(name), getattr(tables, name))
+        else:
+            tables.qvals.save(artifact.file('qvals'))
+            tables.visits.save(artifact.file('visits'))
+            if artifact.format == 'sparse':
+                tables.same_locs.save(artifact.file('same_locs'))
+            else:
+                np.save(artifact.file('same_locs'), tables.same_locs)
+        # the index is only appended to once the tables are written, so it
+        # never refers to an incomplete artifact
+        with open(self._index, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        return artifact
+
+    def artifacts(self):
+        """
+        Returns every artifact in the index, oldest first.
+
+        Returns
+        -------
+        [Artifact]
+            The artifacts.
+
+        """
+        if not os.path.exists(self._index):
+            return []
+        with open(self._index) as f:
+            return [Artifact(json.loads(line), self.root) for line in f if line.strip()]
+
+    def query(self, key=None, **config):
+        """
+        Returns the artifacts of a configuration.
+
+        Parameters
+        ----------
+        key : str, optional
+            The key of the configuration.
+        **config
+            Values of parameters in CONFIG_PARAMS that the configuration must
+            have, e.g. N_ROWS=3.
+
+        Returns
+        -------
+        [Artifact]
+            The matching artifacts, oldest first.
+
+        """
+        return [artifact for artifact in self.artifacts()
+                if (key is None or artifact.key == key)
+                and all(artifact.config.get(name) == value for name, value in config.items())]
+
+    def best(self, key=None, **config):
+        """
+        Returns the artifact with the lowest score of a configuration.
+
+        Parameters
+        ----------
+        key : str, optional
+            The key of the configuration. Defaults to the key of the current
+            configuration if no parameters are given either.
+        **config
+            Values of parameters in CONFIG_PARAMS that the configuration must
+            have.
+
+        Returns
+        -------
+        Artifact or None
+            The artifact, or None if no scored artifact matches.
+
+        """
+        if key is None and not config:
+            key = config_key(current_config())
+        scored = [artifact for artifact in self.query(key, **config) if artifact.score is not None]
+        return min(scored, key=lambda artifact: artifact.score, default=None)
+
+    def latest(self, key=None, **config):
+        """
+        Returns the newest artifact of a configuration.
+
+        Parameters
+        ----------
+        key : str, optional
+            The key of the configuration. Defaults to the key of the current
+            configuration if no parameters are given either.
+        **config
+            Values of parameters in CONFIG_PARAMS that the configuration must
+            have.
+
+        Returns
+        -------
+        Artifact or None
+            The artifact, or None if no artifact matches.
+
+        """
+        if key is None and not config:
+            key = config_key(current_config())
+        matches = self.query(key, **config)
+        return matches[-1] if matches else None
+
+
+def _parse_filter(text):
+    """
+    Parses a NAME=VALUE filter of the command line, with VALUE converted to
+    the type of the parameter.
+    """
+    name, value = text.split('=', 1)
+    default = getattr(warehouse_parameters, name)
+    return name, type(default)(value) if default is not None else value
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Query the stored tables.')
+    parser.add_argument('command', choices=('list', 'best', 'latest'))
+    parser.add_argument('filters', nargs='*', help='NAME=VALUE parameters of the configuration')
+    parser.add_argument('--root', default='Artifacts')
+    args = parser.parse_args()
+    store = ArtifactStore(args.root)
+    filters = dict(_parse_filter(text) for text in args.filters)
+    if args.command == 'list':
+        for artifact in store.query(**filters):
+            print(artifact)
+    else:
+        print(getattr(store, args.command)(**filters))
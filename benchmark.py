@@ -0,0 +1,376 @@
+"""
+Benchmarks of the hot functions and the training/evaluation loops across a
+matrix of warehouse configurations.
+
+Each configuration is benchmarked in a new process with the warehouse
+parameters set through WAREHOUSE_<name> environment variables, since the
+parameters are read when the modules are imported. The results are written
+to Benchmarks/results_<timestamp>.json and can be compared to a stored
+baseline to flag regressions.
+
+Examples
+--------
+Benchmark the default matrix and save the results as the baseline:
+
+    python benchmark.py --save-baseline
+
+Benchmark 2 grid shapes and flag anything more than 15% slower than the
+baseline:
+
+    python benchmark.py --shapes 3x2,4x4 --robots 1,2 --threshold 0.15
+
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+from util import config_name, state_count
+
+DEFAULT_SHAPES = [(2, 2), (3, 2), (3, 3), (4, 4), (6, 6), (8, 8)]
+DEFAULT_ROBOTS = [1, 2, 3, 4]
+DEFAULT_STACKS = [1, 2, 4, 8]
+DEFAULT_ITEMS = [1, 2, 3]
+
+# benchmarks that are reported as operations per second
+BENCHMARKS = ['enum', 'calculate_state', 'greedy_policy', 'update', 'train', 'evaluate']
+
+
+def config_matrix(shapes, robots, stacks, items):
+    """
+    Returns every combination of the given parameters that fits in the grid.
+
+    Parameters
+    ----------
+    shapes : [(int, int)]
+        The numbers of rows and columns.
+    robots : [int]
+        The numbers of robots.
+    stacks : [int]
+        The numbers of stacks.
+    items : [int]
+        The numbers of items per stack.
+
+    Returns
+    -------
+    [dict]
+        The configurations.
+
+    """
+    configs = []
+    for (n_rows, n_cols), n_robots, n_stacks, n_items in itertools.product(shapes, robots, stacks, items):
+        if n_robots <= n_rows * n_cols + 1 and n_stacks <= n_rows * n_cols + 1:
+            configs.append({'N_ROWS': n_rows, 'N_COLS': n_cols, 'N_ROBOTS': n_robots,
+                            'N_STACKS': n_stacks, 'N_ITEMS': n_items})
+    return configs
+
+
+def _ops_per_sec(func, inputs, min_time):
+    """
+    Calls func on the inputs in a cycle for at least min_time seconds.
+
+    Returns
+    -------
+    float
+        The number of calls per second.
+
+    """
+    n = 0
+    start = time.perf_counter()
+    while True:
+        for x in inputs:
+            func(x)
+        n += len(inputs)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return n / elapsed
+
+
+def run_worker(min_time):
+    """
+    Benchmarks the configuration set in the warehouse parameters of this
+    process.
+
+    Parameters
+    ----------
+    min_time : float
+        The minimum number of seconds each benchmark runs for.
+
+    Returns
+    -------
+    dict
+        The size of the tables, the operations per second of each benchmark,
+        and the peak resident memory of the process in kilobytes. Benchmarks
+        that need the tables are None if the state space is too large to
+        index.
+
+    """
+    from actions import Actions
+    from environment import Environment
+    from warehouse_parameters import TABLE_BACKEND
+
+    random.seed(0)
+    env = Environment()
+    tables = env.agent.tables
+    result = {'backend': TABLE_BACKEND,
+              'num_states': tables.num_states,
+              'num_actions': tables.num_actions,
+              'ops_per_sec': {}}
+
+    states = []
+    for _ in range(64):
+        env.state.reset()
+        states.append(env.state)
+        env.state = env.calculate_state(env.state, Actions())
+    actions = [Actions() for _ in range(64)]
+    pairs = list(zip(states, actions))
+    ops = result['ops_per_sec']
+
+    ops['enum'] = _ops_per_sec(lambda s: s.enum(), states, min_time)
+    ops['calculate_state'] = _ops_per_sec(lambda p: env.calculate_state(p[0], p[1]), pairs, min_time)
+
+    # the sparse table stores the state enumerations as 64 bit integers
+    if tables.num_states >= 2**63:
+        for name in ('greedy_policy', 'update', 'train', 'evaluate'):
+            ops[name] = None
+        result['skipped'] = 'state space too large to index'
+    else:
+        transitions = [(s, env.calculate_state(s, a), a) for s, a in pairs]
+        ops['greedy_policy'] = _ops_per_sec(env.agent.greedy_policy, states, min_time)
+        ops['update'] = _ops_per_sec(lambda t: tables.update(t[0], t[1], t[2], sum(t[1].orders)),
+                                     transitions, min_time)
+        ops['train'] = _loop_steps_per_sec(env, env.agent.min_visits_policy, True, min_time)
+        ops['evaluate'] = _loop_steps_per_sec(env, env.agent.greedy_policy, False, min_time)
+
+    result['table_bytes'] = tables.storage_stats()['nbytes']
+    result['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+
+def _loop_steps_per_sec(env, policy, learn, min_time, n_iter=30):
+    """
+    Runs episodes of n_iter time steps like main.train and main.evaluate,
+    without reading or saving the tables, for at least min_time seconds.
+
+    Returns
+    -------
+    float
+        The number of time steps per second.
+
+    """
+    steps = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < min_time:
+        env.state.reset()
+        snum = env.state.enum()
+        for time_step in range(n_iter):
+            a = policy(env.state, snum)
+            previous_state = env.state
+            env.state = env.calculate_state(env.state, a)
+            env.update_cost()
+            previous_snum = snum
+            snum = env.state.enum()
+            if learn:
+                env.agent.tables.update(previous_state, env.state, a, sum(env.state.orders),
+                                        previous_snum, snum)
+        steps += n_iter
+    return steps / (time.perf_counter() - start)
+
+
+def run(configs, min_time=0.3, dense_limit=512 * 2**20, timeout=600):
+    """
+    Benchmarks each configuration in a new process.
+
+    Parameters
+    ----------
+    configs : [dict]
+        The configurations to benchmark.
+    min_time : float
+        The minimum number of seconds each benchmark runs for.
+    dense_limit : int
+        Configurations whose dense tables would need more than this many
+        bytes use the sparse backend.
+    timeout : float
+        The number of seconds after which a configuration is abandoned.
+
+    Returns
+    -------
+    [dict]
+        The results of each configuration. A configuration that failed has an
+        'error' instead of results.
+
+    """
+    results = []
+    for config in configs:
+        num_states = state_count(config['N_ROWS'], config['N_COLS'], config['N_ROBOTS'],
+                                 config['N_STACKS'], config['N_ITEMS'])
+        # float32 q-values, uint32 visits and 1 bit of same_locs per action
+        dense_bytes = num_states * 9**config['N_ROBOTS'] * 8.125
+        backend = 'dense' if dense_bytes <= dense_limit else 'sparse'
+
+        env = dict(os.environ)
+        for name, value in config.items():
+            env['WAREHOUSE_' + name] = str(value)
+        env['WAREHOUSE_TABLE_BACKEND'] = backend
+
+        record = {'name': config_name(config['N_ROWS'], config['N_COLS'], config['N_ROBOTS'],
+                                      config['N_STACKS'], config['N_ITEMS']),
+                  'config': config}
+        print('benchmarking ' + record['name'] + ' (' + backend + ')', file=sys.stderr)
+        try:
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker',
+                                   '--min-time', str(min_time)],
+                                  env=env, capture_output=True, text=True, timeout=timeout,
+                                  cwd=os.path.dirname(os.path.abspath(__file__)))
+            if proc.returncode == 0:
+                record.update(json.loads(proc.stdout.strip().splitlines()[-1]))
+            else:
+                record['error'] = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'failed'
+        except subprocess.TimeoutExpired:
+            record['error'] = 'timed out after ' + str(timeout) + ' seconds'
+        results.append(record)
+    return results
+
+
+def find_regressions(results, baseline, threshold=0.1, memory_threshold=0.2):
+    """
+    Compares results to a baseline.
+
+    Parameters
+    ----------
+    results : [dict]
+        The results returned by run.
+    baseline : [dict]
+        The results of a previous run.
+    threshold : float
+        The largest allowed relative decrease in operations per second.
+    memory_threshold : float
+        The largest allowed relative increase in peak memory.
+
+    Returns
+    -------
+    [str]
+        A description of each regression.
+
+    """
+    old_results = {r['name']: r for r in baseline if 'error' not in r}
+    regressions = []
+    for new in results:
+        old = old_results.get(new['name'])
+        if old is None or 'error' in new:
+            continue
+        for name in BENCHMARKS:
+            old_ops = old['ops_per_sec'].get(name)
+            new_ops = new['ops_per_sec'].get(name)
+            if old_ops and new_ops is not None and new_ops < old_ops * (1 - threshold):
+                regressions.append('{}: {} {:.0f} -> {:.0f} ops/sec ({:+.1%})'.format(
+                    new['name'], name, old_ops, new_ops, new_ops / old_ops - 1))
+        if new['peak_rss_kb'] > old['peak_rss_kb'] * (1 + memory_threshold):
+            regressions.append('{}: peak memory {} -> {} KB ({:+.1%})'.format(
+                new['name'], old['peak_rss_kb'], new['peak_rss_kb'],
+                new['peak_rss_kb'] / old['peak_rss_kb'] - 1))
+    return regressions
+
+
+def format_results(results):
+    """
+    Formats results as a table with 1 line per configuration.
+
+    Parameters
+    ----------
+    results : [dict]
+        The results returned by run.
+
+    Returns
+    -------
+    str
+        The table.
+
+    """
+    s = '{:<36}{:>8}'.format('config', 'backend')
+    for name in BENCHMARKS:
+        s += '{:>16}'.format(name)
+    s += '{:>12}\n'.format('peak MB')
+    for r in results:
+        s += '{:<36}'.format(r['name'])
+        if 'error' in r:
+            s += '  error: ' + r['error'] + '\n'
+            continue
+        s += '{:>8}'.format(r['backend'])
+        for name in BENCHMARKS:
+            ops = r['ops_per_sec'][name]
+            s += '{:>16}'.format('-' if ops is None else '{:.0f}'.format(ops))
+        s += '{:>12.1f}\n'.format(r['peak_rss_kb'] / 1024)
+    return s
+
+
+def _int_list(s):
+    return [int(x) for x in s.split(',')]
+
+
+def _shape_list(s):
+    return [tuple(int(n) for n in shape.split('x')) for shape in s.split(',')]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the simulator across warehouse configurations.')
+    parser.add_argument('--shapes', type=_shape_list, default=DEFAULT_SHAPES,
+                        help='grid shapes, e.g. 2x2,4x4')
+    parser.add_argument('--robots', type=_int_list, default=DEFAULT_ROBOTS)
+    parser.add_argument('--stacks', type=_int_list, default=DEFAULT_STACKS)
+    parser.add_argument('--items', type=_int_list, default=DEFAULT_ITEMS)
+    parser.add_argument('--min-time', type=float, default=0.3,
+                        help='minimum seconds per benchmark')
+    parser.add_argument('--dense-limit-mb', type=float, default=512,
+                        help='use the sparse backend above this dense table size')
+    parser.add_argument('--timeout', type=float, default=600,
+                        help='seconds before a configuration is abandoned')
+    parser.add_argument('--output', default=None,
+                        help='results file, defaults to Benchmarks/results_<timestamp>.json')
+    parser.add_argument('--baseline', default='Benchmarks/baseline.json')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='save the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='allowed relative decrease in ops/sec')
+    parser.add_argument('--memory-threshold', type=float, default=0.2,
+                        help='allowed relative increase in peak memory')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.min_time)))
+        sys.exit(0)
+
+    configs = config_matrix(args.shapes, args.robots, args.stacks, args.items)
+    results = run(configs, args.min_time, int(args.dense_limit_mb * 2**20), args.timeout)
+    print(format_results(results))
+
+    output = args.output
+    if output is None:
+        output = 'Benchmarks/results_' + time.strftime('%Y%m%d-%H%M%S') + '.json'
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('results written to ' + output)
+
+    status = 0
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.threshold, args.memory_threshold)
+        if regressions:
+            print('\nregressions compared to ' + args.baseline + ':')
+            print('\n'.join(regressions))
+            status = 1
+        else:
+            print('no regressions compared to ' + args.baseline)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print('baseline saved to ' + args.baseline)
+    sys.exit(status)
@@ -0,0 +1,482 @@
+"""
+Capacity planning for a warehouse configuration before training it.
+
+For a proposed configuration, plan reports the exact numbers of states and
+joint actions, the memory and disk used by the tables with each backend, the
+size of the recorded transitions and of the action decode table, and the
+time per training step measured by a short calibration run in a new process,
+extrapolated to the planned number of steps. If the dense tables would not
+fit in the memory limit, it recommends the memmap or sparse backend, and it
+refuses configurations that no backend can hold, e.g.
+
+    python capacity.py --rows 6 --cols 6 --robots 3 --stacks 4 --steps 10000000
+
+The default configuration is the one in warehouse_parameters.py, and the
+command exits with status 1 if the configuration is refused.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from actions import VALID_ACTIONS, MAX_DECODE_TABLE
+from util import state_count
+from warehouse_parameters import N_ROWS, N_COLS, N_ROBOTS, N_STACKS, N_ITEMS
+from warehouse_parameters import QVALS_DTYPE, VISITS_DTYPE, TABLE_BACKEND, SPARSE_MAX_ROWS
+from warehouse_parameters import MEMMAP_CACHE_ROWS
+
+BACKENDS = ('dense', 'memmap', 'sparse')
+
+# the fraction of the available memory that the tables may use, leaving room
+# for the rest of the process
+MEMORY_FRACTION = 0.8
+
+# the number of bytes of a row of a SparseTable besides its values: the key
+# and slot of its hash table entry, at a load factor of at least 1/2
+SPARSE_ROW_OVERHEAD = 32
+
+# the smallest number of rows in memory that the sparse backend is
+# recommended with
+MIN_SPARSE_ROWS = 4096
+
+# the size of a recorded time step, see recorder.RECORD_DTYPE
+TRANSITION_BYTES = 8 + 8 + 4 + 4 + 1 + 1
+
+def action_count(n_robots=N_ROBOTS):
+    """
+    Determine the exact number of joint actions of a configuration.
+
+    Returns
+    -------
+    int
+        The number of joint actions.
+
+    """
+    return len(VALID_ACTIONS)**n_robots
+
+
+def table_bytes(num_states, num_actions, qvals_dtype=QVALS_DTYPE, visits_dtype=VISITS_DTYPE):
+    """
+    Determine the number of bytes of each table when every row is stored.
+
+    Parameters
+    ----------
+    num_states : int
+        The number of states.
+    num_actions : int
+        The number of joint actions.
+    qvals_dtype : str or NumPy dtype
+        The type of the q-values.
+    visits_dtype : str or NumPy dtype
+        The type of the visits.
+
+    Returns
+    -------
+    dict
+        The number of bytes of the qvals, visits and same_locs tables, and of
+        1 row of all 3.
+
+    """
+    qvals_row = num_actions * np.dtype(qvals_dtype).itemsize
+    visits_row = num_actions * np.dtype(visits_dtype).itemsize
+    same_locs_row = (num_actions + 7) // 8
+    return {'qvals': num_states * qvals_row,
+            'visits': num_states * visits_row,
+            'same_locs': num_states * same_locs_row,
+            'row': qvals_row + visits_row + same_locs_row}
+
+
+def backend_bytes(backend, num_states, num_actions, qvals_dtype=QVALS_DTYPE,
+                  visits_dtype=VISITS_DTYPE, rows=None, cache_rows=MEMMAP_CACHE_ROWS):
+    """
+    Determine the memory and disk used by the tables with a backend.
+
+    The dense backend keeps every table in memory. The memmap backend keeps
+    the qvals and visits tables in files with cache_rows rows of each in
+    memory, and the same_locs table in memory. The sparse backend keeps the
+    rows that are used in memory, and its arena of rows can be up to twice as
+    large as the rows it holds, so its memory is an upper bound.
+
+    Parameters
+    ----------
+    backend : str
+        The backend, 'dense', 'memmap' or 'sparse'.
+    num_states : int
+        The number of states.
+    num_actions : int
+        The number of joint actions.
+    qvals_dtype : str or NumPy dtype
+        The type of the q-values.
+    visits_dtype : str or NumPy dtype
+        The type of the visits.
+    rows : int, optional
+        The number of rows the sparse backend holds. Defaults to every row.
+    cache_rows : int
+        The number of rows of each table the memmap backend keeps in memory.
+
+    Returns
+    -------
+    (int, int)
+        The number of bytes of memory and of disk.
+
+    """
+    sizes = table_bytes(num_states, num_actions, qvals_dtype, visits_dtype)
+    if backend == 'dense':
+        return sizes['qvals'] + sizes['visits'] + sizes['same_locs'], 0
+    elif backend == 'memmap':
+        cached = min(cache_rows, num_states) * (sizes['row'] - (num_actions + 7) // 8)
+        return sizes['same_locs'] + cached, sizes['qvals'] + sizes['visits']
+    elif backend == 'sparse':
+        rows = num_states if rows is None else min(rows, num_states)
+        return rows * (2 * sizes['row'] + 3 * SPARSE_ROW_OVERHEAD), 0
+    raise ValueError('Unknown table backend: ' + str(backend))
+
+
+def available_memory():
+    """
+    Determine the number of bytes of memory available to a new allocation.
+
+    Returns
+    -------
+    int or None
+        The available memory, or None if it cannot be determined.
+
+    """
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def calibrate(config, n_steps=3000, backend='sparse', timeout=600):
+    """
+    Measures the time per training step of a configuration in a new process.
+
+    The warehouse parameters are read when the modules are imported, so the
+    configuration is passed to the new process through WAREHOUSE_<name>
+    environment variables, as in benchmark.py.
+
+    Parameters
+    ----------
+    config : dict
+        The warehouse parameters, e.g. {'N_ROWS': 4, 'N_COLS': 3}.
+    n_steps : int
+        The number of training steps to time.
+    backend : str
+        The backend of the tables. The sparse backend does not allocate the
+        tables up front, so it can calibrate configurations that do not fit.
+    timeout : float
+        The number of seconds after which the calibration is abandoned.
+
+    Returns
+    -------
+    dict
+        The number of seconds per training step and the number of bytes of
+        memory used by the tables, or an 'error'.
+
+    """
+    env = dict(os.environ)
+    for name, value in config.items():
+        env['WAREHOUSE_' + name] = str(value)
+    env['WAREHOUSE_TABLE_BACKEND'] = backend
+    try:
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker',
+                               '--steps', str(n_steps)],
+                              env=env, capture_output=True, text=True, timeout=timeout,
+                              cwd=os.path.dirname(os.path.abspath(__file__)))
+    except subprocess.TimeoutExpired:
+        return {'error': 'timed out after ' + str(timeout) + ' seconds'}
+    if proc.returncode != 0:
+        return {'error': proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'failed'}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def run_worker(n_steps, n_iter=30):
+    """
+    Times training steps of the configuration of this process, like
+    Session.train without reading or saving the tables.
+
+    Returns
+    -------
+    dict
+        The number of seconds per training step and the number of bytes of
+        memory used by the tables.
+
+    """
+    from environment import Environment
+
+    env = Environment()
+    tables = env.agent.tables
+    steps = 0
+    start = time.perf_counter()
+    while steps < n_steps:
+        env.state.reset()
+        snum = env.state.enum()
+        for time_step in range(n_iter):
+            a = env.agent.min_visits_policy(env.state, snum)
+            previous_state = env.state
+            env.state = env.calculate_state(env.state, a)
+            env.update_cost()
+            previous_snum = snum
+            snum = env.state.enum()
+            tables.update(previous_state, env.state, a, sum(env.state.orders), previous_snum, snum)
+        steps += n_iter
+    elapsed = time.perf_counter() - start
+    return {'step_seconds': elapsed / steps, 'table_bytes': int(tables.storage_stats()['nbytes'])}
+
+
+def recommend(num_states, num_actions, steps, memory_limit, disk_limit,
+              qvals_dtype=QVALS_DTYPE, visits_dtype=VISITS_DTYPE, max_rows=SPARSE_MAX_ROWS):
+    """
+    Chooses the backend for a configuration: dense if it fits in memory,
+    otherwise memmap if its files fit on disk and its same_locs table fits
+    in memory, otherwise sparse if the rows used by the planned steps fit in
+    memory.
+
+    Parameters
+    ----------
+    num_states : int
+        The number of states.
+    num_actions : int
+        The number of joint actions.
+    steps : int
+        The number of training steps, which bounds the rows the sparse
+        backend uses.
+    memory_limit : int or None
+        The number of bytes of memory the tables may use, or None for no
+        limit.
+    disk_limit : int or None
+        The number of bytes of disk the tables may use, or None for no limit.
+    qvals_dtype : str or NumPy dtype
+        The type of the q-values.
+    visits_dtype : str or NumPy dtype
+        The type of the visits.
+    max_rows : int or None
+        The largest number of rows the sparse backend keeps in memory.
+
+    Returns
+    -------
+    (str or None, str)
+        The backend, or None if no backend fits, and the reason.
+
+    """
+    def fits(limit, nbytes):
+        return limit is None or nbytes <= limit
+
+    memory, disk = backend_bytes('dense', num_states, num_actions, qvals_dtype, visits_dtype)
+    if fits(memory_limit, memory):
+        return 'dense', 'the dense tables fit in memory'
+    memory, disk = backend_bytes('memmap', num_states, num_actions, qvals_dtype, visits_dtype)
+    if fits(memory_limit, memory) and fits(disk_limit, disk):
+        return 'memmap', 'the dense tables do not fit in memory but their files fit on disk'
+    # the sparse table stores the state enumerations as 64 bit integers
+    if num_states < 2**63:
+        rows = steps + 1 if max_rows is None else min(max_rows, steps + 1)
+        memory, disk = backend_bytes('sparse', num_states, num_actions, qvals_dtype,
+                                     visits_dtype, rows=rows)
+        if fits(memory_limit, memory):
+            return 'sparse', 'only the rows of the visited states fit in memory'
+        # with max_rows, the least recently used rows are spilled to disk
+        row_bytes = backend_bytes('sparse', num_states, num_actions, qvals_dtype,
+                                  visits_dtype, rows=1)[0]
+        fit_rows = memory_limit // row_bytes
+        if fit_rows >= MIN_SPARSE_ROWS:
+            return 'sparse', ('only SPARSE_MAX_ROWS=' + str(fit_rows) + ' rows fit in memory, '
+                              'the other visited rows are spilled to disk')
+    return None, 'no backend fits the tables in the memory and disk limits'
+
+
+def plan(config=None, steps=10**7, backend=TABLE_BACKEND, qvals_dtype=QVALS_DTYPE,
+         visits_dtype=VISITS_DTYPE, memory_limit=None, disk_limit=None, calibration_steps=3000):
+    """
+    Plans the capacity needed to train a configuration.
+
+    Parameters
+    ----------
+    config : dict, optional
+        The values of N_ROWS, N_COLS, N_ROBOTS, N_STACKS and N_ITEMS. Missing
+        values default to the current warehouse parameters.
+    steps : int
+        The number of training steps.
+    backend : str
+        The proposed backend.
+    qvals_dtype : str or NumPy dtype
+        The type of the q-values.
+    visits_dtype : str or NumPy dtype
+        The type of the visits.
+    memory_limit : int, optional
+        The number of bytes of memory the tables may use. Defaults to
+        MEMORY_FRACTION of the available memory.
+    disk_limit : int, optional
+        The number of bytes of disk the tables may use. Defaults to the free
+        space of the current directory.
+    calibration_steps : int
+        The number of training steps of the calibration run, or 0 to skip
+        it.
+
+    Returns
+    -------
+    dict
+        The counts, sizes, limits, recommended backend and, if calibrated,
+        the time per step and the extrapolated training time.
+
+    """
+    config = dict({'N_ROWS': N_ROWS, 'N_COLS': N_COLS, 'N_ROBOTS': N_ROBOTS,
+                   'N_STACKS': N_STACKS, 'N_ITEMS': N_ITEMS}, **(config or {}))
+    if memory_limit is None:
+        available = available_memory()
+        memory_limit = None if available is None else int(available * MEMORY_FRACTION)
+    if disk_limit is None:
+        disk_limit = shutil.disk_usage('.').free
+    num_states = state_count(config['N_ROWS'], config['N_COLS'], config['N_ROBOTS'],
+                             config['N_STACKS'], config['N_ITEMS'])
+    num_actions = action_count(config['N_ROBOTS'])
+    rows = steps + 1 if SPARSE_MAX_ROWS is None else min(SPARSE_MAX_ROWS, steps + 1)
+
+    result = {'config': config,
+              'num_states': num_states,
+              'num_actions': num_actions,
+              'pairs': num_states * num_actions,
+              'tables': table_bytes(num_states, num_actions, qvals_dtype, visits_dtype),
+              'backends': {},
+              'transitions_bytes': steps * TRANSITION_BYTES,
+              'decode_table_bytes': (num_actions * config['N_ROBOTS']
+                                     if num_actions <= MAX_DECODE_TABLE else 0),
+              'memory_limit': memory_limit,
+              'disk_limit': disk_limit,
+              'backend': backend}
+    for name in BACKENDS:
+        memory, disk = backend_bytes(name, num_states, num_actions, qvals_dtype, visits_dtype,
+                                     rows=rows)
+        result['backends'][name] = {'memory': memory, 'disk': disk}
+
+    proposed = result['backends'].get(backend)
+    if proposed is None:
+        raise ValueError('Unknown table backend: ' + str(backend))
+    fits = ((memory_limit is None or proposed['memory'] <= memory_limit)
+            and (disk_limit is None or proposed['disk'] <= disk_limit))
+    if backend == 'sparse' and num_states >= 2**63:
+        fits = False
+    recommended, reason = recommend(num_states, num_actions, steps, memory_limit, disk_limit,
+                                    qvals_dtype, visits_dtype)
+    result['fits'] = fits
+    result['recommended'] = backend if fits else recommended
+    result['reason'] = reason if not fits else 'the proposed backend fits'
+
+    if calibration_steps and result['recommended'] is not None:
+        # the memmap backend would create its full size files, so it is
+        # calibrated with the sparse backend
+        calibration_backend = 'dense' if result['recommended'] == 'dense' else 'sparse'
+        calibration = calibrate(dict(config, QVALS_DTYPE=str(qvals_dtype),
+                                     VISITS_DTYPE=str(visits_dtype)),
+                                calibration_steps, calibration_backend)
+        calibration['backend'] = calibration_backend
+        result['calibration'] = calibration
+        if 'step_seconds' in calibration:
+            result['train_seconds'] = calibration['step_seconds'] * steps
+    return result
+
+
+def _size(nbytes):
+    """
+    Formats a number of bytes with a binary prefix.
+    """
+    for unit in ('B', 'KiB', 'MiB', 'GiB', 'TiB', 'PiB'):
+        if nbytes < 1024 or unit == 'PiB':
+            return '{:.4g} {}'.format(nbytes, unit)
+        nbytes /= 1024
+
+
+def format_plan(result):
+    """
+    Formats a plan as a report.
+
+    Parameters
+    ----------
+    result : dict
+        The plan returned by plan.
+
+    Returns
+    -------
+    str
+        The report.
+
+    """
+    config = result['config']
+    lines = ['configuration: {}x{} grid, {} robots, {} stacks, {} items'.format(
+                 config['N_ROWS'], config['N_COLS'], config['N_ROBOTS'], config['N_STACKS'],
+                 config['N_ITEMS']),
+             'states: {:,}'.format(result['num_states']),
+             'joint actions: {:,}'.format(result['num_actions']),
+             'state/action pairs: {:,}'.format(result['pairs']),
+             'tables: qvals {}, visits {}, same_locs {}'.format(
+                 _size(result['tables']['qvals']), _size(result['tables']['visits']),
+                 _size(result['tables']['same_locs'])),
+             'recorded transitions: ' + _size(result['transitions_bytes']),
+             'action decode table: ' + _size(result['decode_table_bytes'])]
+    for name, sizes in result['backends'].items():
+        lines.append('{:<8} memory {:>12}   disk {:>12}'.format(
+            name, _size(sizes['memory']), _size(sizes['disk'])))
+    lines.append('limits: memory {}, disk {}'.format(
+        '-' if result['memory_limit'] is None else _size(result['memory_limit']),
+        '-' if result['disk_limit'] is None else _size(result['disk_limit'])))
+    calibration = result.get('calibration')
+    if calibration is not None:
+        if 'error' in calibration:
+            lines.append('calibration failed: ' + calibration['error'])
+        else:
+            lines.append('time per step: {:.1f} us ({} backend), training: {:.0f} s'.format(
+                calibration['step_seconds'] * 1e6, calibration['backend'], result['train_seconds']))
+    if result['fits']:
+        lines.append('backend ' + result['backend'] + ' fits')
+    elif result['recommended'] is not None:
+        lines.append('backend ' + result['backend'] + ' does not fit, use '
+                     + result['recommended'] + ': ' + result['reason'])
+    else:
+        lines.append('refused: ' + result['reason'])
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Plan the capacity needed to train a configuration.')
+    parser.add_argument('--rows', type=int, default=N_ROWS)
+    parser.add_argument('--cols', type=int, default=N_COLS)
+    parser.add_argument('--robots', type=int, default=N_ROBOTS)
+    parser.add_argument('--stacks', type=int, default=N_STACKS)
+    parser.add_argument('--items', type=int, default=N_ITEMS)
+    parser.add_argument('--steps', type=float, default=1e7, help='training steps')
+    parser.add_argument('--backend', choices=BACKENDS, default=TABLE_BACKEND)
+    parser.add_argument('--qvals-dtype', default=QVALS_DTYPE)
+    parser.add_argument('--visits-dtype', default=VISITS_DTYPE)
+    parser.add_argument('--memory-limit-mb', type=float, default=None)
+    parser.add_argument('--disk-limit-mb', type=float, default=None)
+    parser.add_argument('--calibration-steps', type=int, default=3000,
+                        help='training steps of the calibration run, 0 to skip it')
+    parser.add_argument('--json', action='store_true', help='print the plan as json')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(int(args.steps))))
+        sys.exit(0)
+
+    result = plan({'N_ROWS': args.rows, 'N_COLS': args.cols, 'N_ROBOTS': args.robots,
+                   'N_STACKS': args.stacks, 'N_ITEMS': args.items},
+                  int(args.steps), args.backend, args.qvals_dtype, args.visits_dtype,
+                  None if args.memory_limit_mb is None else int(args.memory_limit_mb * 2**20),
+                  None if args.disk_limit_mb is None else int(args.disk_limit_mb * 2**20),
+                  args.calibration_steps)
+    print(json.dumps(result, indent=2) if args.json else format_plan(result))
+    sys.exit(0 if result['recommended'] is not None else 1)
@@ -0,0 +1,247 @@
+import random
+
+import numpy as np
+
+from actions import Actions
+from environment import Environment
+from state import State
+from value_iteration import action_transitions
+from warehouse_parameters import DISCOUNT_FACTOR
+
+class ConvergenceMonitor:
+    """
+    Decides when training has converged so that it can be stopped early.
+
+    Three statistics are checked every check_every time steps of training:
+        The exponential moving average of the absolute temporal difference
+        error of the updates.
+        The Bellman residual of the greedy action over a sample of the
+        states that have been visited. For each sampled state the residual
+        is the absolute difference between the q-value of the greedy action
+        and the expectation of c + gamma * min Q(s') over the outcomes of the
+        orders, which is computed exactly, so it has no sampling noise. The
+        reported residual is the mean over the sampled states.
+        The fraction of the sampled states whose greedy action is the same
+        as at the previous check.
+    Training has converged once all 3 statistics are within their
+    tolerances at window consecutive checks.
+
+    The sampled states are a reservoir sample of the states visited while
+    training, so every visited state is equally likely to be sampled.
+
+    The monitor has its own random number generator and environment, so
+    turning it on does not change the random numbers, the environment or the
+    latency tracker of training.
+
+    Attributes
+    ----------
+    td_tolerance : float
+        The largest moving average of the absolute temporal difference error.
+    residual_tolerance : float
+        The largest mean Bellman residual.
+    stability_tolerance : float
+        The smallest fraction of sampled states whose greedy action did not
+        change.
+    window : int
+        The number of consecutive checks that must be within the tolerances.
+    check_every : int
+        The number of time steps between checks.
+    td_ema : float or None
+        The moving average of the absolute temporal difference error.
+    history : [dict]
+        The statistics of each check.
+    reason : str or None
+        Why training should stop, or None if it has not converged.
+    """
+
+    def __init__(self, td_tolerance=0.05, residual_tolerance=0.1, stability_tolerance=0.98,
+                 window=5, check_every=10000, n_samples=200, ema_weight=0.001, seed=0):
+        """
+        Creates a ConvergenceMonitor.
+
+        Parameters
+        ----------
+        td_tolerance : float
+            The largest moving average of the absolute temporal difference
+            error.
+        residual_tolerance : float
+            The largest mean Bellman residual.
+        stability_tolerance : float
+            The smallest fraction of sampled states whose greedy action did
+            not change.
+        window : int
+            The number of consecutive checks that must be within the
+            tolerances.
+        check_every : int
+            The number of time steps between checks.
+        n_samples : int
+            The number of sampled states.
+        ema_weight : float
+            The weight of each new temporal difference error in the moving
+            average.
+        seed : int
+            The seed of the random number generator of the reservoir sample.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.td_tolerance = td_tolerance
+        self.residual_tolerance = residual_tolerance
+        self.stability_tolerance = stability_tolerance
+        self.window = window
+        self.check_every = check_every
+        self.n_samples = n_samples
+        self.ema_weight = ema_weight
+
+        self.td_ema = None
+        self.history = []
+        self.reason = None
+        self.steps = 0
+        self._seen = 0
+        self._samples = []
+        self._greedy = None
+        self._next_check = check_every
+        # new states draw random locations, so the random numbers of training
+        # are restored after creating them
+        saved = random.getstate()
+        self._state = State()
+        self._env = Environment(object())
+        random.setstate(saved)
+        self._random = random.Random(seed)
+        return
+
+    def step(self, snum, td_error):
+        """
+        Records one time step of training.
+
+        Parameters
+        ----------
+        snum : int
+            The enumeration of the state that was updated.
+        td_error : float
+            The temporal difference error returned by Tables.update.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.steps += 1
+        abs_td = abs(td_error)
+        if self.td_ema is None:
+            self.td_ema = abs_td
+        else:
+            self.td_ema += self.ema_weight * (abs_td - self.td_ema)
+
+        self._seen += 1
+        if len(self._samples) < self.n_samples:
+            self._samples.append(snum)
+        else:
+            i = self._random.randrange(self._seen)
+            if i < self.n_samples:
+                self._samples[i] = snum
+        return
+
+    def check(self, env):
+        """
+        Checks for convergence if check_every time steps have passed since
+        the previous check. Should be called at the end of each episode.
+
+        Parameters
+        ----------
+        env : Environment
+            The environment being trained. Its agent's tables are checked at
+            its order probability, and it is not changed.
+
+        Returns
+        -------
+        bool
+            A boolean value indicating if training has converged.
+
+        """
+        if self.steps < self._next_check or not self._samples:
+            return False
+        self._next_check = self.steps + self.check_every
+
+        tables = env.agent.tables
+        snums = sorted(set(self._samples))
+        greedy = {}
+        residuals = []
+        for snum in snums:
+            row = np.asarray(tables.qvals[snum])
+            anum = int(row.argmin())
+            greedy[snum] = anum
+            residuals.append(abs(self._bellman_target(tables, snum, anum, env.order_prob)
+                                 - float(row[anum])))
+
+        if self._greedy is None:
+            stability = 0.0
+        else:
+            common = [snum for snum in snums if snum in self._greedy]
+            same = sum(1 for snum in common if self._greedy[snum] == greedy[snum])
+            stability = same / len(common) if common else 0.0
+        self._greedy = greedy
+
+        stats = {'steps': self.steps,
+                 'td_ema': self.td_ema,
+                 'residual': float(np.mean(residuals)),
+                 'stability': stability}
+        stats['within'] = (stats['td_ema'] <= self.td_tolerance
+                           and stats['residual'] <= self.residual_tolerance
+                           and stats['stability'] >= self.stability_tolerance)
+        self.history.append(stats)
+
+        recent = self.history[-self.window:]
+        if len(recent) == self.window and all(h['within'] for h in recent):
+            self.reason = ('converged after {} steps: td_ema={:.4g} <= {:.4g}, '
+                           'residual={:.4g} <= {:.4g}, stability={:.3f} >= {:.3f} '
+                           'for {} checks').format(
+                self.steps, stats['td_ema'], self.td_tolerance, stats['residual'],
+                self.residual_tolerance, stats['stability'], self.stability_tolerance, self.window)
+            return True
+        return False
+
+    def _bellman_target(self, tables, snum, anum, prob):
+        """
+        Computes the expectation of c + gamma * min Q(s') for a state and
+        action over the outcomes of the orders, see
+        value_iteration.action_transitions.
+
+        Returns
+        -------
+        float
+            The expectation.
+
+        """
+        self._state.set_by_enum(snum)
+        succ, probs, costs = action_transitions(self._env, self._state, Actions.by_enum(anum),
+                                                np.array([self._state.orders]), prob)
+        target = float(costs[0])
+        for s2num, p in zip(succ[0].tolist(), probs.tolist()):
+            # the outcomes that can not happen are skipped, so they do not
+            # allocate rows of the sparse backend
+            if p > 0:
+                target += p * DISCOUNT_FACTOR * float(min(tables.qvals[s2num]))
+        return target
+
+    def summary(self):
+        """
+        Returns why training stopped.
+
+        Returns
+        -------
+        str
+            The reason training converged, or a description of the last
+            check if it has not converged.
+
+        """
+        if self.reason is not None:
+            return self.reason
+        if not self.history:
+            return 'not converged: no checks after {} steps'.format(self.steps)
+        stats = self.history[-1]
+        return ('not converged after {} steps: td_ema={:.4g}, residual={:.4g}, '
+                'stability={:.3f}').format(self.steps, stats['td_ema'], stats['residual'],
+                                           stats['stability'])
@@ -0,0 +1,328 @@
+"""
+Curriculum training: train on higher order rates and smaller grids first,
+then move toward the target configuration.
+
+At a low order rate most time steps have no orders, so they carry little
+learning signal, and on a large grid the robots take a long time to reach
+any order at all. A curriculum is a list of stages, each a grid shape and an
+order probability, ordered from the easiest to the target configuration of
+warehouse_parameters.py, which is always the last stage. Training stays in
+a stage until the convergence monitor stops it or the score stops changing,
+and the tables carry over from stage to stage: the stages on the same grid
+share a Session and only change Environment.order_prob, and the tables of a
+smaller grid are projected onto the next grid with transfer.transfer.
+
+The warehouse parameters are read when the modules are imported, so the
+stages of each grid run in a new process with the parameters set through
+WAREHOUSE_<name> environment variables, as in benchmark.py. The tables are
+saved in a working directory, so the saved tables of the repository are
+not changed. The score is always measured at the target order probability.
+
+compare trains with the curriculum and directly on the target
+configuration, both from new tables, and reports the wall-clock time each
+took to reach a target score, e.g.
+
+    python curriculum.py --stages 2x2@0.4,3x2@0.3 --target-score 0.9
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+from warehouse_parameters import N_ROWS, N_COLS, ORDER_PROB
+
+TABLE_DIRS = ('Q-Tables', 'Visits', 'SameLocs', 'Performance')
+
+def default_stages():
+    """
+    Returns the default curriculum, which trains the target grid at 4 times
+    and then 2 times the target order probability.
+
+    Returns
+    -------
+    [((int, int), float)]
+        The grid shape and order probability of each stage before the target
+        configuration.
+
+    """
+    return [((N_ROWS, N_COLS), min(4 * ORDER_PROB, 1.0)),
+            ((N_ROWS, N_COLS), min(2 * ORDER_PROB, 1.0))]
+
+
+def group_stages(stages):
+    """
+    Groups consecutive stages on the same grid and appends the target
+    configuration.
+
+    Parameters
+    ----------
+    stages : [((int, int), float)]
+        The grid shape and order probability of each stage.
+
+    Returns
+    -------
+    [((int, int), [float])]
+        The grid shape and the order probabilities of its stages, for each
+        grid in order.
+
+    """
+    groups = []
+    for grid, prob in list(stages) + [((N_ROWS, N_COLS), ORDER_PROB)]:
+        grid = tuple(grid)
+        if grid[0] > N_ROWS or grid[1] > N_COLS:
+            raise ValueError('stage grid ' + str(grid) + ' is larger than the target grid')
+        if groups and groups[-1][0] == grid:
+            groups[-1][1].append(prob)
+        else:
+            if groups and (grid[0] < groups[-1][0][0] or grid[1] < groups[-1][0][1]):
+                raise ValueError('stage grids must not get smaller')
+            groups.append((grid, [prob]))
+    return groups
+
+
+def run_worker(order_probs, previous_grid, final, target_score, n_reps, n_iter, eval_reps,
+               max_rounds, stable):
+    """
+    Trains the stages of 1 grid, the grid of this process.
+
+    The first stage starts from the tables of previous_grid projected onto
+    this grid, or from new tables. Each stage except the last one of the
+    target grid ends when the convergence monitor stops training or the
+    score changes by at most stable between rounds. The last stage ends when
+    the score reaches target_score. Every stage ends after max_rounds rounds.
+
+    Parameters
+    ----------
+    order_probs : [float]
+        The order probability of each stage.
+    previous_grid : (int, int) or None
+        The grid of the previous stage.
+    final : bool
+        Whether this is the target grid.
+    target_score : float
+        The score to reach.
+    n_reps : int
+        The number of training episodes per round.
+    n_iter : int
+        The number of time steps per training episode.
+    eval_reps : int
+        The largest number of evaluation episodes per round.
+    max_rounds : int
+        The largest number of rounds per stage.
+    stable : float
+        The largest change of the score between rounds of a stable stage.
+
+    Returns
+    -------
+    dict
+        The results of each stage, and the number of seconds after which the
+        target score was reached, or None.
+
+    """
+    from convergence import ConvergenceMonitor
+    from session import Session
+    from transfer import transfer
+    from warehouse_parameters import EVAL_TOLERANCE
+
+    start = time.perf_counter()
+    if previous_grid is not None:
+        # the working directory only has the tables of this curriculum
+        transfer(*previous_grid, overwrite=True)
+    session = Session(overwrite=previous_grid is None)
+    stages = []
+    reached = None
+    for i, prob in enumerate(order_probs):
+        last = final and i == len(order_probs) - 1
+        session.env.order_prob = prob
+        session.monitor = None if last else ConvergenceMonitor()
+        steps = 0
+        previous = None
+        for rounds in range(1, max_rounds + 1):
+            session.train(n_reps, n_iter)
+            steps += n_reps * n_iter
+            score = session.evaluate(eval_reps, tolerance=EVAL_TOLERANCE)
+            if last:
+                if score <= target_score:
+                    reached = time.perf_counter() - start
+                    break
+            elif session.converged or (previous is not None and abs(score - previous) <= stable):
+                break
+            previous = score
+        stages.append({'order_prob': prob, 'rounds': rounds, 'steps': steps, 'score': score,
+                       'seconds': time.perf_counter() - start})
+    session.checkpoint()
+    return {'stages': stages, 'reached': reached, 'seconds': time.perf_counter() - start}
+
+
+def run(stages, workdir, target_score, n_reps=200, n_iter=30, eval_reps=300, max_rounds=50,
+        stable=0.02, seed=0, timeout=3600):
+    """
+    Trains from new tables through a curriculum, running the stages of each
+    grid in a new process.
+
+    Parameters
+    ----------
+    stages : [((int, int), float)]
+        The grid shape and order probability of each stage before the target
+        configuration.
+    workdir : str
+        The directory the tables are saved in.
+    target_score : float
+        The score to reach.
+    n_reps : int
+        The number of training episodes per round.
+    n_iter : int
+        The number of time steps per training episode.
+    eval_reps : int
+        The largest number of evaluation episodes per round.
+    max_rounds : int
+        The largest number of rounds per stage.
+    stable : float
+        The largest change of the score between rounds of a stable stage.
+    seed : int
+        The seed of the random number generator of each process.
+    timeout : float
+        The number of seconds after which a process is abandoned.
+
+    Returns
+    -------
+    dict
+        The results of each stage, and the wall-clock seconds taken to reach
+        the target score, or None if it was not reached.
+
+    """
+    for name in TABLE_DIRS:
+        os.makedirs(os.path.join(workdir, name), exist_ok=True)
+    groups = group_stages(stages)
+    results = []
+    elapsed = 0.0
+    reached = None
+    previous_grid = None
+    for i, (grid, order_probs) in enumerate(groups):
+        env = dict(os.environ)
+        env['WAREHOUSE_N_ROWS'] = str(grid[0])
+        env['WAREHOUSE_N_COLS'] = str(grid[1])
+        config = {'order_probs': order_probs, 'previous_grid': previous_grid,
+                  'final': i == len(groups) - 1, 'target_score': target_score,
+                  'n_reps': n_reps, 'n_iter': n_iter, 'eval_reps': eval_reps,
+                  'max_rounds': max_rounds, 'stable': stable, 'seed': seed}
+        print('training ' + str(grid[0]) + 'x' + str(grid[1]) + ' at order probabilities '
+              + str(order_probs), file=sys.stderr)
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', json.dumps(config)],
+                              env=env, capture_output=True, text=True, timeout=timeout, cwd=workdir)
+        seconds = time.perf_counter() - start
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'failed')
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        for stage in result['stages']:
+            stage['grid'] = grid
+            results.append(stage)
+        if result['reached'] is not None:
+            # the time the process took to start and save the tables is
+            # counted before the target score was reached
+            reached = elapsed + seconds - (result['seconds'] - result['reached'])
+        elapsed += seconds
+        previous_grid = grid
+    return {'stages': results, 'reached': reached, 'seconds': elapsed}
+
+
+def compare(stages, target_score, workdir='Curriculum', **kwargs):
+    """
+    Trains from new tables with a curriculum and directly on the target
+    configuration, and compares the wall-clock times to reach a target score.
+
+    Parameters
+    ----------
+    stages : [((int, int), float)]
+        The grid shape and order probability of each stage before the target
+        configuration.
+    target_score : float
+        The score to reach.
+    workdir : str
+        The directory the tables are saved in.
+    **kwargs
+        The other parameters of run.
+
+    Returns
+    -------
+    dict
+        The results of the curriculum and of direct training.
+
+    """
+    return {'curriculum': run(stages, os.path.join(workdir, 'curriculum'), target_score, **kwargs),
+            'direct': run([], os.path.join(workdir, 'direct'), target_score, **kwargs)}
+
+
+def format_comparison(results):
+    """
+    Formats the results of compare as a report.
+
+    Parameters
+    ----------
+    results : dict
+        The results returned by compare.
+
+    Returns
+    -------
+    str
+        The report.
+
+    """
+    lines = []
+    for name in ('curriculum', 'direct'):
+        result = results[name]
+        lines.append(name + ':')
+        for stage in result['stages']:
+            lines.append('  {}x{} at {:.3f}: {} rounds, {} steps, score {:.4f}'.format(
+                stage['grid'][0], stage['grid'][1], stage['order_prob'], stage['rounds'],
+                stage['steps'], stage['score']))
+        if result['reached'] is None:
+            lines.append('  target score not reached in {:.1f} s'.format(result['seconds']))
+        else:
+            lines.append('  target score reached in {:.1f} s'.format(result['reached']))
+    curriculum, direct = results['curriculum']['reached'], results['direct']['reached']
+    if curriculum is not None and direct is not None:
+        lines.append('speedup: {:.2f}x'.format(direct / curriculum))
+    return '\n'.join(lines)
+
+
+def _stage_list(text):
+    stages = []
+    for stage in text.split(','):
+        grid, prob = stage.split('@')
+        stages.append((tuple(int(n) for n in grid.split('x')), float(prob)))
+    return stages
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compare curriculum training with training on the target configuration.')
+    parser.add_argument('--stages', type=_stage_list, default=None,
+                        help='stages before the target configuration, e.g. 2x2@0.4,3x2@0.2')
+    parser.add_argument('--target-score', type=float, default=1.0)
+    parser.add_argument('--n-reps', type=int, default=200, help='training episodes per round')
+    parser.add_argument('--n-iter', type=int, default=30, help='time steps per training episode')
+    parser.add_argument('--eval-reps', type=int, default=300, help='evaluation episodes per round')
+    parser.add_argument('--max-rounds', type=int, default=50, help='rounds per stage')
+    parser.add_argument('--stable', type=float, default=0.02,
+                        help='largest change of the score between rounds of a stable stage')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', default='Curriculum')
+    parser.add_argument('--worker', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        config = json.loads(args.worker)
+        random.seed(config.pop('seed'))
+        print(json.dumps(run_worker(**config)))
+        sys.exit(0)
+
+    stages = default_stages() if args.stages is None else args.stages
+    results = compare(stages, args.target_score, os.path.abspath(args.workdir),
+                      n_reps=args.n_reps, n_iter=args.n_iter, eval_reps=args.eval_reps,
+                      max_rounds=args.max_rounds, stable=args.stable, seed=args.seed)
+    print(format_comparison(results))
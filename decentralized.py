@@ -0,0 +1,334 @@
+import numpy as np
+import pandas as pd
+
+from actions import Actions
+from environment import Environment
+from util import config_name
+from warehouse_parameters import N_ROWS, N_COLS, N_ROBOTS, LEARNING_RATE, DISCOUNT_FACTOR
+
+# (row, col) offsets of the cells above, below, left and right of a robot
+NEIGHBOURS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+# the number of values each part of an observation can take
+NUM_CELL_CODES = 4
+NUM_CARRY_CODES = 3
+NUM_TARGET_CODES = 5
+NUM_PICKING_CODES = 3
+NUM_OBSERVATIONS = (NUM_CELL_CODES**len(NEIGHBOURS) * NUM_CARRY_CODES
+                    * NUM_TARGET_CODES * NUM_PICKING_CODES)
+
+class DecentralizedAgent:
+    """
+    An agent where each robot chooses its own action from a local
+    observation, for warehouses that are too large for a central agent.
+
+    The Q-table of the central Agent has 1 row per state of the whole
+    warehouse, so its size grows combinatorially with the numbers of robots
+    and stacks. Instead, each robot observes a fixed-size neighbourhood and
+    all robots share 1 Q-table with 1 row per observation and 1 column per
+    action of a single robot. The size of the table does not depend on the
+    size of the warehouse, and the time per step grows linearly with the
+    number of robots. The joint action of all robots is passed to
+    Environment.calculate_state, so collisions are resolved by the same
+    rules as for the central agent.
+
+    Each observation is made up of:
+        The contents of the 4 cells above, below, left and right of the
+        robot: empty, a stack, a robot, or outside the grid.
+        Whether the robot is under a stack, and if it is, whether the stack
+        has ordered items.
+        The direction (up, down, left or right) of the nearest stack with
+        ordered items that is within radius cells of the robot and is not at
+        the picking station, or none.
+        The direction of the picking station: at the picking station, up to
+        the top row, or left along the top row.
+
+    All robots receive the cost of the whole warehouse at each time step.
+
+    Attributes
+    ----------
+    qvals : NumPy Array
+        An array containing estimates of the q-value for each observation and
+        action of a single robot.
+    radius : int
+        How many cells away (in Manhattan distance) a robot can see stacks
+        with ordered items.
+    """
+
+    def __init__(self, radius=2):
+        """
+        Creates a DecentralizedAgent with all q-values set to 0.
+
+        Parameters
+        ----------
+        radius : int
+            How many cells away a robot can see stacks with ordered items.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.valid_actions = Actions().valid_actions
+        self.qvals = np.zeros((NUM_OBSERVATIONS, len(self.valid_actions)), dtype=np.float32)
+        self.radius = radius
+        # offsets within the radius, nearest first
+        self.offsets = sorted(((dr, dc) for dr in range(-radius, radius + 1)
+                               for dc in range(-radius, radius + 1)
+                               if 0 < abs(dr) + abs(dc) <= radius),
+                              key=lambda d: abs(d[0]) + abs(d[1]))
+        return
+
+    def observe(self, state):
+        """
+        Determines the observation of each robot.
+
+        Parameters
+        ----------
+        state : State
+            The state of the warehouse.
+
+        Returns
+        -------
+        NumPy Array
+            The observation of each robot, in the order of state.robot_locs.
+
+        """
+        robot_cells = {(loc.row, loc.col) for loc in state.robot_locs}
+        stack_orders = {(loc.row, loc.col): state.orders[i] for i, loc in enumerate(state.stack_locs)}
+
+        obs = np.empty(N_ROBOTS, dtype=np.int64)
+        for i, loc in enumerate(state.robot_locs):
+            row, col = loc.row, loc.col
+
+            code = 0
+            for dr, dc in NEIGHBOURS:
+                cell = (row + dr, col + dc)
+                if not _on_grid(*cell):
+                    cell_code = 3
+                elif cell in robot_cells:
+                    cell_code = 2
+                elif cell in stack_orders:
+                    cell_code = 1
+                else:
+                    cell_code = 0
+                code = code * NUM_CELL_CODES + cell_code
+
+            if (row, col) not in stack_orders:
+                carry = 0
+            elif stack_orders[(row, col)] == 0:
+                carry = 1
+            else:
+                carry = 2
+            code = code * NUM_CARRY_CODES + carry
+
+            target = 0
+            for dr, dc in self.offsets:
+                cell = (row + dr, col + dc)
+                if cell[1] >= 0 and stack_orders.get(cell, 0) > 0:
+                    if abs(dr) >= abs(dc):
+                        target = 1 if dr < 0 else 2
+                    else:
+                        target = 3 if dc < 0 else 4
+                    break
+            code = code * NUM_TARGET_CODES + target
+
+            if col == -1:
+                picking = 0
+            elif row > 0:
+                picking = 1
+            else:
+                picking = 2
+            obs[i] = code * NUM_PICKING_CODES + picking
+        return obs
+
+    def policy(self, obs, epsilon=0):
+        """
+        Chooses the action of each robot. Each robot acts randomly with
+        probability epsilon and otherwise takes the action with the lowest
+        q-value estimate for its observation.
+
+        Parameters
+        ----------
+        obs : NumPy Array
+            The observation of each robot.
+        epsilon : float
+            The probability that each robot acts randomly.
+
+        Returns
+        -------
+        Actions
+            The actions of all robots.
+        NumPy Array
+            The index of the action of each robot in valid_actions.
+
+        """
+        codes = self.qvals[obs].argmin(axis=1)
+        if epsilon > 0:
+            explore = np.random.random(N_ROBOTS) < epsilon
+            codes[explore] = np.random.randint(len(self.valid_actions), size=np.count_nonzero(explore))
+        a = Actions()
+        a.actions = [self.valid_actions[code] for code in codes]
+        return a, codes
+
+    def update(self, obs1, codes, c, obs2):
+        """
+        Update the shared Q-table with the transition of every robot.
+
+        Parameters
+        ----------
+        obs1 : NumPy Array
+            The observation of each robot before the time step.
+        codes : NumPy Array
+            The index of the action each robot took.
+        c : int
+            The cost recieved at that time step.
+        obs2 : NumPy Array
+            The observation of each robot after the time step, in the same
+            order as obs1.
+
+        Returns
+        -------
+        NumPy Array
+            The temporal difference error of each robot.
+
+        """
+        td_errors = c + DISCOUNT_FACTOR*self.qvals[obs2].min(axis=1) - self.qvals[obs1, codes]
+        np.add.at(self.qvals, (obs1, codes), LEARNING_RATE*td_errors)
+        return td_errors
+
+    def read_tables(self):
+        """
+        Overwrite the Q-table with a csv saved by save_tables.
+
+        Returns
+        -------
+        None.
+
+        """
+        qvals = pd.read_csv('Q-Tables/qtable_decentralized_' + config_name() + '.csv')
+        self.qvals = np.asarray(qvals, dtype=self.qvals.dtype)
+        return
+
+    def save_tables(self):
+        """
+        Save the Q-table to a csv.
+
+        Returns
+        -------
+        None.
+
+        """
+        qvals = pd.DataFrame(self.qvals)
+        qvals.to_csv('Q-Tables/qtable_decentralized_' + config_name() + '.csv', index=False)
+        return
+
+
+def _on_grid(row, col):
+    """
+    Determine if a cell is inside the warehouse grid, including the picking
+    station at (0, -1).
+
+    Returns
+    -------
+    bool
+        A boolean value indicating if the cell is inside the grid.
+
+    """
+    if row == 0:
+        return -1 <= col < N_COLS
+    return 0 < row < N_ROWS and 0 <= col < N_COLS
+
+
+def step(env, obs, epsilon=0, learn=True):
+    """
+    Simulates 1 time step with the decentralized agent.
+
+    Parameters
+    ----------
+    env : Environment
+        An environment whose agent is a DecentralizedAgent.
+    obs : NumPy Array
+        The observation of each robot in the current state.
+    epsilon : float
+        The probability that each robot acts randomly.
+    learn : bool
+        Whether to update the Q-table.
+
+    Returns
+    -------
+    NumPy Array
+        The observation of each robot in the new state.
+
+    """
+    a, codes = env.agent.policy(obs, epsilon)
+    env.state = env.calculate_state(env.state, a)
+    env.update_cost()
+    new_obs = env.agent.observe(env.state)
+    if learn:
+        # match each robot's new observation with its old one
+        obs2 = np.empty_like(new_obs)
+        obs2[env.robot_order] = new_obs
+        env.agent.update(obs, codes, sum(env.state.orders), obs2)
+    return new_obs
+
+
+def train(n_reps=1000, n_iter=30, epsilon=0.2, overwrite=False):
+    """
+    Trains the decentralized agent and saves its Q-table.
+
+    Parameters
+    ----------
+    n_reps : int
+        The number of episodes.
+    n_iter : int
+        The number of time steps per episode.
+    epsilon : float
+        The probability that each robot acts randomly.
+    overwrite : bool
+        If True, start from a new Q-table instead of the saved one.
+
+    Returns
+    -------
+    None.
+
+    """
+    env = Environment(DecentralizedAgent())
+    if not overwrite:
+        env.agent.read_tables()
+    for rep in range(n_reps):
+        env.state.reset()
+        obs = env.agent.observe(env.state)
+        for time_step in range(n_iter):
+            obs = step(env, obs, epsilon)
+    env.agent.save_tables()
+    return
+
+
+def evaluate(n_reps=100, n_iter=50):
+    """
+    Evaluates the greedy decentralized policy.
+
+    Parameters
+    ----------
+    n_reps : int
+        The number of episodes.
+    n_iter : int
+        The number of time steps per episode.
+
+    Returns
+    -------
+    float
+        The average cost per time step.
+
+    """
+    env = Environment(DecentralizedAgent())
+    env.agent.read_tables()
+    for rep in range(n_reps):
+        env.state.reset()
+        obs = env.agent.observe(env.state)
+        for time_step in range(n_iter):
+            obs = step(env, obs, learn=False)
+    score = env.cost/n_iter/n_reps
+    print('\nscore = ' + str(score))
+    return score
@@ -1,6 +1,7 @@
 import copy
 import random
 
+from actions import UP, DOWN, LEFT, RIGHT, STACK_UP, STACK_DOWN, STACK_LEFT, STACK_RIGHT
 from location import Location
 from state import State
 from agent import Agent
@@ -19,11 +20,33 @@ class Environment():
         The agent that is interacting with the environment.
     cost : int
         The total accumulated cost throughout the simulation.
+    robot_order : [int]
+        The robots are reordered after each time step, so robot_order[i] is
+        the index that the robot at index i of the new state had in the 
+        previous state.
+    stack_order : [int]
+        The stacks are reordered after each time step, so stack_order[i] is
+        the index that the stack at index i of the new state had in the 
+        previous state.
+    latency : OrderLatencyTracker or None
+        Measures how long the orders wait, if given.
+    order_prob : float
+        The probability that each stack gets a new order in a time step. It 
+        defaults to ORDER_PROB and can be changed during training, see 
+        curriculum.py.
     """
     
-    def __init__(self):
+    def __init__(self, agent=None, latency=None):
         """
         Initialize the environment by initializing the state, agent, and cost.
+        
+        Parameters
+        ----------
+        agent : optional
+            The agent that interacts with the environment. Defaults to a new
+            Agent.
+        latency : OrderLatencyTracker, optional
+            Measures how long the orders wait.
 
         Returns
         -------
@@ -31,33 +54,48 @@ class Environment():
 
         """
         self.state = State()
-        self.agent = Agent()
+        self.agent = Agent() if agent is None else agent
         self.cost = 0
+        self.robot_order = list(range(N_ROBOTS))
+        self.stack_order = list(range(N_STACKS))
+        self.latency = latency
+        self.order_prob = ORDER_PROB
+        if latency is not None:
+            latency.start_episode(self.state)
         return
     
-    def calculate_state(self, current_state, a):
+    def reset(self):
         """
-        Determines the new state if taking an action in the current state. 
+        Starts a new episode from a new random state.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.state.reset()
+        if self.latency is not None:
+            self.latency.start_episode(self.state)
+        return
+    
+    def move(self, current_state, a):
+        """
+        Determines the new robot and stack locations if taking an action in 
+        the current state. This is the deterministic part of a time step, see
+        calculate_state.
         
         For each robot, check if there stack in the same location as the 
-        robot and then make adjustments to the state based on what the action
-        is. Do not allow the robots/stacks to leave the grid.
+        robot and then make adjustments to the locations based on what the 
+        action is. Do not allow the robots/stacks to leave the grid.
         
         Check if any two robots are in the same spot or if any two robots
         passed through one another. If either of these things occurred reset 
         the robot/stack locations to the original locations.
         
-        Determine if any new items were ordered. For each stack, generate a 
-        random number and see if that number is less than the order 
-        probability. If it is, increase the orders value that stack by 1. 
-        
-        Determine if any ordered items were returned. If a stack remains in a 
-        picking station for 1 whole time step, then it is assumed that a 
-        picking station worker can collect that item and the orders value for 
-        that stack will decrease by 1. 
-        
-        Lastly, reorder the lists in the state so that the locations are in
-        ascending order.
+        Locations are never modified in place, so the new lists share the
+        Location objects of the current state instead of copying them. The
+        collision checks use dictionaries so that each time step takes time 
+        proportional to the number of robots and stacks.
 
         Parameters
         ----------
@@ -68,92 +106,137 @@ class Environment():
 
         Returns
         -------
-        State
-            The new state that the environment will enter if the given action
-            is taken.
+        robot_locs : [Location]
+            The new location of each robot, in the order of the current state.
+        stack_locs : [Location]
+            The new location of each stack, in the order of the current state.
+        returned : [bool]
+            Whether each stack stayed in a picking station for the whole time
+            step, so that an ordered item is collected from it.
 
         """
-        # determine new robot and stack locations
-        new_state = copy.deepcopy(current_state)
-        robot_locs = copy.deepcopy(current_state.robot_locs)
+        new_robot_locs = list(current_state.robot_locs)
+        new_stack_locs = list(current_state.stack_locs)
+        robot_locs = current_state.robot_locs
+        codes = a.codes()
+        stack_idxs = {loc: idx for idx, loc in enumerate(current_state.stack_locs)}
         
         for robot_idx in range(N_ROBOTS):
             row = robot_locs[robot_idx].row
             col = robot_locs[robot_idx].col
             
-            if robot_locs[robot_idx] in current_state.stack_locs:
-                stack_num = current_state.stack_locs.index(robot_locs[robot_idx])
-            else:
-                stack_num = -1
-                
-
-            if a.actions[robot_idx] == "U":
-                new_state.robot_locs[robot_idx] = Location(max(row-1, 0), col)
-            elif a.actions[robot_idx] == "SU" and stack_num != -1:
-                new_state.robot_locs[robot_idx] = Location(max(row-1, 0), col)
-                new_state.stack_locs[stack_num] = Location(max(row-1, 0), col)
-            elif a.actions[robot_idx] == "D":
+            stack_num = stack_idxs.get(robot_locs[robot_idx], -1)
+            code = codes[robot_idx]
+
+            if code == UP:
+                new_robot_locs[robot_idx] = Location(max(row-1, 0), col)
+            elif code == STACK_UP and stack_num != -1:
+                new_robot_locs[robot_idx] = Location(max(row-1, 0), col)
+                new_stack_locs[stack_num] = Location(max(row-1, 0), col)
+            elif code == DOWN:
                 if col > -1:
-                    new_state.robot_locs[robot_idx] = Location(min(row+1, N_ROWS-1), col)
-            elif a.actions[robot_idx] == "SD" and stack_num != -1:
+                    new_robot_locs[robot_idx] = Location(min(row+1, N_ROWS-1), col)
+            elif code == STACK_DOWN and stack_num != -1:
                 if col > -1:
-                    new_state.robot_locs[robot_idx] = Location(min(row+1, N_ROWS-1), col)
-                    new_state.stack_locs[stack_num] = Location(min(row+1, N_ROWS-1), col)
-            elif a.actions[robot_idx] == "L":
+                    new_robot_locs[robot_idx] = Location(min(row+1, N_ROWS-1), col)
+                    new_stack_locs[stack_num] = Location(min(row+1, N_ROWS-1), col)
+            elif code == LEFT:
                 if row == 0:
-                    new_state.robot_locs[robot_idx] = Location(row, max(col-1, -1))
+                    new_robot_locs[robot_idx] = Location(row, max(col-1, -1))
                 else:
-                    new_state.robot_locs[robot_idx] = Location(row, max(col-1, 0))
-            elif a.actions[robot_idx] == "SL" and stack_num != -1:
+                    new_robot_locs[robot_idx] = Location(row, max(col-1, 0))
+            elif code == STACK_LEFT and stack_num != -1:
                 if row == 0:
-                    new_state.robot_locs[robot_idx] = Location(row, max(col-1, -1))
-                    new_state.stack_locs[stack_num] = Location(row, max(col-1, -1))
+                    new_robot_locs[robot_idx] = Location(row, max(col-1, -1))
+                    new_stack_locs[stack_num] = Location(row, max(col-1, -1))
                 else:
-                    new_state.robot_locs[robot_idx] = Location(row, max(col-1, 0))
-                    new_state.stack_locs[stack_num] = Location(row, max(col-1, 0))
-            elif a.actions[robot_idx] == "R":
-                new_state.robot_locs[robot_idx] = Location(row, min(col+1, N_COLS-1))
-            elif a.actions[robot_idx] == "SR" and stack_num != -1:
-                new_state.robot_locs[robot_idx] = Location(row, min(col+1, N_COLS-1))
-                new_state.stack_locs[stack_num] = Location(row, min(col+1, N_COLS-1))
+                    new_robot_locs[robot_idx] = Location(row, max(col-1, 0))
+                    new_stack_locs[stack_num] = Location(row, max(col-1, 0))
+            elif code == RIGHT:
+                new_robot_locs[robot_idx] = Location(row, min(col+1, N_COLS-1))
+            elif code == STACK_RIGHT and stack_num != -1:
+                new_robot_locs[robot_idx] = Location(row, min(col+1, N_COLS-1))
+                new_stack_locs[stack_num] = Location(row, min(col+1, N_COLS-1))
         
         possible = True
         
         # check if 2 robots or stacks are in the same spot
-        if (len(set(new_state.robot_locs)) < N_ROBOTS 
-            or len(set(new_state.stack_locs)) < N_STACKS):
+        if (len(set(new_robot_locs)) < N_ROBOTS 
+            or len(set(new_stack_locs)) < N_STACKS):
             possible = False
-            new_state.robot_locs = copy.deepcopy(current_state.robot_locs)
-            new_state.stack_locs = copy.deepcopy(current_state.stack_locs)
-
-        # check if robots passed through one another
-        for i in range(N_ROBOTS):
-            if not possible:
-                break
-            else:
-                for j in range(N_ROBOTS):
-                    if (robot_locs[i] == new_state.robot_locs[j] 
-                        and new_state.robot_locs[i] == robot_locs[j] 
-                        and i != j):
-                            possible = False
-                            new_state.robot_locs = copy.deepcopy(current_state.robot_locs)
-                            new_state.stack_locs = copy.deepcopy(current_state.stack_locs)
-                            break
+
+        # check if robots passed through one another. Since no 2 robots are 
+        # in the same spot, at most 1 robot j moved into the old location of 
+        # robot i.
+        if possible:
+            new_robot_idxs = {loc: idx for idx, loc in enumerate(new_robot_locs)}
+            for i in range(N_ROBOTS):
+                j = new_robot_idxs.get(robot_locs[i])
+                if j is not None and j != i and new_robot_locs[i] == robot_locs[j]:
+                    possible = False
+                    break
+        
+        if not possible:
+            new_robot_locs = list(current_state.robot_locs)
+            new_stack_locs = list(current_state.stack_locs)
+        
+        returned = [current_state.stack_locs[i] == new_stack_locs[i] and new_stack_locs[i].col == -1
+                    for i in range(N_STACKS)]
+        return new_robot_locs, new_stack_locs, returned
+    
+    def calculate_state(self, current_state, a):
+        """
+        Determines the new state if taking an action in the current state. 
+        
+        The new robot and stack locations are determined by the move method.
+        
+        Determine if any new items were ordered. For each stack, generate a 
+        random number and see if that number is less than the order 
+        probability, order_prob. If it is, increase the orders value that 
+        stack by 1. 
+        
+        Determine if any ordered items were returned. If a stack remains in a 
+        picking station for 1 whole time step, then it is assumed that a 
+        picking station worker can collect that item and the orders value for 
+        that stack will decrease by 1. 
+        
+        Lastly, reorder the lists in the state so that the locations are in
+        ascending order. The reordering is saved in robot_order and 
+        stack_order.
+
+        Parameters
+        ----------
+        current_state : State
+            The current state of the environment.
+        a : Actions
+            The action that the agent will take.
+
+        Returns
+        -------
+        State
+            The new state that the environment will enter if the given action
+            is taken.
+
+        """
+        new_state = copy.copy(current_state)
+        new_state.robot_locs, new_state.stack_locs, returned = self.move(current_state, a)
+        new_state.orders = list(current_state.orders)
         
         # check for new orders and determine if items were returned
-        order_nums = copy.deepcopy(new_state.orders)
+        order_nums = current_state.orders
         for stack_idx in range(N_STACKS):
-            if random.random() < ORDER_PROB:
+            if random.random() < self.order_prob:
                 new_state.orders[stack_idx] = min(order_nums[stack_idx] + 1, N_ITEMS)
-            if (current_state.stack_locs[stack_idx] == new_state.stack_locs[stack_idx] 
-                and new_state.stack_locs[stack_idx].col == -1):
+            if returned[stack_idx]:
                 new_state.orders[stack_idx] = max(order_nums[stack_idx] - 1, 0)
         
         
         # reorder robots and stacks
-        new_state.orders = [order_num for _, order_num in sorted(zip(new_state.stack_locs, new_state.orders))]
-        new_state.robot_locs.sort()
-        new_state.stack_locs.sort()
+        self.robot_order = sorted(range(N_ROBOTS), key=new_state.robot_locs.__getitem__)
+        self.stack_order = sorted(range(N_STACKS), key=new_state.stack_locs.__getitem__)
+        new_state.robot_locs = [new_state.robot_locs[i] for i in self.robot_order]
+        new_state.stack_locs = [new_state.stack_locs[i] for i in self.stack_order]
+        new_state.orders = [new_state.orders[i] for i in self.stack_order]
             
         return new_state
     
@@ -163,7 +246,8 @@ class Environment():
         Updates the total accumulated cost since the start of the simulation.
         
         The cost is increased by the number of items that have not been 
-        returned.
+        returned. This is called once per simulated time step, so it also 
+        records the orders of the new state in the latency tracker.
 
         Returns
         -------
@@ -171,6 +255,8 @@ class Environment():
 
         """
         self.cost += sum(self.state.orders)
+        if self.latency is not None:
+            self.latency.step(self.state.orders, self.stack_order)
         return
     
         
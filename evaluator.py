@@ -0,0 +1,315 @@
+import random
+from statistics import NormalDist
+
+from environment import Environment
+from latency import OrderLatencyTracker
+
+class RunningStats:
+    """
+    The mean and variance of a stream of values, updated 1 value at a time
+    with Welford's algorithm.
+
+    Attributes
+    ----------
+    n : int
+        The number of values.
+    mean : float
+        The mean of the values.
+    """
+
+    def __init__(self):
+        """
+        Creates a RunningStats object with no values.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        return
+
+    def push(self, x):
+        """
+        Adds a value.
+
+        Parameters
+        ----------
+        x : float
+            The value.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (x - self.mean)
+        return
+
+    @property
+    def variance(self):
+        """
+        The sample variance of the values.
+        """
+        return self._m2 / (self.n - 1) if self.n > 1 else float('inf')
+
+    def half_width(self, confidence=0.95):
+        """
+        Returns the half-width of the normal confidence interval of the mean.
+
+        Parameters
+        ----------
+        confidence : float
+            The confidence level of the interval.
+
+        Returns
+        -------
+        float
+            The half-width of the interval.
+
+        """
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        return z * (self.variance / self.n) ** 0.5 if self.n > 1 else float('inf')
+
+
+class SequentialEvaluator:
+    """
+    Decides when enough episodes have been simulated to know the score of a
+    policy, which is the average cost per time step.
+
+    The cost per time step of each episode is added 1 at a time. The
+    evaluation is done once the half-width of the confidence interval of the
+    score is at most tolerance, after at least min_episodes episodes so that
+    the variance estimate is reliable, or after max_episodes episodes. With
+    no tolerance, it is done after max_episodes episodes.
+
+    Attributes
+    ----------
+    tolerance : float or None
+        The largest half-width of the confidence interval.
+    confidence : float
+        The confidence level of the interval.
+    min_episodes : int
+        The smallest number of episodes.
+    max_episodes : int
+        The largest number of episodes.
+    stats : RunningStats
+        The statistics of the episode scores.
+    """
+
+    def __init__(self, tolerance=0.01, confidence=0.95, min_episodes=30, max_episodes=1000):
+        """
+        Creates a SequentialEvaluator with no episodes.
+
+        Parameters
+        ----------
+        tolerance : float or None
+            The largest half-width of the confidence interval.
+        confidence : float
+            The confidence level of the interval.
+        min_episodes : int
+            The smallest number of episodes.
+        max_episodes : int
+            The largest number of episodes.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.tolerance = tolerance
+        self.confidence = confidence
+        self.min_episodes = min_episodes
+        self.max_episodes = max_episodes
+        self.stats = RunningStats()
+        return
+
+    def add(self, score):
+        """
+        Adds the score of an episode.
+
+        Parameters
+        ----------
+        score : float
+            The average cost per time step of the episode.
+
+        Returns
+        -------
+        bool
+            A boolean value indicating if the evaluation is done.
+
+        """
+        self.stats.push(score)
+        return self.done
+
+    @property
+    def done(self):
+        """
+        Whether the evaluation is done.
+        """
+        n = self.stats.n
+        if n >= self.max_episodes:
+            return True
+        if self.tolerance is None or n < self.min_episodes:
+            return False
+        return self.stats.half_width(self.confidence) <= self.tolerance
+
+    def result(self):
+        """
+        Returns the score and how it was estimated.
+
+        Returns
+        -------
+        dict
+            The score, the half-width of its confidence interval, and the
+            number of episodes used.
+
+        """
+        return {'score': self.stats.mean,
+                'half_width': self.stats.half_width(self.confidence),
+                'episodes': self.stats.n}
+
+
+def episode_score(env, policy, n_iter):
+    """
+    Simulates an episode from a new random state.
+
+    Parameters
+    ----------
+    env : Environment
+        The environment to simulate.
+    policy : function
+        Returns the actions to take in a state.
+    n_iter : int
+        The number of time steps.
+
+    Returns
+    -------
+    float
+        The average cost per time step of the episode.
+
+    """
+    env.reset()
+    cost = env.cost
+    for time_step in range(n_iter):
+        env.state = env.calculate_state(env.state, policy(env.state))
+        env.update_cost()
+    return (env.cost - cost) / n_iter
+
+
+def evaluate(policy, n_iter=50, tolerance=0.01, confidence=0.95, min_episodes=30,
+             max_episodes=1000, agent=None, latency=False):
+    """
+    Evaluates a policy with as many episodes as are needed to estimate its
+    score within tolerance.
+
+    Parameters
+    ----------
+    policy : function
+        Returns the actions to take in a state, e.g. Agent.greedy_policy.
+    n_iter : int
+        The number of time steps per episode.
+    tolerance : float
+        The largest half-width of the confidence interval of the score.
+    confidence : float
+        The confidence level of the interval.
+    min_episodes : int
+        The smallest number of episodes.
+    max_episodes : int
+        The largest number of episodes.
+    agent : optional
+        The agent of the environment. Policies that are not methods of an
+        Agent do not need one, so no tables are created by default.
+    latency : bool
+        If True, also measure how long the orders wait, see 
+        OrderLatencyTracker.
+
+    Returns
+    -------
+    dict
+        The score, the half-width of its confidence interval, and the number
+        of episodes used, and the summary of the waits if latency is True.
+
+    """
+    tracker = OrderLatencyTracker() if latency else None
+    env = Environment(agent if agent is not None else object(), tracker)
+    evaluator = SequentialEvaluator(tolerance, confidence, min_episodes, max_episodes)
+    while not evaluator.add(episode_score(env, policy, n_iter)):
+        pass
+    result = evaluator.result()
+    if tracker is not None:
+        result['latency'] = tracker.summary()
+    return result
+
+
+def compare(policy_a, policy_b, n_iter=50, tolerance=0.02, confidence=0.99, min_episodes=30,
+            max_episodes=2000, seed=0):
+    """
+    Decides whether one policy has a lower score than another with a
+    sequential paired test.
+
+    Both policies are simulated from the same initial states and with the
+    same orders, by seeding the random number generator the same way for
+    each pair of episodes, so the variance of the difference of their scores
+    is smaller than the variance of each score. After each pair, the
+    confidence interval of the mean difference is computed. The test stops
+    when the interval does not contain 0, so one policy is better, or when
+    its half-width is at most tolerance, so any difference is smaller than
+    tolerance, or after max_episodes pairs. The confidence is higher than
+    for a single evaluation, since the interval is checked after every pair.
+
+    Parameters
+    ----------
+    policy_a : function
+        Returns the actions to take in a state.
+    policy_b : function
+        Returns the actions to take in a state.
+    n_iter : int
+        The number of time steps per episode.
+    tolerance : float
+        The smallest difference of scores that matters.
+    confidence : float
+        The confidence level of the interval.
+    min_episodes : int
+        The smallest number of pairs of episodes.
+    max_episodes : int
+        The largest number of pairs of episodes.
+    seed : int
+        The seed of the first pair of episodes.
+
+    Returns
+    -------
+    dict
+        'a', 'b' or None for the policy with the lower score, the mean
+        difference of the scores of a and b, the half-width of its confidence
+        interval, and the number of pairs of episodes used.
+
+    """
+    env = Environment(object())
+    stats = RunningStats()
+    state = random.getstate()
+    winner = None
+    for episode in range(max_episodes):
+        random.seed(seed + episode)
+        score_a = episode_score(env, policy_a, n_iter)
+        random.seed(seed + episode)
+        score_b = episode_score(env, policy_b, n_iter)
+        stats.push(score_a - score_b)
+        if stats.n < min_episodes:
+            continue
+        half_width = stats.half_width(confidence)
+        if abs(stats.mean) > half_width:
+            winner = 'a' if stats.mean < 0 else 'b'
+            break
+        if half_width <= tolerance:
+            break
+    random.setstate(state)
+    return {'better': winner,
+            'difference': stats.mean,
+            'half_width': stats.half_width(confidence),
+            'episodes': stats.n}
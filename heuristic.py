@@ -0,0 +1,264 @@
+import itertools
+import random
+
+import numpy as np
+
+from util import nCr, unrank_combination
+from warehouse_parameters import N_ROWS, N_COLS, N_ROBOTS, N_STACKS, N_ITEMS, DISCOUNT_FACTOR
+
+# the largest number of robot or stack combinations that are stored in
+# arrays. Larger numbers of combinations are unranked one state at a time.
+MAX_COMBINATIONS = 1000000
+
+def grid_distances():
+    """
+    Computes the length of the shortest path between every pair of valid
+    locations, following the moves allowed by Environment.calculate_state.
+
+    The breadth first searches from all locations are done at the same time
+    with boolean arrays: row i of the frontier holds the locations at the
+    current distance from location i, and the next frontier is every
+    neighbour of the frontier that has not been reached yet.
+
+    Returns
+    -------
+    NumPy Array
+        The distances, indexed by the positions of the locations in
+        State.valid_locations, i.e. Location.idx() + 1.
+
+    """
+    n_locs = N_ROWS * N_COLS + 1
+    idxs = np.arange(-1, n_locs - 1)
+    rows = np.where(idxs == -1, 0, idxs // N_COLS)
+    cols = np.where(idxs == -1, -1, idxs % N_COLS)
+
+    # the neighbours of each location, where n_locs means no neighbour
+    neighbours = np.full((n_locs, 4), n_locs)
+    for k, (dr, dc) in enumerate(((-1, 0), (1, 0), (0, -1), (0, 1))):
+        r = rows + dr
+        c = cols + dc
+        valid = (r >= 0) & (r < N_ROWS) & (c < N_COLS) & ((c >= 0) | ((r == 0) & (c == -1)))
+        neighbours[valid, k] = np.where(c[valid] == -1, 0, r[valid] * N_COLS + c[valid] + 1)
+
+    dist = np.full((n_locs, n_locs), -1, dtype=np.int32)
+    frontier = np.zeros((n_locs, n_locs + 1), dtype=bool)
+    frontier[idxs + 1, idxs + 1] = True
+    reached = frontier[:, :-1].copy()
+    d = 0
+    while frontier.any():
+        dist[frontier[:, :-1]] = d
+        d += 1
+        frontier[:, :-1] = frontier[:, neighbours].any(axis=2) & ~reached
+        reached |= frontier[:, :-1]
+    return dist
+
+class DistanceHeuristic:
+    """
+    A lower bound on the discounted cost-to-go of each state, used to
+    initialize the q-values.
+
+    Ignoring the items that will be ordered in the future, an ordered item
+    on a stack is only collected once a robot has moved to the stack, carried
+    it to the picking station at (0, -1), and left it there for 1 time step.
+    If the nearest robot is d1 moves from a stack with o ordered items and
+    the stack is d2 moves from the picking station, the cost is at least o
+    for each of the next m = d1 + d2 time steps and then decreases by 1 per
+    time step, where m = 0 for a stack that is already at the picking
+    station. The discounted sum of these costs is a lower bound for each
+    stack, and the lower bound of the state is the sum over the stacks, since
+    the robots may work on the stacks at the same time.
+
+    Attributes
+    ----------
+    dist : NumPy Array
+        The distances between the valid locations, see grid_distances.
+    bounds : NumPy Array
+        The lower bound of a single stack, indexed by m and o.
+    """
+
+    def __init__(self, discount=DISCOUNT_FACTOR):
+        """
+        Computes the distances and the lower bound of a single stack for
+        every number of moves and ordered items.
+
+        Parameters
+        ----------
+        discount : float
+            The discount factor of the costs.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.dist = grid_distances()
+        self.n_locs = len(self.dist)
+        max_moves = 2 * int(self.dist.max())
+        m = np.arange(max_moves + 1)[:, None]
+        o = np.arange(N_ITEMS + 1)[None, :]
+        j = np.arange(N_ITEMS)
+        collected = np.array([(discount**j[:k] * (k - 1 - j[:k])).sum() for k in range(N_ITEMS + 1)])
+        self.bounds = o * (1 - discount**m) / (1 - discount) + discount**m * collected[None, :]
+
+        self.possible_orders = (N_ITEMS+1)**N_STACKS
+        self.possible_stacks = nCr(self.n_locs, N_STACKS)
+        self.order_digits = np.array(list(itertools.product(range(N_ITEMS + 1), repeat=N_STACKS)),
+                                     dtype=np.int64).reshape(-1, N_STACKS)
+        self.robot_combinations = self._combinations(N_ROBOTS)
+        self.stack_combinations = self._combinations(N_STACKS)
+        return
+
+    def _combinations(self, k):
+        """
+        Returns the positions of every combination of k locations in the
+        order of State.enum, or None if there are more than MAX_COMBINATIONS.
+
+        Returns
+        -------
+        NumPy Array or None
+            The positions of each combination.
+
+        """
+        if nCr(self.n_locs, k) > MAX_COMBINATIONS:
+            return None
+        return np.array(list(itertools.combinations(range(self.n_locs), k)),
+                        dtype=np.int64).reshape(-1, k)
+
+    def _positions(self, combinations, ranks, k):
+        """
+        Returns the positions of the combinations of k locations with the
+        given ranks.
+
+        Returns
+        -------
+        NumPy Array
+            The positions of each combination.
+
+        """
+        if combinations is not None:
+            return combinations[ranks]
+        return np.array([unrank_combination(int(rank), self.n_locs, k) for rank in ranks],
+                        dtype=np.int64).reshape(-1, k)
+
+    def lower_bounds(self, snums):
+        """
+        Computes the lower bound of the cost-to-go of each state.
+
+        Parameters
+        ----------
+        snums : NumPy Array
+            The enumerations of the states.
+
+        Returns
+        -------
+        NumPy Array
+            The lower bound of each state.
+
+        """
+        snums = np.asarray(snums, dtype=np.int64)
+        possible_stacks_orders = self.possible_stacks * self.possible_orders
+        robots = self._positions(self.robot_combinations, snums // possible_stacks_orders, N_ROBOTS)
+        stacks = self._positions(self.stack_combinations,
+                                 snums % possible_stacks_orders // self.possible_orders, N_STACKS)
+        orders = self.order_digits[snums % self.possible_orders]
+
+        to_robot = self.dist[robots[:, :, None], stacks[:, None, :]].min(axis=1)
+        to_picking = self.dist[stacks, 0]
+        moves = np.where(stacks == 0, 0, to_robot + to_picking)
+        return self.bounds[moves, orders].sum(axis=1)
+
+    def rows(self, snums, num_actions, dtype):
+        """
+        Returns the initial rows of q-values of states. Each q-value of a
+        state is set to the lower bound of the state.
+
+        Parameters
+        ----------
+        snums : NumPy Array
+            The enumerations of the states.
+        num_actions : int
+            The number of actions.
+        dtype : NumPy dtype
+            The type of the q-values.
+
+        Returns
+        -------
+        NumPy Array
+            An array with 1 row per state and 1 column per action.
+
+        """
+        bounds = self.lower_bounds(snums).astype(dtype)
+        return np.repeat(bounds[:, None], num_actions, axis=1)
+
+
+def steps_to_score(qvals_init, target, eval_every=5000, max_steps=500000, n_reps=200, n_iter=50,
+                   seed=0, td_method='one_step'):
+    """
+    Trains new tables with Session.train and evaluates the greedy policy every
+    eval_every time steps until its score is at most the target score.
+
+    Parameters
+    ----------
+    qvals_init : str
+        How the q-values are initialized, see Tables.
+    target : float
+        The score to reach.
+    eval_every : int
+        The number of training time steps between evaluations.
+    max_steps : int
+        The largest number of training time steps.
+    n_reps : int
+        The number of episodes of each evaluation.
+    n_iter : int
+        The number of time steps per episode.
+    seed : int
+        The seed of the random number generator.
+    td_method : str
+        How the q-values are updated, see traces.METHODS.
+
+    Returns
+    -------
+    int or None
+        The number of training time steps before the target score was
+        reached, or None if it was not reached in max_steps time steps.
+
+    """
+    from session import Session
+    from tables import Tables
+
+    random.seed(seed)
+    session = Session(overwrite=True, tables=Tables(qvals_init=qvals_init), td_method=td_method)
+    steps = 0
+    while steps < max_steps:
+        session.train(eval_every // n_iter, n_iter)
+        steps += eval_every // n_iter * n_iter
+        if session.evaluate(n_reps, n_iter) <= target:
+            return steps
+    return None
+
+def compare(target, **kwargs):
+    """
+    Reports how many fewer training time steps are needed to reach a score
+    when the q-values are initialized with the distance heuristic instead of
+    a constant.
+
+    Parameters
+    ----------
+    target : float
+        The score to reach.
+    **kwargs
+        Passed to steps_to_score.
+
+    Returns
+    -------
+    dict
+        The number of time steps needed with each initialization.
+
+    """
+    result = {init: steps_to_score(init, target, **kwargs) for init in ('constant', 'distance')}
+    print('time steps to reach a score of ' + str(target) + ':')
+    for init, steps in result.items():
+        print('    ' + init + ': ' + (str(steps) if steps is not None else 'not reached'))
+    if result['constant'] is not None and result['distance'] is not None:
+        print('    saved: ' + str(result['constant'] - result['distance']))
+    return result
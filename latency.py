@@ -0,0 +1,249 @@
+import math
+from collections import deque
+
+import numpy as np
+
+class QuantileSketch:
+    """
+    A streaming estimate of the quantiles of non-negative values in bounded
+    memory.
+
+    The values are counted in logarithmically spaced bins, as in DDSketch:
+    value x > 0 is counted in bin ceil(log(x) / log(gamma)), where
+    gamma = (1 + relative_accuracy) / (1 - relative_accuracy), and the value
+    reported for a bin is within relative_accuracy of every value in it. So
+    every quantile is estimated within relative_accuracy of the true value.
+    If there are more than max_bins bins, the lowest bins are merged, which
+    only affects the accuracy of the lowest quantiles. The count, sum and
+    maximum are exact.
+
+    Attributes
+    ----------
+    relative_accuracy : float
+        The largest relative error of the quantiles.
+    max_bins : int
+        The largest number of bins.
+    count : int
+        The number of values.
+    total : float
+        The sum of the values.
+    max : float
+        The largest value.
+    """
+
+    def __init__(self, relative_accuracy=0.01, max_bins=2048):
+        """
+        Creates an empty QuantileSketch.
+
+        Parameters
+        ----------
+        relative_accuracy : float
+            The largest relative error of the quantiles.
+        max_bins : int
+            The largest number of bins.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self._bins = {}
+        self._zeros = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        return
+
+    def add(self, x):
+        """
+        Adds a value.
+
+        Parameters
+        ----------
+        x : float
+            A non-negative value.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.count += 1
+        self.total += x
+        if x > self.max:
+            self.max = x
+        if x <= 0:
+            self._zeros += 1
+            return
+        key = math.ceil(math.log(x) / self._log_gamma)
+        self._bins[key] = self._bins.get(key, 0) + 1
+        if len(self._bins) > self.max_bins:
+            keys = sorted(self._bins)
+            self._bins[keys[1]] += self._bins.pop(keys[0])
+        return
+
+    def quantile(self, q):
+        """
+        Returns an estimate of a quantile.
+
+        Parameters
+        ----------
+        q : float
+            The quantile, between 0 and 1.
+
+        Returns
+        -------
+        float or None
+            The estimate, or None if there are no values.
+
+        """
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self._zeros
+        if rank < seen:
+            return 0.0
+        for key in sorted(self._bins):
+            seen += self._bins[key]
+            if rank < seen:
+                return min(2 * self.gamma**key / (self.gamma + 1), self.max)
+        return self.max
+
+
+class OrderLatencyTracker:
+    """
+    Measures how long each ordered item waits until it is collected at the
+    picking station.
+
+    Each time step, the orders of every stack are compared with its orders
+    at the previous time step, following the stacks through the reordering
+    in Environment.stack_order. An increase is the arrival of an order, which
+    is added to the queue of the stack with the current time, and a decrease
+    is the fulfillment of the oldest order of the stack, whose wait is added
+    to the sketch and the histogram. The orders that are still waiting at
+    the end of an episode are counted as unfinished.
+
+    Attributes
+    ----------
+    sketch : QuantileSketch
+        The waits of the fulfilled orders.
+    histogram : NumPy Array
+        The number of fulfilled orders that waited each number of time steps,
+        where the last bin counts every wait of at least len(histogram) - 1.
+    arrivals : int
+        The number of orders.
+    unfinished : int
+        The number of orders that were not fulfilled by the end of their
+        episode.
+    time : int
+        The number of time steps in the current episode.
+    """
+
+    def __init__(self, max_wait=200, relative_accuracy=0.01):
+        """
+        Creates an OrderLatencyTracker with no orders.
+
+        Parameters
+        ----------
+        max_wait : int
+            The largest wait with its own bin in the histogram.
+        relative_accuracy : float
+            The largest relative error of the quantiles.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.sketch = QuantileSketch(relative_accuracy)
+        self.histogram = np.zeros(max_wait + 2, dtype=np.int64)
+        self.arrivals = 0
+        self.unfinished = 0
+        self.time = 0
+        self._orders = None
+        self._queues = None
+        return
+
+    def start_episode(self, state):
+        """
+        Starts a new episode. The orders of the state are treated as arriving
+        now.
+
+        Parameters
+        ----------
+        state : State
+            The first state of the episode.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self._queues is not None:
+            self.unfinished += sum(len(queue) for queue in self._queues)
+        self.time = 0
+        self._orders = list(state.orders)
+        self._queues = [deque([0] * n) for n in state.orders]
+        self.arrivals += sum(state.orders)
+        return
+
+    def step(self, orders, stack_order):
+        """
+        Records the orders after a time step.
+
+        Parameters
+        ----------
+        orders : [int]
+            The orders of the new state.
+        stack_order : [int]
+            The index of each stack in the previous state, see
+            Environment.stack_order.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.time += 1
+        queues = [self._queues[i] for i in stack_order]
+        previous = self._orders
+        for j, n in enumerate(orders):
+            old = previous[stack_order[j]]
+            if n > old:
+                queues[j].extend([self.time] * (n - old))
+                self.arrivals += n - old
+            elif n < old:
+                for k in range(old - n):
+                    wait = self.time - queues[j].popleft()
+                    self.sketch.add(wait)
+                    self.histogram[min(wait, len(self.histogram) - 1)] += 1
+        self._queues = queues
+        self._orders = list(orders)
+        return
+
+    def summary(self):
+        """
+        Returns the statistics of the waits.
+
+        Returns
+        -------
+        dict
+            The number of orders that arrived, were fulfilled, and were not
+            fulfilled by the end of their episode, and the mean, p50, p95, p99
+            and max of the waits of the fulfilled orders in time steps.
+
+        """
+        sketch = self.sketch
+        waiting = sum(len(queue) for queue in self._queues) if self._queues is not None else 0
+        return {'arrivals': self.arrivals,
+                'fulfilled': sketch.count,
+                'unfinished': self.unfinished + waiting,
+                'mean': sketch.total / sketch.count if sketch.count else None,
+                'p50': sketch.quantile(0.5),
+                'p95': sketch.quantile(0.95),
+                'p99': sketch.quantile(0.99),
+                'max': sketch.max if sketch.count else None}
@@ -1,5 +1,3 @@
-import math
-
 from warehouse_parameters import N_COLS
 
 class Location:
@@ -26,18 +24,35 @@ class Location:
     |/////|  6  |  7  |
     -------------------
     
+    Each cell has a single Location object, which is created the first time 
+    it is used and returned by every later Location(row, col). A Location 
+    cannot be modified, so the lists of locations of different states can 
+    share them. The rank of a Location is its number in the display above, 
+    with the picking station at (0, -1) numbered 0, and is used to order, 
+    compare and hash Locations with integer operations. The rank is only 
+    meaningful for the cells in the grid and the picking station.
+    
     Attributes
     ----------
     row : int
         The row of the cell that the robot or stack is located in.
     col : int
         The column of the cell that the robot or stack is located in.
+    rank : int
+        The position of the cell in the order of the Locations, which is also
+        its position in State.valid_locations.
     
     """
     
-    def __init__(self, row, col):
+    __slots__ = ('row', 'col', 'rank')
+    
+    # the Location of each (row, col)
+    _cells = {}
+    
+    def __new__(cls, row, col):
         """
-        Creates a new Location object given a set of coordinates.
+        Returns the Location object of a set of coordinates, creating it if 
+        it does not exist yet.
 
         Parameters
         ----------
@@ -48,17 +63,36 @@ class Location:
 
         Returns
         -------
-        None.
+        Location
+            The Location object of the cell.
 
         """
-        self.row = row
-        self.col = col
-        return
+        loc = cls._cells.get((row, col))
+        if loc is None:
+            loc = object.__new__(cls)
+            object.__setattr__(loc, 'row', row)
+            object.__setattr__(loc, 'col', col)
+            object.__setattr__(loc, 'rank', row * N_COLS + col + 1)
+            cls._cells[(row, col)] = loc
+        return loc
+    
+    def __setattr__(self, name, value):
+        raise AttributeError('Location objects cannot be modified')
+    
+    def __copy__(self):
+        return self
+    
+    def __deepcopy__(self, memo):
+        return self
+    
+    def __reduce__(self):
+        # unpickled Locations are the Location objects of their cells
+        return (Location, (self.row, self.col))
     
     @staticmethod
     def idx_to_loc(idx):
         """
-        Creates a new Location object given an index.
+        Returns the Location object of an index.
 
         Parameters
         ----------
@@ -74,7 +108,7 @@ class Location:
         if idx == -1:
             return Location(0, -1)
         else:
-            return Location(math.floor(idx / N_COLS), idx % N_COLS)
+            return Location(idx // N_COLS, idx % N_COLS)
     
     def idx(self):
         """
@@ -86,7 +120,7 @@ class Location:
             The index of a Location object.
 
         """
-        return self.row * N_COLS + self.col
+        return self.rank - 1
     
     def __eq__(self, other):
         """
@@ -104,7 +138,7 @@ class Location:
             A boolean value indicating if the locations are equal.
 
         """
-        return self.row == other.row and self.col == other.col
+        return self.rank == other.rank
     
     def __lt__(self, other):
         """
@@ -123,12 +157,7 @@ class Location:
             other location.
 
         """
-        if self.row < other.row:
-            return True
-        elif self.row == other.row:
-            return self.col < other.col
-        else:
-            return False
+        return self.rank < other.rank
     
     def __le__(self, other):
         """
@@ -147,12 +176,7 @@ class Location:
             other location or if the locations are equal.
 
         """
-        if self.row < other.row:
-            return True
-        elif self.row == other.row:
-            return self.col <= other.col
-        else:
-            return False
+        return self.rank <= other.rank
     
     def __gt__(self, other):
         """
@@ -171,12 +195,7 @@ class Location:
             other location.
 
         """
-        if self.row > other.row:
-            return True
-        elif self.row == other.row:
-            return self.col > other.col
-        else:
-            return False
+        return self.rank > other.rank
     
     def __ge__(self, other):
         """
@@ -195,12 +214,7 @@ class Location:
             other location or if the locations are equal.
 
         """
-        if self.row > other.row:
-            return True
-        elif self.row == other.row:
-            return self.col >= other.col
-        else:
-            return False
+        return self.rank >= other.rank
     
     def __ne__(self, other):
         """
@@ -218,7 +232,7 @@ class Location:
             A boolean value indicating if the locations are not equal.
         
         """
-        return self.row != other.row or self.col != other.col
+        return self.rank != other.rank
     
     def __hash__(self):
         """
@@ -231,7 +245,7 @@ class Location:
             A hash value for the Location object.
 
         """
-        return hash((self.row, self.col))
+        return self.rank
     
     def __repr__(self):
         """
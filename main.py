@@ -1,4 +1,10 @@
+from convergence import ConvergenceMonitor
 from environment import Environment
+from metrics import TrainingMetrics
+from profiler import Profiler, format_report
+from session import Session
+from shadow import ShadowEvaluator
+from warehouse_parameters import PROFILE, SHADOW_EVAL, METRICS
 
 
 """
@@ -32,63 +38,15 @@ states (e.g. if a robot is in the top row of the grid, they may not move up).
 """
 
 
-def train(n_reps=1000, n_iter=30, overwrite=False):
-    env = Environment()
-    if not overwrite:
-        env.agent.tables.read_tables()
-        
-    for rep in range(n_reps):
-        env.state.reset()
-        for time_step in range(n_iter):
-            a = env.agent.min_visits_policy(env.state)
-            previous_state = env.state
-            env.state = env.calculate_state(env.state, a)
-            env.update_cost()
-            env.agent.tables.update(previous_state, env.state, a, sum(env.state.orders))
-    score = evaluate(1000, 50, train=True)
-    env.agent.tables.performance_update(n_reps*n_iter + 50000, score)
-    env.agent.tables.save_tables()
-    
-    return
-
-def evaluate(n_reps=1000, n_iter=50, show=29, train=True):
-    env = Environment()
-    env.agent.tables.read_tables()
-    
-    for time_step in range(show):
-        print('\n')
-        print("t = " + str(time_step))
-        print(env)
-        a = env.agent.greedy_policy(env.state)
-        print("actions = " + str(a.actions))
-        print('state = ' + str(env.state.enum()) + ', action = ' + str(a.enum()))
-        if train:
-            previous_state = env.state
-            env.state = env.calculate_state(env.state, a)
-            env.update_cost()
-            env.agent.tables.update(previous_state, env.state, a, sum(env.state.orders))
-        else:
-            env.state = env.calculate_state(env.state, a)
-            env.update_cost()
-    
-    env.cost = 0
-    for rep in range(n_reps):
-        env.state.reset()
-        for time_step in range(n_iter):
-            a = env.agent.greedy_policy(env.state)
-            if train:
-                previous_state = env.state
-                env.state = env.calculate_state(env.state, a)
-                env.update_cost()
-                env.agent.tables.update(previous_state, env.state, a, sum(env.state.orders))
-            else:
-                env.state = env.calculate_state(env.state, a)
-                env.update_cost()
+def train(n_reps=1000, n_iter=30, overwrite=False, metrics=None, monitor=None, recorder=None):
+    session = Session(overwrite, metrics, monitor, recorder)
+    return session.round(n_reps, n_iter)
 
+def evaluate(n_reps=1000, n_iter=50, show=29, train=True, recorder=None, latency=True):
+    session = Session(recorder=recorder)
+    score = session.evaluate(n_reps, n_iter, show, learn=train, latency=latency)
     if train:
-        env.agent.tables.save_tables()
-    score = env.cost/n_iter/n_reps
-    print('\nscore = ' + str(score))
+        session.checkpoint()
     return score
 
 
@@ -116,11 +74,32 @@ def baseline(n_iter=100, show=10):
     print('\nscore = ' + str(env.cost/n_iter))
     return
 
-# train(overwrite=True)
-for i in range(10):
-    print('\n', i)
-    train()
-    
-# evaluate(train=True)
+if __name__ == '__main__':
+    profiler = Profiler()
+    if PROFILE:
+        profiler.enable()
+        
+    # train(overwrite=True)
+    metrics = TrainingMetrics() if METRICS else None
+    monitor = ConvergenceMonitor()
+    shadow = ShadowEvaluator() if SHADOW_EVAL else None
+    session = Session(metrics=metrics, monitor=monitor, shadow=shadow)
+    for i in range(10):
+        print('\n', i)
+        if session.round():
+            print(monitor.reason)
+            break
+    if SHADOW_EVAL:
+        shadow.close(session.tables)
+    session.checkpoint()
+    if METRICS:
+        metrics.close()
     
-# baseline()
+    if PROFILE:
+        profiler.disable()
+        print(format_report(profiler.report()))
+        profiler.dump()
+        
+    # evaluate(train=True)
+        
+    # baseline()
@@ -0,0 +1,430 @@
+import os
+import resource
+import tempfile
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from util import nCr
+from warehouse_parameters import N_ROWS, N_COLS, N_ROBOTS, N_STACKS, N_ITEMS
+
+class MemmapTable:
+    """
+    A table with 1 row per state that is stored in a memory mapped file on
+    disk so that it can be larger than the available memory.
+
+    Every table has its own temporary file, which is deleted by close, so
+    tables never share a file. save and load are the only way to keep a table.
+
+    The rows that have been used most recently are kept in an in memory cache
+    of cache_rows rows. A row is read from the file the first time it is used
+    and, if it has been changed, is written back to the file when it is
+    evicted from the cache or when flush is called, so reading rows never
+    writes to the file. Indexing works the same way as a SparseTable, except
+    that table[s] returns a read-only row: rows are changed with table[s] =
+    row or table[s, a] = value, which mark the row as changed.
+
+    The order of the rows in the file determines how many pages are touched
+    while training. With row_order 'robots' the rows are in the order of
+    State.enum, which groups states by the locations of the robots. With
+    row_order 'stacks' the rows are grouped by the locations of the stacks
+    and the orders instead, so that states that only differ by the locations
+    of the robots are next to each other.
+
+    Attributes
+    ----------
+    path : str
+        The temporary file the table is stored in.
+    shape : (int, int)
+        The number of states and the length of each row.
+    dtype : NumPy dtype
+        The type of the values in the table.
+    row_order : str
+        The order of the rows in the file, either 'robots' or 'stacks'.
+    cache_rows : int
+        The largest number of rows that are kept in memory.
+    hits : int
+        The number of times a row was found in the cache.
+    misses : int
+        The number of times a row had to be read from the file.
+    evictions : int
+        The number of rows that have been evicted from the cache.
+    writes : int
+        The number of changed rows that have been written back to the file.
+    """
+
+    def __init__(self, directory, num_states, fill, row_order='robots', cache_rows=4096,
+                 chunk_rows=65536, init=None, prefix='table_'):
+        """
+        Creates a temporary file for the table and initializes each row to the
+        fill row, or to the rows returned by init if it is given.
+
+        Parameters
+        ----------
+        directory : str
+            The directory of the temporary file. It is created if it does not
+            exist.
+        num_states : int
+            The number of states.
+        fill : NumPy Array
+            The row that each row is initialized to. The dtype of the table is
+            the dtype of this row.
+        row_order : str
+            The order of the rows in the file, either 'robots' or 'stacks'.
+        cache_rows : int
+            The largest number of rows that are kept in memory.
+        chunk_rows : int
+            The number of rows that are written at a time when the file is
+            initialized or copied.
+        init : function or None
+            A function that is given an array of state enumerations and 
+            returns their initial rows. It is called for chunk_rows states at
+            a time.
+        prefix : str
+            The start of the name of the temporary file.
+
+        Returns
+        -------
+        None.
+
+        """
+        if row_order not in ('robots', 'stacks'):
+            raise ValueError('Unknown row order: ' + str(row_order))
+
+        fill = np.asarray(fill)
+        self.shape = (num_states, len(fill))
+        self.dtype = fill.dtype
+        self.row_order = row_order
+        self.cache_rows = cache_rows
+        self.chunk_rows = chunk_rows
+
+        self._possible_orders = (N_ITEMS+1)**N_STACKS
+        self._possible_stacks_orders = nCr(N_ROWS*N_COLS+1, N_STACKS) * self._possible_orders
+        self._possible_robots = nCr(N_ROWS*N_COLS+1, N_ROBOTS)
+
+        self._mm = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(suffix='.npy', prefix=prefix, dir=directory or None)
+        os.close(fd)
+        self._mm = np.lib.format.open_memmap(self.path, mode='w+', dtype=self.dtype, shape=self.shape)
+        if init is not None:
+            for start in range(0, num_states, chunk_rows):
+                keys = np.arange(start, min(start + chunk_rows, num_states), dtype=np.int64)
+                self._mm[self.row(keys)] = init(keys)
+        elif fill.any():
+            for start in range(0, num_states, chunk_rows):
+                self._mm[start:start + chunk_rows] = fill
+
+        self._cache = OrderedDict()
+        # the rows of the cache that have changed since they were read
+        self._dirty = set()
+        self.reset_stats()
+        return
+
+    def close(self):
+        """
+        Deletes the file of the table. The table can not be used afterwards.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self._mm is not None:
+            self._mm = None
+            self._cache.clear()
+            self._dirty.clear()
+            os.remove(self.path)
+        return
+
+    def __del__(self):
+        # the file is deleted even if close is never called
+        if getattr(self, '_mm', None) is not None:
+            self.close()
+        return
+
+    def row(self, key):
+        """
+        Returns the row in the file that a state is stored in.
+
+        Parameters
+        ----------
+        key : int
+            The enumeration of a state.
+
+        Returns
+        -------
+        int
+            The row in the file.
+
+        """
+        if self.row_order == 'robots':
+            return key
+        enum_robots, enum_stacks_orders = divmod(key, self._possible_stacks_orders)
+        return enum_stacks_orders * self._possible_robots + enum_robots
+
+    def _cached(self, key):
+        """
+        Returns the cached row of a state, reading it from the file if it is
+        not in the cache. The row is read-only.
+
+        Parameters
+        ----------
+        key : int
+            The enumeration of a state.
+
+        Returns
+        -------
+        NumPy Array
+            The cached row.
+
+        """
+        r = self.row(key)
+        row = self._cache.get(r)
+        if row is not None:
+            self._cache.move_to_end(r)
+            self.hits += 1
+            return row
+
+        self.misses += 1
+        if len(self._cache) >= self.cache_rows:
+            old_r, old_row = self._cache.popitem(last=False)
+            if old_r in self._dirty:
+                self._dirty.remove(old_r)
+                self._mm[old_r] = old_row
+                self.writes += 1
+            self.evictions += 1
+        row = np.array(self._mm[r])
+        row.flags.writeable = False
+        self._cache[r] = row
+        return row
+
+    def _write(self, key, col, value):
+        """
+        Changes values of the cached row of a state and marks it as changed.
+        """
+        row = self._cached(key)
+        row.flags.writeable = True
+        try:
+            row[col] = value
+        finally:
+            row.flags.writeable = False
+        self._dirty.add(self.row(key))
+        return
+
+    def __len__(self):
+        """
+        Returns the number of states.
+
+        Returns
+        -------
+        int
+            The number of states.
+
+        """
+        return self.shape[0]
+
+    def __getitem__(self, idx):
+        """
+        Returns the row of a state or a single value in the row.
+
+        Parameters
+        ----------
+        idx : int or (int, int)
+            The enumeration of a state, or the enumeration of a state and a
+            column of its row.
+
+        Returns
+        -------
+        NumPy Array or scalar
+            The row of the state, which is read-only, or the value in the
+            row.
+
+        """
+        if isinstance(idx, tuple):
+            key, col = idx
+            return self._cached(key)[col]
+        return self._cached(idx)
+
+    def __setitem__(self, idx, value):
+        """
+        Sets the row of a state or a single value in the row.
+
+        Parameters
+        ----------
+        idx : int or (int, int)
+            The enumeration of a state, or the enumeration of a state and a
+            column of its row.
+        value : NumPy Array or scalar
+            The new values.
+
+        Returns
+        -------
+        None.
+
+        """
+        if isinstance(idx, tuple):
+            key, col = idx
+            self._write(key, col, value)
+        else:
+            self._write(idx, slice(None), value)
+        return
+
+    def count_nonzero(self):
+        """
+        Counts the nonzero values in the table, reading the file in chunks.
+
+        Returns
+        -------
+        int
+            The number of nonzero values.
+
+        """
+        self.flush()
+        count = 0
+        for start in range(0, self.shape[0], self.chunk_rows):
+            count += int(np.count_nonzero(self._mm[start:start + self.chunk_rows]))
+        return count
+
+    @property
+    def nbytes(self):
+        """
+        The number of bytes of memory used by the cache.
+
+        Returns
+        -------
+        int
+            The number of bytes used.
+
+        """
+        return len(self._cache) * self.shape[1] * self.dtype.itemsize
+
+    def flush(self):
+        """
+        Write the cached rows that have changed back to the file.
+
+        Returns
+        -------
+        None.
+
+        """
+        for r in self._dirty:
+            self._mm[r] = self._cache[r]
+        self.writes += len(self._dirty)
+        self._dirty.clear()
+        self._mm.flush()
+        return
+
+    def read_rows(self, keys):
+        """
+        Returns the rows of states as they are stored in the file. Cached 
+        rows that have been changed are only in the file after flush.
+
+        Parameters
+        ----------
+        keys : NumPy Array
+            The enumerations of the states.
+
+        Returns
+        -------
+        NumPy Array
+            A copy of the row of each state.
+
+        """
+        return np.asarray(self._mm[self.row(keys)])
+
+    def load(self, path):
+        """
+        Overwrite the table with a .npy file saved by the save method. The
+        file is copied in chunks so it does not need to fit in memory.
+
+        Parameters
+        ----------
+        path : str
+            The file to read the table from.
+
+        Returns
+        -------
+        None.
+
+        """
+        self._cache.clear()
+        self._dirty.clear()
+        saved = np.load(path, mmap_mode='r')
+        for start in range(0, self.shape[0], self.chunk_rows):
+            self._mm[start:start + self.chunk_rows] = saved[start:start + self.chunk_rows]
+        self._mm.flush()
+        return
+
+    def save(self, path):
+        """
+        Save the table to a .npy file. The rows are in the same order as in
+        the table's own file.
+
+        Parameters
+        ----------
+        path : str
+            The file to save the table to.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.flush()
+        saved = np.lib.format.open_memmap(path, mode='w+', dtype=self.dtype, shape=self.shape)
+        for start in range(0, self.shape[0], self.chunk_rows):
+            saved[start:start + self.chunk_rows] = self._mm[start:start + self.chunk_rows]
+        saved.flush()
+        del saved
+        return
+
+    def reset_stats(self):
+        """
+        Reset the cache and page fault counters and the throughput timer.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writes = 0
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        self._faults = (usage.ru_minflt, usage.ru_majflt)
+        self._start = time.perf_counter()
+        return
+
+    def stats(self):
+        """
+        Returns the cache and paging statistics since the table was created
+        or since reset_stats was last called.
+
+        The page faults are counted for the whole process, so they include
+        faults that were not caused by this table.
+
+        Returns
+        -------
+        dict
+            The number of row accesses, cache hits, misses and evictions, the
+            number of rows written back to the file, the hit rate, the number
+            of row accesses per second, and the number of minor and major
+            page faults.
+
+        """
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        accesses = self.hits + self.misses
+        elapsed = time.perf_counter() - self._start
+        return {'accesses': accesses,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'writes': self.writes,
+                'hit_rate': self.hits / accesses if accesses else 0.0,
+                'rows_per_sec': accesses / elapsed if elapsed > 0 else 0.0,
+                'minor_faults': usage.ru_minflt - self._faults[0],
+                'major_faults': usage.ru_majflt - self._faults[1]}
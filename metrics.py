@@ -0,0 +1,231 @@
+import json
+import os
+import time
+
+from util import config_name
+
+PHASES = ('policy', 'step', 'enum', 'update')
+
+class TrainingMetrics:
+    """
+    Telemetry collected while training.
+
+    Each time step of training records the temporal difference error of the
+    update and the time spent in each phase of the step: choosing the action
+    (policy), simulating the environment (step), enumerating the new state
+    (enum), and updating the tables (update). Every interval time steps a
+    record is appended to a JSON lines file and flushed, so the file can be
+    read while training is still running.
+
+    Each record contains the time since the metrics were created, the total
+    number of time steps and episodes, the throughput in time steps per
+    second, the mean and max absolute temporal difference error, the
+    fraction of state/action pairs that have been visited, and the seconds
+    spent in each phase since the previous record. For the memmap backend it
+    also contains the storage statistics of the tables, see
+    Tables.storage_stats.
+
+    Attributes
+    ----------
+    path : str
+        The JSON lines file that the records are appended to.
+    interval : int
+        The number of time steps between records.
+    steps : int
+        The total number of time steps recorded.
+    episodes : int
+        The total number of episodes recorded.
+    """
+
+    def __init__(self, path=None, interval=10000):
+        """
+        Creates a TrainingMetrics object and opens its file.
+
+        Parameters
+        ----------
+        path : str, optional
+            The JSON lines file that the records are appended to. Defaults to
+            Metrics/metrics_<configuration>.jsonl.
+        interval : int
+            The number of time steps between records.
+
+        Returns
+        -------
+        None.
+
+        """
+        if path is None:
+            path = 'Metrics/metrics_' + config_name() + '.jsonl'
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.interval = interval
+        self.file = open(path, 'a')
+
+        self.steps = 0
+        self.episodes = 0
+        self.start = time.perf_counter()
+        self._reset_interval()
+        return
+
+    def _reset_interval(self):
+        """
+        Resets the values that are accumulated between records.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.interval_start = time.perf_counter()
+        self.interval_steps = 0
+        self.abs_td_sum = 0.0
+        self.abs_td_max = 0.0
+        self.phase_ns = dict.fromkeys(PHASES, 0)
+        return
+
+    def step(self, td_error, policy_ns, step_ns, enum_ns, update_ns):
+        """
+        Records one time step of training.
+
+        Parameters
+        ----------
+        td_error : float
+            The temporal difference error returned by Tables.update.
+        policy_ns : int
+            Nanoseconds spent choosing the action.
+        step_ns : int
+            Nanoseconds spent calculating the new state and cost.
+        enum_ns : int
+            Nanoseconds spent enumerating the new state.
+        update_ns : int
+            Nanoseconds spent updating the tables.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.steps += 1
+        self.interval_steps += 1
+        abs_td = abs(td_error)
+        self.abs_td_sum += abs_td
+        if abs_td > self.abs_td_max:
+            self.abs_td_max = abs_td
+        phase_ns = self.phase_ns
+        phase_ns['policy'] += policy_ns
+        phase_ns['step'] += step_ns
+        phase_ns['enum'] += enum_ns
+        phase_ns['update'] += update_ns
+        return
+
+    def episode(self, tables):
+        """
+        Records the end of an episode and writes a record if at least
+        interval time steps have passed since the previous record.
+
+        Parameters
+        ----------
+        tables : Tables
+            The tables being trained, used to compute the coverage.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.episodes += 1
+        if self.interval_steps >= self.interval:
+            self.emit(tables)
+        return
+
+    def emit(self, tables):
+        """
+        Writes a record of the time steps since the previous record.
+
+        Parameters
+        ----------
+        tables : Tables
+            The tables being trained, used to compute the coverage.
+
+        Returns
+        -------
+        None.
+
+        """
+        now = time.perf_counter()
+        elapsed = now - self.interval_start
+        n = self.interval_steps
+        record = {'time': now - self.start,
+                  'steps': self.steps,
+                  'episodes': self.episodes,
+                  'steps_per_sec': n / elapsed if elapsed > 0 else 0.0,
+                  'td_error_mean': self.abs_td_sum / n if n else 0.0,
+                  'td_error_max': self.abs_td_max,
+                  'coverage': tables.coverage()}
+        for phase in PHASES:
+            record[phase + '_sec'] = self.phase_ns[phase] / 1e9
+        if tables.backend == 'memmap':
+            record['storage'] = tables.storage_stats()
+        self.log(**record)
+        self._reset_interval()
+        return
+
+    def log(self, **fields):
+        """
+        Writes a record with arbitrary fields, e.g. the score of an
+        evaluation.
+
+        Parameters
+        ----------
+        **fields
+            The values to write. They must be serializable as JSON.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.file.write(json.dumps(fields) + '\n')
+        self.file.flush()
+        return
+
+    def close(self):
+        """
+        Closes the file.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.file.close()
+        return
+
+
+def read_metrics(path=None):
+    """
+    Reads the records written by TrainingMetrics. The file may still be
+    being written to; a partially written last line is ignored.
+
+    Parameters
+    ----------
+    path : str, optional
+        The JSON lines file to read. Defaults to
+        Metrics/metrics_<configuration>.jsonl.
+
+    Returns
+    -------
+    [dict]
+        The records in the file.
+
+    """
+    if path is None:
+        path = 'Metrics/metrics_' + config_name() + '.jsonl'
+    records = []
+    with open(path) as f:
+        for line in f:
+            if line.endswith('\n'):
+                records.append(json.loads(line))
+    return records
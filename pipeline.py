@@ -0,0 +1,410 @@
+"""
+Training with the simulation and the learning in separate processes.
+
+Several actor processes simulate episodes with an epsilon greedy policy and
+write each time step as a fixed-width TRANSITION_DTYPE record into a ring
+buffer in shared memory. The learner, which is the main process, drains the
+buffer in batches, passes the records to Tables.update_enums, and publishes
+the greedy action of every state to the actors every publish_every time
+steps. When the buffer is full the actors wait for the learner, so the
+actors never get more than capacity time steps ahead of it.
+
+    python pipeline.py --actors 4 --steps 200000
+"""
+import argparse
+import multiprocessing as mp
+import random
+import time
+
+import numpy as np
+
+from actions import Actions
+from environment import Environment
+from tables import Tables, TRANSITION_DTYPE
+
+class TransitionBuffer:
+    """
+    A ring buffer of TRANSITION_DTYPE records in shared memory that is
+    written by the actors and read by the learner.
+
+    Attributes
+    ----------
+    capacity : int
+        The largest number of records the buffer holds.
+    """
+
+    def __init__(self, capacity=16384):
+        """
+        Creates an empty TransitionBuffer.
+
+        Parameters
+        ----------
+        capacity : int
+            The largest number of records the buffer holds.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.capacity = capacity
+        self._data = mp.RawArray('b', capacity * TRANSITION_DTYPE.itemsize)
+        # the number of records written and read, and the number of times an
+        # actor had to wait for space
+        self._counts = mp.RawArray('q', 3)
+        self._cond = mp.Condition()
+        self._records = np.frombuffer(self._data, dtype=TRANSITION_DTYPE)
+        return
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_records']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._records = np.frombuffer(self._data, dtype=TRANSITION_DTYPE)
+        return
+
+    def __len__(self):
+        """
+        Returns the number of records that have not been read.
+
+        Returns
+        -------
+        int
+            The number of records in the buffer.
+
+        """
+        return self._counts[0] - self._counts[1]
+
+    @property
+    def stalls(self):
+        """
+        The number of times an actor had to wait for the learner.
+        """
+        return self._counts[2]
+
+    def put(self, records, stop=None):
+        """
+        Writes records to the buffer, waiting until there is space for them.
+        More than capacity records are written in pieces of at most capacity
+        records, so the learner can read the first pieces in the meantime.
+
+        Parameters
+        ----------
+        records : NumPy Array
+            The records of TRANSITION_DTYPE.
+        stop : multiprocessing Event, optional
+            Stop waiting once it is set.
+
+        Returns
+        -------
+        bool
+            A boolean value indicating if the records were written.
+
+        """
+        for i in range(0, len(records), self.capacity):
+            if not self._put(records[i:i + self.capacity], stop):
+                return False
+        return True
+
+    def _put(self, records, stop):
+        """
+        Writes at most capacity records, waiting until there is space for them.
+        """
+        n = len(records)
+        with self._cond:
+            if self.capacity - len(self) < n:
+                self._counts[2] += 1
+                while self.capacity - len(self) < n:
+                    if stop is not None and stop.is_set():
+                        return False
+                    self._cond.wait(0.1)
+            i = self._counts[0] % self.capacity
+            first = min(n, self.capacity - i)
+            self._records[i:i + first] = records[:first]
+            self._records[:n - first] = records[first:]
+            self._counts[0] += n
+            self._cond.notify_all()
+        return True
+
+    def get(self, max_records, timeout=0.1):
+        """
+        Reads the oldest records from the buffer, waiting up to timeout
+        seconds if it is empty.
+
+        Parameters
+        ----------
+        max_records : int
+            The largest number of records to read.
+        timeout : float
+            The number of seconds to wait.
+
+        Returns
+        -------
+        NumPy Array
+            A copy of the records, which may be empty.
+
+        """
+        with self._cond:
+            if len(self) == 0:
+                self._cond.wait(timeout)
+            n = min(len(self), max_records)
+            i = self._counts[1] % self.capacity
+            first = min(n, self.capacity - i)
+            records = np.concatenate((self._records[i:i + first], self._records[:n - first]))
+            self._counts[1] += n
+            self._cond.notify_all()
+        return records
+
+
+class SharedPolicy:
+    """
+    The greedy action of every state in shared memory, published by the
+    learner. It has the policies of Agent that only need the greedy actions,
+    so it can be the agent of an Environment in an actor process.
+
+    Attributes
+    ----------
+    num_states : int
+        The number of states.
+    """
+
+    def __init__(self, num_states):
+        """
+        Creates a SharedPolicy where action 0 is greedy in every state.
+
+        Parameters
+        ----------
+        num_states : int
+            The number of states.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.num_states = num_states
+        self._data = mp.RawArray('i', num_states)
+        self._version = mp.RawValue('q', 0)
+        self._greedy = np.frombuffer(self._data, dtype=np.int32)
+        return
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_greedy']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._greedy = np.frombuffer(self._data, dtype=np.int32)
+        return
+
+    @property
+    def version(self):
+        """
+        The number of times the greedy actions have been published.
+        """
+        return self._version.value
+
+    def publish(self, greedy):
+        """
+        Replaces the greedy actions. An actor that reads them at the same
+        time may see a mix of the old and new actions, which are all valid.
+
+        Parameters
+        ----------
+        greedy : NumPy Array
+            The greedy action of each state, see Tables.greedy_actions.
+
+        Returns
+        -------
+        None.
+
+        """
+        np.copyto(self._greedy, greedy)
+        self._version.value += 1
+        return
+
+    def greedy_policy(self, current_state, snum=None):
+        """
+        Selects the published greedy action.
+
+        Parameters
+        ----------
+        current_state : State
+            The state the agent is currently in.
+        snum : int, optional
+            The enumeration of the current state, if it is already known.
+
+        Returns
+        -------
+        Actions
+            The actions that should be taken if following this policy.
+
+        """
+        if snum is None:
+            snum = current_state.enum()
+        return Actions.by_enum(int(self._greedy[snum]))
+
+    def epsilon_greedy_policy(self, current_state, epsilon, snum=None):
+        """
+        Act randomly with probability epsilon. Otherwise act greedily.
+
+        Parameters
+        ----------
+        current_state : State
+            The current state the agent is in.
+        epsilon : float
+            The probability that the agent should act randomly.
+        snum : int, optional
+            The enumeration of the current state, if it is already known.
+
+        Returns
+        -------
+        Actions
+            The actions that should be taken if following this policy.
+
+        """
+        if random.random() < epsilon:
+            return Actions()
+        return self.greedy_policy(current_state, snum)
+
+
+def actor(buffer, policy, stop, seed, epsilon=0.2, n_iter=30, episodes_per_put=4):
+    """
+    Simulates episodes and writes their time steps to the buffer until stop
+    is set. Runs in an actor process.
+
+    Parameters
+    ----------
+    buffer : TransitionBuffer
+        The buffer to write to.
+    policy : SharedPolicy
+        The greedy actions published by the learner.
+    stop : multiprocessing Event
+        Set by the learner when training is finished.
+    seed : int
+        The seed of the random number generator, which must be different for
+        each actor.
+    epsilon : float
+        The probability of acting randomly.
+    n_iter : int
+        The number of time steps per episode.
+    episodes_per_put : int
+        The number of episodes written to the buffer at a time.
+
+    Returns
+    -------
+    None.
+
+    """
+    random.seed(seed)
+    env = Environment(policy)
+    records = np.empty(n_iter * episodes_per_put, dtype=TRANSITION_DTYPE)
+    while not stop.is_set():
+        k = 0
+        for episode in range(episodes_per_put):
+            env.state.reset()
+            snum = env.state.enum()
+            for time_step in range(n_iter):
+                a = env.agent.epsilon_greedy_policy(env.state, epsilon, snum)
+                previous_state = env.state
+                env.state = env.calculate_state(env.state, a)
+                previous_snum = snum
+                snum = env.state.enum()
+                same_locs = (previous_state.robot_locs == env.state.robot_locs
+                             and previous_state.stack_locs == env.state.stack_locs)
+                records[k] = (previous_snum, snum, a.enum(), sum(env.state.orders), same_locs)
+                k += 1
+        if not buffer.put(records[:k], stop):
+            break
+    return
+
+
+def train(n_steps=100000, n_actors=2, epsilon=0.2, n_iter=30, capacity=16384, batch=1024,
+          publish_every=10000, overwrite=False):
+    """
+    Trains the tables with actor processes and saves them.
+
+    Parameters
+    ----------
+    n_steps : int
+        The number of time steps to learn from.
+    n_actors : int
+        The number of actor processes.
+    epsilon : float
+        The probability that the actors act randomly.
+    n_iter : int
+        The number of time steps per episode.
+    capacity : int
+        The number of records the buffer holds.
+    batch : int
+        The largest number of records read from the buffer at a time.
+    publish_every : int
+        The number of time steps between publishing the greedy actions.
+    overwrite : bool
+        If True, start from new tables instead of the saved ones.
+
+    Returns
+    -------
+    dict
+        The number of time steps, the time steps per second, the number of
+        times the actors waited for the learner, and the number of times the
+        greedy actions were published.
+
+    """
+    tables = Tables()
+    if not overwrite:
+        tables.read_tables()
+    buffer = TransitionBuffer(capacity)
+    policy = SharedPolicy(tables.num_states)
+    policy.publish(tables.greedy_actions())
+    stop = mp.Event()
+    seed = random.randrange(2**31)
+    actors = [mp.Process(target=actor, args=(buffer, policy, stop, seed + i, epsilon, n_iter),
+                         daemon=True)
+              for i in range(n_actors)]
+    for p in actors:
+        p.start()
+
+    start = time.perf_counter()
+    steps = 0
+    next_publish = publish_every
+    while steps < n_steps:
+        records = buffer.get(min(batch, n_steps - steps))
+        if len(records) == 0 and not any(p.is_alive() for p in actors):
+            stop.set()
+            raise RuntimeError('every actor process has exited after ' + str(steps) + ' time steps')
+        for s1num, s2num, anum, c, same_locs in records.tolist():
+            tables.update_enums(s1num, s2num, anum, c, same_locs)
+        steps += len(records)
+        if steps >= next_publish:
+            policy.publish(tables.greedy_actions())
+            next_publish += publish_every
+    seconds = time.perf_counter() - start
+
+    stop.set()
+    for p in actors:
+        p.join()
+    tables.save_tables()
+    stats = {'steps': steps,
+             'steps_per_second': steps / seconds,
+             'stalls': buffer.stalls,
+             'publishes': policy.version}
+    print(stats)
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train with separate actor and learner processes.')
+    parser.add_argument('--actors', type=int, default=2, help='number of actor processes')
+    parser.add_argument('--steps', type=int, default=100000, help='time steps to learn from')
+    parser.add_argument('--epsilon', type=float, default=0.2)
+    parser.add_argument('--capacity', type=int, default=16384, help='records in the buffer')
+    parser.add_argument('--publish-every', type=int, default=10000)
+    parser.add_argument('--overwrite', action='store_true', help='start from new tables')
+    args = parser.parse_args()
+    train(args.steps, args.actors, args.epsilon, capacity=args.capacity,
+          publish_every=args.publish_every, overwrite=args.overwrite)
@@ -0,0 +1,779 @@
+import heapq
+import time
+from collections import deque
+
+from actions import Actions
+from environment import Environment
+from warehouse_parameters import N_ROWS, N_COLS
+
+PICKING_STATION = (0, -1)
+
+# (row, col) offsets of each move and the action that makes it
+MOVES = {(-1, 0): 'U', (1, 0): 'D', (0, -1): 'L', (0, 1): 'R'}
+
+# robot phases
+IDLE = 'idle'
+PARK = 'park'
+FETCH = 'fetch'
+QUEUED = 'queued'
+DELIVER = 'deliver'
+SERVE = 'serve'
+RETURN = 'return'
+CLEAR = 'clear'
+
+def neighbours(cell):
+    """
+    Returns the cells that a robot can move to from a cell in 1 time step,
+    following the same moves as Environment.calculate_state.
+
+    Parameters
+    ----------
+    cell : (int, int)
+        The row and column of a cell.
+
+    Returns
+    -------
+    [(int, int)]
+        The neighbouring cells.
+
+    """
+    row, col = cell
+    cells = []
+    if row > 0:
+        cells.append((row - 1, col))
+    if row < N_ROWS - 1 and col > -1:
+        cells.append((row + 1, col))
+    if (row == 0 and col > -1) or col > 0:
+        cells.append((row, col - 1))
+    if col < N_COLS - 1:
+        cells.append((row, col + 1))
+    return cells
+
+
+class Robot:
+    """
+    The planner's record of a robot.
+
+    Attributes
+    ----------
+    cell : (int, int)
+        The current location of the robot.
+    phase : str
+        What the robot is doing, e.g. IDLE or DELIVER.
+    stack : int or None
+        The stack the robot has been assigned to.
+    goal : (int, int) or None
+        The cell the robot is moving to.
+    path : deque
+        The planned cells of the robot at the next time steps.
+    reserved : deque
+        The (time, previous cell, cell) reservations made for the path.
+    hold : (int, int) or None
+        The cell the robot holds at the end of its path.
+    """
+
+    def __init__(self, cell):
+        self.cell = cell
+        self.phase = IDLE
+        self.stack = None
+        self.goal = None
+        self.path = deque()
+        self.reserved = deque()
+        self.hold = None
+        return
+
+    def carrying(self):
+        return self.phase in (DELIVER, SERVE, RETURN, CLEAR)
+
+
+class Stack:
+    """
+    The planner's record of a stack.
+
+    Attributes
+    ----------
+    cell : (int, int)
+        The current location of the stack.
+    home : (int, int)
+        The cell the stack is returned to after visiting the picking station.
+    robot : int or None
+        The robot that has been assigned to the stack.
+    """
+
+    def __init__(self, cell):
+        self.cell = cell
+        self.home = cell
+        self.robot = None
+        return
+
+
+class ReservationPlanner:
+    """
+    A non-learned baseline that plans collision-free paths for every robot
+    with space-time A* and a reservation table, so it can be compared to the
+    learned policies on warehouses with hundreds of robots.
+
+    Stacks with ordered items are assigned to the nearest idle robot. The
+    robot moves under the stack, carries it to the picking station at
+    (0, -1), waits there until all of the stack's ordered items have been
+    collected, and carries it back to the cell it came from (its home). Idle
+    robots wait under stacks, or in a free cell outside the top row if every
+    stack is taken, so that they are not in the way of carried stacks. Stacks
+    whose home is in the top row are moved out of it, and a stack whose home
+    has been walled in by other stacks is given a new home nearby.
+
+    Each planned path reserves the cells the robot occupies at each future
+    time step and the moves it makes, and a robot at the end of its path
+    holds its cell until it is given a new path. A path may not enter a cell
+    reserved by another robot at the same time or swap cells with another
+    robot. A robot carrying a stack may also not enter a cell where another
+    stack has been put down. These are the rules that
+    Environment.calculate_state enforces, so the actions never collide.
+
+    The picking station can only be reached through (0, 0), so only 1 robot
+    delivers a stack at a time. The others wait under their stacks, and the
+    one nearest to the picking station goes next. Only the robots whose task
+    changed are planned at each time step, and at most plan_budget paths are
+    searched for per step.
+
+    Attributes
+    ----------
+    t : int
+        The number of time steps since the planner was reset.
+    robots : [Robot]
+        The robots.
+    stacks : [Stack]
+        The stacks.
+    plan_times : [float]
+        The number of seconds spent planning at each time step.
+    """
+
+    def __init__(self, max_active=8, plan_budget=32, max_expansions=20000):
+        """
+        Creates a ReservationPlanner.
+
+        Parameters
+        ----------
+        max_active : int
+            The largest number of stacks that are assigned to robots at the
+            same time.
+        plan_budget : int
+            The largest number of paths planned in 1 time step.
+        max_expansions : int
+            The largest number of nodes expanded by 1 A* search.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.max_active = max_active
+        self.plan_budget = plan_budget
+        self.max_expansions = max_expansions
+        self.robots = None
+        self.stacks = None
+        self.neighbours = None
+        self.plan_times = []
+        return
+
+    def reset(self, state):
+        """
+        Forget all plans and start planning from a state.
+
+        Parameters
+        ----------
+        state : State
+            The current state.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.t = 0
+        if self.neighbours is None:
+            self.neighbours = {(row, col): tuple(neighbours((row, col)))
+                               for row in range(N_ROWS) for col in range(-1, N_COLS)
+                               if row == 0 or col >= 0}
+        self.robots = [Robot((loc.row, loc.col)) for loc in state.robot_locs]
+        self.stacks = [Stack((loc.row, loc.col)) for loc in state.stack_locs]
+        self.vertex = {}
+        self.edges = set()
+        self.holds = {}
+        self.last_reserved = {}
+        self.queue = deque()
+        self.pending = deque()
+        self.dist_cache = {}
+        self.parking = set()
+        self.homes = {stack.home: i for i, stack in enumerate(self.stacks)}
+        self.parked = set(self.homes)
+        self.expected = None
+        for i, robot in enumerate(self.robots):
+            self._hold(i, robot.cell, 0)
+        # the top row is the only way to the picking station, so stacks are
+        # moved out of it. Idle robots wait under stacks, where they are not
+        # in the way of carried stacks.
+        for i, stack in enumerate(self.stacks):
+            if stack.home[0] == 0:
+                self._assign(i)
+        for i, robot in enumerate(self.robots):
+            if robot.phase == IDLE and robot.cell not in self.parked:
+                robot.phase = PARK
+                self.pending.append(i)
+        return
+
+    def policy(self, current_state):
+        """
+        Determines the actions of the robots, planning new paths where they
+        are needed.
+
+        Parameters
+        ----------
+        current_state : State
+            The state the robots are in.
+
+        Returns
+        -------
+        Actions
+            The actions that should be taken by each robot.
+
+        """
+        start = time.perf_counter()
+        self._sync(current_state)
+
+        orders = {(loc.row, loc.col): current_state.orders[i]
+                  for i, loc in enumerate(current_state.stack_locs)}
+        self._update_tasks(orders)
+
+        # robots that could not be planned are tried again at the next step
+        for _ in range(min(self.plan_budget, len(self.pending))):
+            self._plan(self.pending.popleft())
+
+        # next cell of each robot
+        cell_to_robot = {robot.cell: i for i, robot in enumerate(self.robots)}
+        a = Actions()
+        expected = []
+        for idx, loc in enumerate(current_state.robot_locs):
+            i = cell_to_robot[(loc.row, loc.col)]
+            robot = self.robots[i]
+            next_cell = robot.path[0] if robot.path else robot.cell
+            if next_cell == robot.cell:
+                a.actions[idx] = 'O'
+            else:
+                move = MOVES[(next_cell[0] - robot.cell[0], next_cell[1] - robot.cell[1])]
+                a.actions[idx] = 'S' + move if robot.carrying() else move
+            expected.append(next_cell)
+        self.expected = expected
+        self.plan_times.append(time.perf_counter() - start)
+        return a
+
+    def _sync(self, state):
+        """
+        Advances the robots along their paths if the last actions were
+        carried out, and starts over from the state if they were not.
+
+        Parameters
+        ----------
+        state : State
+            The current state.
+
+        Returns
+        -------
+        None.
+
+        """
+        cells = sorted((loc.row, loc.col) for loc in state.robot_locs)
+        if self.robots is None:
+            self.reset(state)
+            return
+        if self.expected is None:
+            return
+        if cells != sorted(self.expected):
+            # the state was changed by something other than the planned
+            # actions, e.g. State.reset
+            self.reset(state)
+            return
+
+        self.t += 1
+        for robot in self.robots:
+            if robot.path:
+                robot.cell = robot.path.popleft()
+                if robot.carrying():
+                    self.stacks[robot.stack].cell = robot.cell
+            # forget reservations in the past
+            while robot.reserved and robot.reserved[0][0] <= self.t:
+                t, prev, cell = robot.reserved.popleft()
+                self.vertex.pop((t, cell), None)
+                self.edges.discard((t - 1, prev, cell))
+        self.expected = None
+        return
+
+    def _update_tasks(self, orders):
+        """
+        Moves robots that finished their paths to their next phase and
+        assigns stacks with ordered items to idle robots.
+
+        Parameters
+        ----------
+        orders : {(int, int): int}
+            The number of ordered items of the stack at each location.
+
+        Returns
+        -------
+        None.
+
+        """
+        for i, robot in enumerate(self.robots):
+            if robot.path or i in self.pending:
+                continue
+            if robot.phase == FETCH and robot.cell == robot.goal:
+                if robot.cell[0] == 0:
+                    self._move_home(i, CLEAR)
+                else:
+                    robot.phase = QUEUED
+                    self.queue.append(i)
+            elif robot.phase == DELIVER and robot.cell == PICKING_STATION:
+                robot.phase = SERVE
+            elif robot.phase == SERVE and orders.get(PICKING_STATION, 0) == 0:
+                robot.phase = RETURN
+                robot.goal = self.stacks[robot.stack].home
+                if robot.cell not in self._distances(robot.goal, True):
+                    # other stacks were put down around the home
+                    self._move_home(i, RETURN)
+                else:
+                    self.pending.append(i)
+            elif robot.phase in (RETURN, CLEAR) and robot.cell == robot.goal:
+                self._park(robot.cell, True)
+                self.stacks[robot.stack].robot = None
+                robot.stack = None
+                robot.phase = IDLE
+            elif robot.phase == PARK and robot.cell == robot.goal:
+                self.parking.discard(robot.goal)
+                robot.phase = IDLE
+
+        # only 1 stack is delivered at a time
+        busy = any(r.phase in (DELIVER, SERVE) for r in self.robots if r.stack is not None)
+        if not busy and PICKING_STATION not in self.holds:
+            # the robot nearest to the picking station that can reach it
+            nearest = sorted(self.queue, key=lambda j: sum(self.robots[j].cell))
+            for i in nearest[:self.plan_budget]:
+                robot = self.robots[i]
+                robot.phase = DELIVER
+                robot.goal = PICKING_STATION
+                if self._plan(i):
+                    self._park(robot.cell, False)
+                    self.queue.remove(i)
+                    break
+                robot.phase = QUEUED
+
+        active = sum(1 for stack in self.stacks if stack.robot is not None)
+        if active < self.max_active:
+            waiting = [(-orders.get(stack.cell, 0), i) for i, stack in enumerate(self.stacks)
+                       if stack.robot is None and orders.get(stack.cell, 0) > 0
+                       and stack.cell != PICKING_STATION]
+            for _, i in sorted(waiting)[:self.max_active - active]:
+                self._assign(i)
+        return
+
+    def _assign(self, stack_idx):
+        """
+        Assigns a stack to the nearest idle robot. A robot that is parked
+        under the stack is always chosen, and the stack is not assigned if
+        another robot is moving to park under it.
+
+        Parameters
+        ----------
+        stack_idx : int
+            The index of the stack.
+
+        Returns
+        -------
+        bool
+            A boolean value indicating if the stack was assigned.
+
+        """
+        stack = self.stacks[stack_idx]
+        hold = self.holds.get(stack.cell)
+        if hold is not None:
+            if self.robots[hold[1]].phase != IDLE:
+                return False
+            i = hold[1]
+        else:
+            best = None
+            for j, robot in enumerate(self.robots):
+                if robot.phase == IDLE:
+                    d = abs(robot.cell[0] - stack.cell[0]) + abs(robot.cell[1] - stack.cell[1])
+                    if best is None or d < best[0]:
+                        best = (d, j)
+            if best is None:
+                return False
+            i = best[1]
+        robot = self.robots[i]
+        robot.phase = FETCH
+        robot.stack = stack_idx
+        robot.goal = stack.cell
+        stack.robot = i
+        self.pending.append(i)
+        return True
+
+    def _move_home(self, i, phase):
+        """
+        Starts carrying a stack to a new home, either to move it out of the
+        top row or because its home can no longer be reached. The new home
+        is the free cell nearest to the old one that the robot can reach. If
+        there is none, a stack in the top row is delivered from there
+        instead, and a stack at the picking station is carried to its old
+        home when it can be reached.
+
+        Parameters
+        ----------
+        i : int
+            The index of the robot carrying or under the stack.
+        phase : str
+            CLEAR or RETURN.
+
+        Returns
+        -------
+        None.
+
+        """
+        robot = self.robots[i]
+        stack = self.stacks[robot.stack]
+        new_home = self._free_cell(robot.cell, carrying=True, near=stack.home)
+        if new_home is None:
+            if phase == CLEAR:
+                robot.phase = QUEUED
+                self.queue.append(i)
+            else:
+                self.pending.append(i)
+            return
+        del self.homes[stack.home]
+        stack.home = new_home
+        self.homes[new_home] = robot.stack
+        if phase == CLEAR:
+            self._park(robot.cell, False)
+        robot.phase = phase
+        robot.goal = new_home
+        self.pending.append(i)
+        return
+
+    def _park(self, cell, parked):
+        """
+        Records that a stack was put down in or picked up from a cell.
+
+        Parameters
+        ----------
+        cell : (int, int)
+            The location of the stack.
+        parked : bool
+            True if the stack was put down, False if it was picked up.
+
+        Returns
+        -------
+        None.
+
+        """
+        if parked:
+            self.parked.add(cell)
+        else:
+            self.parked.discard(cell)
+        # the distances of carried stacks depend on the parked stacks
+        self.dist_cache = {key: d for key, d in self.dist_cache.items() if not key[1]}
+        return
+
+    def _free_cell(self, start, carrying, near=None):
+        """
+        Finds a cell outside the top row that no robot is holding or moving
+        to. A robot that is not carrying a stack parks under the nearest
+        stack that has not been assigned to a robot, or in the nearest free
+        cell if there is none. A robot carrying a stack looks for the cell
+        nearest to near that it can reach and that is not the home of a
+        stack.
+
+        Parameters
+        ----------
+        start : (int, int)
+            The cell to search from.
+        carrying : bool
+            Whether the robot is carrying a stack.
+        near : (int, int), optional
+            The cell that a carried stack should be put down near. Defaults
+            to start.
+
+        Returns
+        -------
+        (int, int) or None
+            The free cell, or None if there is none.
+
+        """
+        if near is None:
+            near = start
+        seen = {start}
+        frontier = deque([start])
+        best = None
+        while frontier:
+            cell = frontier.popleft()
+            if (cell[0] > 0 and cell not in self.holds and cell not in self.parking
+                    and self.last_reserved.get(cell, -1) < self.t):
+                if cell not in self.homes:
+                    if carrying:
+                        d = abs(cell[0] - near[0]) + abs(cell[1] - near[1])
+                        if best is None or d < best[0]:
+                            best = (d, cell)
+                    elif best is None:
+                        best = (0, cell)
+                elif not carrying and self.stacks[self.homes[cell]].robot is None:
+                    return cell
+            for n in self.neighbours[cell]:
+                if n not in seen and not (carrying and n in self.parked):
+                    seen.add(n)
+                    frontier.append(n)
+        return best[1] if best is not None else None
+
+    def _distances(self, goal, carrying):
+        """
+        Returns the length of the shortest path from every cell to a goal,
+        ignoring robots. Robots carrying a stack may not pass through the
+        cells of parked stacks. The result is cached.
+
+        Parameters
+        ----------
+        goal : (int, int)
+            The goal cell.
+        carrying : bool
+            Whether the robot is carrying a stack.
+
+        Returns
+        -------
+        {(int, int): int}
+            The distance of each cell that can reach the goal.
+
+        """
+        key = (goal, carrying)
+        dist = self.dist_cache.get(key)
+        if dist is None:
+            dist = {goal: 0}
+            frontier = deque([goal])
+            while frontier:
+                cell = frontier.popleft()
+                for n in self.neighbours[cell]:
+                    if n not in dist and not (carrying and n in self.parked):
+                        dist[n] = dist[cell] + 1
+                        frontier.append(n)
+            self.dist_cache[key] = dist
+        return dist
+
+    def _plan(self, i):
+        """
+        Plans a path for a robot to its goal with space-time A* and reserves
+        it. If no path is found, the robot holds its cell and is planned
+        again at the next time step.
+
+        Parameters
+        ----------
+        i : int
+            The index of the robot.
+
+        Returns
+        -------
+        bool
+            A boolean value indicating if a path was found.
+
+        """
+        robot = self.robots[i]
+        if robot.phase == PARK or (robot.phase == IDLE and robot.goal is None):
+            robot.goal = self._free_cell(robot.cell, False)
+            if robot.goal is None:
+                robot.phase = IDLE
+                return False
+            robot.phase = PARK
+            self.parking.add(robot.goal)
+
+        self._release(i)
+        path = self._search(i, robot.cell, robot.goal, robot.carrying())
+        if path is None:
+            self._hold(i, robot.cell, self.t)
+            if robot.phase not in (QUEUED, DELIVER):
+                self.pending.append(i)
+            return False
+
+        t = self.t
+        prev = robot.cell
+        for cell in path:
+            t += 1
+            self.vertex[(t, cell)] = i
+            self.edges.add((t - 1, prev, cell))
+            robot.reserved.append((t, prev, cell))
+            if self.last_reserved.get(cell, -1) < t:
+                self.last_reserved[cell] = t
+            prev = cell
+        robot.path = deque(path)
+        self._hold(i, robot.goal, t)
+        return True
+
+    def _hold(self, i, cell, t):
+        """
+        Reserves a cell for a robot from time t until it is given a new path.
+
+        Parameters
+        ----------
+        i : int
+            The index of the robot.
+        cell : (int, int)
+            The cell to hold.
+        t : int
+            The time the robot arrives in the cell.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.holds[cell] = (t, i)
+        self.robots[i].hold = cell
+        return
+
+    def _release(self, i):
+        """
+        Removes the reservations and hold of a robot.
+
+        Parameters
+        ----------
+        i : int
+            The index of the robot.
+
+        Returns
+        -------
+        None.
+
+        """
+        robot = self.robots[i]
+        for t, prev, cell in robot.reserved:
+            self.vertex.pop((t, cell), None)
+            self.edges.discard((t - 1, prev, cell))
+        robot.reserved = deque()
+        robot.path = deque()
+        if robot.hold is not None:
+            del self.holds[robot.hold]
+            robot.hold = None
+        return
+
+    def _search(self, i, start, goal, carrying):
+        """
+        Space-time A* search from start to goal.
+
+        Parameters
+        ----------
+        i : int
+            The index of the robot.
+        start : (int, int)
+            The current cell of the robot.
+        goal : (int, int)
+            The goal cell.
+        carrying : bool
+            Whether the robot is carrying a stack.
+
+        Returns
+        -------
+        [(int, int)] or None
+            The cells of the robot at each of the next time steps, or None if
+            no path was found.
+
+        """
+        hold = self.holds.get(goal)
+        if hold is not None and hold[1] != i:
+            return None
+        dist = self._distances(goal, carrying)
+        h0 = dist.get(start)
+        if h0 is None:
+            # a robot under a stack that has not been picked up yet
+            h0 = min((dist[n] + 1 for n in self.neighbours[start] if n in dist), default=None)
+            if h0 is None:
+                return None
+
+        goal_free = self.last_reserved.get(goal, -1)
+        t0 = self.t
+        horizon = t0 + 4 * (h0 + N_ROWS + N_COLS)
+        vertex = self.vertex
+        edges = self.edges
+        holds = self.holds
+        moves = self.neighbours
+        parents = {(start, t0): None}
+        # ties are broken towards the goal so fewer nodes are expanded
+        heap = [(h0, h0, t0, start)]
+        expansions = 0
+        while heap and expansions < self.max_expansions:
+            _, _, t, cell = heapq.heappop(heap)
+            expansions += 1
+            if cell == goal and t > goal_free:
+                path = []
+                node = (cell, t)
+                while node[1] > t0:
+                    path.append(node[0])
+                    node = parents[node]
+                path.reverse()
+                return path
+            if t >= horizon:
+                continue
+            t1 = t + 1
+            for n in moves[cell] + (cell,):
+                node = (n, t1)
+                if node in parents:
+                    continue
+                h = dist.get(n, h0 if n == start else None)
+                if h is None:
+                    continue
+                # the cell is reserved by another robot, or the move swaps
+                # cells with another robot
+                owner = vertex.get(node[::-1])
+                if owner is not None and owner != i:
+                    continue
+                hold = holds.get(n)
+                if hold is not None and hold[1] != i and hold[0] <= t1:
+                    continue
+                if n != cell and (t, n, cell) in edges:
+                    continue
+                parents[node] = (cell, t)
+                heapq.heappush(heap, (t1 - t0 + h, h, t1, n))
+        return None
+
+
+def run(n_iter=1000, show=0):
+    """
+    Simulates the planner baseline from a random state.
+
+    Parameters
+    ----------
+    n_iter : int
+        The number of time steps.
+    show : int
+        The number of time steps to print.
+
+    Returns
+    -------
+    float
+        The average cost per time step.
+
+    """
+    planner = ReservationPlanner()
+    env = Environment(planner)
+    for time_step in range(n_iter):
+        a = planner.policy(env.state)
+        if time_step < show:
+            print('\n')
+            print("t = " + str(time_step))
+            print(env)
+            print("actions = " + str(a.actions))
+        env.state = env.calculate_state(env.state, a)
+        env.update_cost()
+
+    score = env.cost/n_iter
+    times = sorted(planner.plan_times)
+    print('\nscore = ' + str(score))
+    print('planning ms per step: mean = {:.3f}, p99 = {:.3f}, max = {:.3f}'.format(
+        1000 * sum(times) / len(times), 1000 * times[int(0.99 * (len(times) - 1))], 1000 * times[-1]))
+    return score
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,355 @@
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from util import config_name
+
+class HookStats:
+    """
+    The statistics collected by the profiler for one hooked function.
+
+    The times are inclusive, i.e. the time of a hooked function includes the
+    time of any hooked functions that it calls.
+
+    Attributes
+    ----------
+    calls : int
+        The number of times the function was called.
+    timed_calls : int
+        The number of calls that were timed. Calls whose allocations were
+        measured are not timed.
+    ns : int
+        The total number of nanoseconds spent in the timed calls.
+    samples : int
+        The number of calls whose allocations were measured.
+    peak_bytes : int
+        The total over the sampled calls of the peak number of bytes
+        allocated during the call.
+    net_blocks : int
+        The total over the sampled calls of the number of memory blocks that
+        were allocated during the call and were still allocated after it.
+    net_bytes : int
+        The total over the sampled calls of the number of bytes that were
+        allocated during the call and were still allocated after it.
+    """
+
+    def __init__(self):
+        """
+        Creates a HookStats object with all counters set to 0.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.calls = 0
+        self.timed_calls = 0
+        self.ns = 0
+        self.samples = 0
+        self.peak_bytes = 0
+        self.net_blocks = 0
+        self.net_bytes = 0
+        return
+
+    def as_dict(self):
+        """
+        Returns the statistics and the averages per call.
+
+        Returns
+        -------
+        dict
+            The statistics.
+
+        """
+        samples = max(self.samples, 1)
+        return {'calls': self.calls,
+                'total_ns': self.ns,
+                'mean_ns': self.ns / self.timed_calls if self.timed_calls else 0.0,
+                'alloc_samples': self.samples,
+                'peak_bytes_per_call': self.peak_bytes / samples,
+                'net_blocks_per_call': self.net_blocks / samples,
+                'net_bytes_per_call': self.net_bytes / samples}
+
+
+class Profiler:
+    """
+    Instrumentation of the hot paths of training.
+
+    When the profiler is enabled, the hooked methods are replaced by wrappers
+    that count calls and accumulate their time in nanoseconds. Every
+    sample_every calls of a method, the allocations made by that call are
+    measured with tracemalloc, which is only tracing during the sampled call.
+    Sampled calls are skipped while tracemalloc is already tracing, e.g. 
+    inside the sampled call of another hooked method. When the profiler is 
+    disabled, the original methods are restored, so the hooks cost nothing.
+
+    The hooked methods are Environment.calculate_state, State.enum,
+    Tables.update, Tables.update_enums, TraceLearner.update and every Agent
+    method whose name ends in _policy. Every update of the tables goes
+    through Tables.update_enums, including the updates of a TraceLearner.
+
+    Attributes
+    ----------
+    sample_every : int
+        The number of calls between allocation samples. If 0, allocations are
+        not sampled.
+    stats : {str: HookStats}
+        The statistics of each hooked method, keyed by its qualified name.
+    enabled : bool
+        Whether the hooks are installed.
+    """
+
+    def __init__(self, sample_every=1000):
+        """
+        Creates a disabled Profiler.
+
+        Parameters
+        ----------
+        sample_every : int
+            The number of calls between allocation samples. If 0, allocations
+            are not sampled.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.sample_every = sample_every
+        self.stats = {}
+        self.enabled = False
+        self._originals = []
+        self._start = None
+        return
+
+    @staticmethod
+    def hook_points():
+        """
+        Returns the methods that are instrumented.
+
+        Returns
+        -------
+        [(type, str)]
+            The class and name of each hooked method.
+
+        """
+        from agent import Agent
+        from environment import Environment
+        from state import State
+        from tables import Tables
+        from traces import TraceLearner
+
+        points = [(Environment, 'calculate_state'), (State, 'enum'), (Tables, 'update'),
+                  (Tables, 'update_enums'), (TraceLearner, 'update')]
+        points += [(Agent, name) for name in sorted(vars(Agent)) if name.endswith('_policy')]
+        return points
+
+    def enable(self):
+        """
+        Installs the hooks.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.enabled:
+            return
+        for cls, name in self.hook_points():
+            func = vars(cls)[name]
+            key = cls.__name__ + '.' + name
+            stats = self.stats.setdefault(key, HookStats())
+            self._originals.append((cls, name, func))
+            setattr(cls, name, self._wrap(func, stats))
+        self._start = time.perf_counter_ns()
+        self.enabled = True
+        return
+
+    def disable(self):
+        """
+        Restores the original methods.
+
+        Returns
+        -------
+        None.
+
+        """
+        if not self.enabled:
+            return
+        for cls, name, func in self._originals:
+            setattr(cls, name, func)
+        self._originals = []
+        self.enabled = False
+        return
+
+    def _wrap(self, func, stats):
+        """
+        Creates the wrapper that replaces a hooked method.
+
+        Parameters
+        ----------
+        func : function
+            The original method.
+        stats : HookStats
+            The statistics of the method.
+
+        Returns
+        -------
+        function
+            The wrapper.
+
+        """
+        clock = time.perf_counter_ns
+        sample_every = self.sample_every
+
+        def sampled(args, kwargs):
+            # tracing is only switched on for the sampled call so it does
+            # not slow down the other calls. The time of the sampled call is
+            # not counted since tracing slows it down.
+            tracemalloc.start()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                current, peak = tracemalloc.get_traced_memory()
+                snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+                stats.samples += 1
+                stats.peak_bytes += peak
+                stats.net_blocks += sum(stat.count for stat in snapshot.statistics('filename'))
+                stats.net_bytes += current
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            stats.calls += 1
+            if (sample_every and stats.calls % sample_every == 0 
+                and not tracemalloc.is_tracing()):
+                return sampled(args, kwargs)
+            stats.timed_calls += 1
+            t0 = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats.ns += clock() - t0
+
+        return wrapper
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.disable()
+        return False
+
+    def report(self):
+        """
+        Returns the statistics of each hooked method.
+
+        Returns
+        -------
+        dict
+            The configuration, the Python version, the wall clock time since
+            the profiler was enabled, and the statistics of each hooked
+            method.
+
+        """
+        wall_ns = time.perf_counter_ns() - self._start if self._start is not None else 0
+        return {'config': config_name(),
+                'python': sys.version.split()[0],
+                'wall_ns': wall_ns,
+                'hooks': {key: stats.as_dict() for key, stats in sorted(self.stats.items())}}
+
+    def dump(self, path=None):
+        """
+        Writes the report to a JSON file.
+
+        Parameters
+        ----------
+        path : str, optional
+            The file to write. Defaults to
+            Profiles/profile_<configuration>_<timestamp>.json.
+
+        Returns
+        -------
+        str
+            The file that was written.
+
+        """
+        if path is None:
+            path = ('Profiles/profile_' + config_name() + '_'
+                    + time.strftime('%Y%m%d-%H%M%S') + '.json')
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+        return path
+
+
+def format_report(report):
+    """
+    Formats a report as a table with 1 line per hooked method.
+
+    Parameters
+    ----------
+    report : dict
+        A report returned by Profiler.report.
+
+    Returns
+    -------
+    str
+        The table.
+
+    """
+    s = '{:<32}{:>12}{:>14}{:>12}{:>14}{:>12}\n'.format(
+        'hook', 'calls', 'total ms', 'mean us', 'peak B/call', 'net blk')
+    for key, h in report['hooks'].items():
+        s += '{:<32}{:>12}{:>14.1f}{:>12.2f}{:>14.0f}{:>12.2f}\n'.format(
+            key, h['calls'], h['total_ns'] / 1e6, h['mean_ns'] / 1e3,
+            h['peak_bytes_per_call'], h['net_blocks_per_call'])
+    return s
+
+
+def compare(old, new):
+    """
+    Compares the mean time per call of each hooked method between 2 reports,
+    e.g. from 2 different builds.
+
+    Parameters
+    ----------
+    old : dict or str
+        The report of the baseline, or the file it was written to.
+    new : dict or str
+        The report to compare to the baseline, or the file it was written to.
+
+    Returns
+    -------
+    str
+        A table with the mean time per call in each report and the relative
+        change.
+
+    """
+    if isinstance(old, str):
+        with open(old) as f:
+            old = json.load(f)
+    if isinstance(new, str):
+        with open(new) as f:
+            new = json.load(f)
+
+    s = '{:<32}{:>12}{:>12}{:>10}\n'.format('hook', 'old us', 'new us', 'change')
+    for key in sorted(set(old['hooks']) | set(new['hooks'])):
+        old_mean = old['hooks'].get(key, {}).get('mean_ns', 0) / 1e3
+        new_mean = new['hooks'].get(key, {}).get('mean_ns', 0) / 1e3
+        if old_mean > 0:
+            change = '{:+.1%}'.format(new_mean / old_mean - 1)
+        else:
+            change = 'n/a'
+        s += '{:<32}{:>12.2f}{:>12.2f}{:>10}\n'.format(key, old_mean, new_mean, change)
+    return s
+
+
+if __name__ == '__main__':
+    # compare 2 reports, e.g. python profiler.py old.json new.json
+    print(compare(sys.argv[1], sys.argv[2]))
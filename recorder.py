@@ -0,0 +1,284 @@
+"""
+Recording of the time steps of training and evaluation, and offline training
+from the recordings.
+
+A TrajectoryRecorder writes each time step as a RECORD_DTYPE record (the
+arguments of Tables.update_enums and flags marking the ends of episodes)
+into chunk files of chunk_records records, as .npy files or as compressed
+.npz files. The chunks of a run are stored in
+Trajectories/<configuration>/<run>/. replay streams the chunks of runs back
+through the learner of TD_METHOD, reading the .npy chunks through memory
+maps, so the tables can be rebuilt without simulating, or rebuilt with
+another LEARNING_RATE or DISCOUNT_FACTOR, e.g.
+
+    WAREHOUSE_LEARNING_RATE=0.2 python recorder.py Trajectories/3x2grid_1robots_2stacks_1items/*
+"""
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+
+from tables import Tables, TRANSITION_DTYPE
+from traces import learner
+from util import config_name
+from warehouse_parameters import TD_METHOD
+
+# the flags of a record
+END_EPISODE = 1  # the last time step of a training episode
+ONE_STEP = 2     # a one-step update outside the learner, e.g. in evaluation
+
+# a TRANSITION_DTYPE record with flags
+RECORD_DTYPE = np.dtype(TRANSITION_DTYPE.descr + [('flags', np.int8)])
+
+class TrajectoryRecorder:
+    """
+    Writes the time steps of a run to chunk files.
+
+    Attributes
+    ----------
+    path : str
+        The directory of the run.
+    chunk_records : int
+        The number of records per chunk file.
+    compress : bool
+        Whether the chunks are compressed .npz files instead of .npy files.
+    records : int
+        The number of records written.
+    """
+
+    def __init__(self, path=None, chunk_records=65536, compress=False):
+        """
+        Creates a TrajectoryRecorder and the directory of its run.
+
+        Parameters
+        ----------
+        path : str, optional
+            The directory of the run. Defaults to
+            Trajectories/<configuration>/<date and time>.
+        chunk_records : int
+            The number of records per chunk file.
+        compress : bool
+            Whether to write compressed .npz files instead of .npy files.
+
+        Returns
+        -------
+        None.
+
+        """
+        if path is None:
+            path = os.path.join('Trajectories', config_name(), time.strftime('%Y%m%d_%H%M%S'))
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.chunk_records = chunk_records
+        self.compress = compress
+        self.records = 0
+        self._chunk = np.empty(chunk_records, dtype=RECORD_DTYPE)
+        self._length = 0
+        self._chunks = 0
+        return
+
+    def record(self, s1, s2, a, c, s1num=None, s2num=None, one_step=False):
+        """
+        Records a time step. The parameters are the same as Tables.update,
+        and one_step.
+
+        Parameters
+        ----------
+        s1 : State
+            The previous state.
+        s2 : State
+            The resulting state after taking an action.
+        a : Actions
+            The actions taken.
+        c : int
+            The cost recieved at that time step.
+        s1num : int, optional
+            The enumeration of the previous state, if it is already known.
+        s2num : int, optional
+            The enumeration of the resulting state, if it is already known.
+        one_step : bool
+            Whether the time step was a one-step update of the tables instead
+            of an update of the learner.
+
+        Returns
+        -------
+        None.
+
+        """
+        # a full chunk is only written with the next record, so the end of
+        # an episode can still be marked on its last record
+        if self._length == self.chunk_records:
+            self.flush()
+        if s1num is None:
+            s1num = s1.enum()
+        if s2num is None:
+            s2num = s2.enum()
+        same_locs = s1.robot_locs == s2.robot_locs and s1.stack_locs == s2.stack_locs
+        self._chunk[self._length] = (s1num, s2num, a.enum(), c, same_locs,
+                                     ONE_STEP if one_step else 0)
+        self._length += 1
+        self.records += 1
+        return
+
+    def end_episode(self):
+        """
+        Marks the last recorded time step as the end of an episode.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self._length > 0:
+            self._chunk[self._length - 1]['flags'] |= END_EPISODE
+        return
+
+    def flush(self):
+        """
+        Writes the records that have not been written to a new chunk file.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self._length == 0:
+            return
+        name = os.path.join(self.path, 'chunk_{:06d}'.format(self._chunks))
+        if self.compress:
+            np.savez_compressed(name + '.npz', records=self._chunk[:self._length])
+        else:
+            np.save(name + '.npy', self._chunk[:self._length])
+        self._chunks += 1
+        self._length = 0
+        return
+
+    def close(self):
+        """
+        Writes the remaining records.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.flush()
+        return
+
+
+def chunks(paths):
+    """
+    Finds the chunk files of runs, in the order they were written.
+
+    Parameters
+    ----------
+    paths : [str]
+        The directories of the runs, or chunk files.
+
+    Returns
+    -------
+    [str]
+        The chunk files.
+
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, 'chunk_*.np[yz]')))
+        else:
+            files.append(path)
+    return files
+
+
+def read_chunk(path):
+    """
+    Opens a chunk file. A .npy chunk is memory mapped instead of read.
+
+    Parameters
+    ----------
+    path : str
+        The chunk file.
+
+    Returns
+    -------
+    NumPy Array
+        The records of the chunk.
+
+    """
+    if path.endswith('.npz'):
+        with np.load(path) as data:
+            return data['records']
+    return np.load(path, mmap_mode='r')
+
+
+def replay(paths, tables=None, passes=1, batch=65536, method=TD_METHOD):
+    """
+    Trains tables with recorded time steps, in the order they were recorded.
+    The learner of method is given the time steps and the ends of the
+    episodes, and the one-step time steps update the tables directly.
+
+    Chunks of TRANSITION_DTYPE records, which have no flags, can only be
+    replayed with method 'one_step'.
+
+    Parameters
+    ----------
+    paths : [str]
+        The directories of the runs, or chunk files.
+    tables : Tables, optional
+        The tables to train. Defaults to new tables.
+    passes : int
+        The number of times the recordings are replayed.
+    batch : int
+        The number of records read from a chunk at a time.
+    method : str
+        The method of the learner, one of traces.METHODS.
+
+    Returns
+    -------
+    Tables
+        The trained tables.
+
+    """
+    if tables is None:
+        tables = Tables()
+    updater = learner(tables, method)
+    files = chunks(paths)
+    for p in range(passes):
+        for path in files:
+            records = read_chunk(path)
+            if records.dtype == TRANSITION_DTYPE and method == 'one_step':
+                for start in range(0, len(records), batch):
+                    for s1num, s2num, anum, c, same_locs in records[start:start + batch].tolist():
+                        tables.update_enums(s1num, s2num, anum, c, same_locs)
+                continue
+            if records.dtype == TRANSITION_DTYPE:
+                raise ValueError('The chunk ' + path + ' has no episode ends, so it can only '
+                                 + "be replayed with method 'one_step'")
+            if records.dtype != RECORD_DTYPE:
+                raise ValueError('Not a trajectory chunk: ' + path)
+            for start in range(0, len(records), batch):
+                for s1num, s2num, anum, c, same_locs, flags in records[start:start + batch].tolist():
+                    if flags & ONE_STEP:
+                        tables.update_enums(s1num, s2num, anum, c, same_locs)
+                    else:
+                        updater.update_enums(s1num, s2num, anum, c, same_locs)
+                    if flags & END_EPISODE and updater is not tables:
+                        updater.end_episode()
+    return tables
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Train the tables of the current configuration from recorded runs.')
+    parser.add_argument('paths', nargs='+', help='run directories or chunk files')
+    parser.add_argument('--passes', type=int, default=1)
+    parser.add_argument('--continue', dest='resume', action='store_true',
+                        help='continue from the saved tables instead of new tables')
+    args = parser.parse_args()
+    tables = Tables()
+    if args.resume:
+        tables.read_tables()
+    replay(args.paths, tables, args.passes)
+    tables.save_tables()
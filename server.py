@@ -0,0 +1,633 @@
+"""
+A local simulation server for controllers outside this repository.
+
+The server hosts many Environment instances and exposes create, reset,
+step, observe, close and stats over a compact binary protocol, on a Unix
+socket or a localhost TCP port, so a controller can drive the simulator at
+high request rates without starting Python for every run. Requests from all
+clients are queued and run in batches: each batch runs every request that
+arrived while the previous batch was running, in the order they arrived, and
+each client's responses are written at once. Requests of a connection are
+answered in the order they were sent, so a client can pipeline them.
+
+Every message is a frame: a little-endian uint32 length followed by the
+payload. A request payload is REQUEST (op, request id, environment id)
+followed by the body of its op, and a response payload is RESPONSE (status,
+request id) followed by an OBSERVATION, the JSON stats, or a UTF-8 error
+message if the status is ERROR:
+
+    CREATE   body: int64 seed, -1 for none   response: OBSERVATION
+    RESET    body: none                      response: OBSERVATION
+    STEP     body: uint32 joint action enum  response: OBSERVATION
+    OBSERVE  body: none                      response: OBSERVATION
+    CLOSE    body: none                      response: none
+    STATS    body: none                      response: JSON
+
+An OBSERVATION is the environment id, the state enumeration (see State.enum
+and State.set_by_enum), the number of time steps since the last reset and
+the cost of the last time step. For example:
+
+    python server.py --unix /tmp/warehouse.sock
+    python server.py --unix /tmp/warehouse.sock --bench --clients 4
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import random
+import socket
+import struct
+import time
+from collections import namedtuple
+
+from actions import Actions, NUM_JOINT_ACTIONS
+from environment import Environment
+from latency import QuantileSketch
+
+CREATE, RESET, STEP, OBSERVE, CLOSE, STATS = range(1, 7)
+OK, ERROR = 0, 1
+
+LENGTH = struct.Struct('<I')
+REQUEST = struct.Struct('<BII')
+RESPONSE = struct.Struct('<BI')
+SEED = struct.Struct('<q')
+ACTION = struct.Struct('<I')
+OBSERVATION = struct.Struct('<IQII')
+
+Observation = namedtuple('Observation', ['env_id', 'state', 'time', 'cost'])
+
+class SimulatorServer:
+    """
+    Hosts environments and runs the requests of its clients in batches.
+
+    An environment created with a seed has its own random number generator
+    state, which is swapped into the random module around each of its
+    requests, so its episodes only depend on its seed and its actions. The
+    other environments share the random module.
+
+    Attributes
+    ----------
+    max_envs : int
+        The largest number of environments.
+    max_batch : int
+        The largest number of requests per batch.
+    batch_window : float
+        The number of seconds a batch waits for more requests after its first
+        request arrives.
+    envs : dict
+        The environment of each environment id.
+    """
+
+    def __init__(self, max_envs=10000, max_batch=4096, batch_window=0.0):
+        """
+        Creates a SimulatorServer with no environments.
+
+        Parameters
+        ----------
+        max_envs : int
+            The largest number of environments.
+        max_batch : int
+            The largest number of requests per batch.
+        batch_window : float
+            The number of seconds a batch waits for more requests after its
+            first request arrives. With 0, a batch only waits for the
+            requests that have already been received.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.max_envs = max_envs
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.envs = {}
+        self._rngs = {}
+        self._times = {}
+        self._costs = {}
+        self._next_id = 0
+        self._pending = []
+        self._ready = None
+        self._start = time.perf_counter()
+        self._latency = QuantileSketch()
+        self._requests = 0
+        self._steps = 0
+        self._batches = 0
+        self._largest_batch = 0
+        self._errors = 0
+        return
+
+    async def serve(self, path=None, host='127.0.0.1', port=7878):
+        """
+        Serves clients until cancelled.
+
+        Parameters
+        ----------
+        path : str, optional
+            The path of a Unix socket to listen on instead of a TCP port.
+        host : str
+            The host of the TCP port.
+        port : int
+            The TCP port.
+
+        Returns
+        -------
+        None.
+
+        """
+        self._ready = asyncio.Event()
+        if path is not None:
+            server = await asyncio.start_unix_server(self._handle, path=path)
+        else:
+            server = await asyncio.start_server(self._handle, host, port)
+        batcher = asyncio.ensure_future(self._batcher())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+        return
+
+    async def _handle(self, reader, writer):
+        """
+        Queues the requests of a connection.
+        """
+        sock = writer.get_extra_info('socket')
+        if sock is not None and sock.family != socket.AF_UNIX:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            while True:
+                (length,) = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+                payload = await reader.readexactly(length)
+                self._pending.append((time.perf_counter_ns(), payload, writer))
+                self._ready.set()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+        return
+
+    async def _batcher(self):
+        """
+        Runs the queued requests in batches.
+        """
+        while True:
+            await self._ready.wait()
+            # let the connections queue the requests they have received
+            await asyncio.sleep(self.batch_window)
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            if not self._pending:
+                self._ready.clear()
+
+            responses = {}
+            for received, payload, writer in batch:
+                responses.setdefault(writer, []).append(self.execute(payload))
+            now = time.perf_counter_ns()
+            for received, payload, writer in batch:
+                self._latency.add((now - received) / 1000)
+            for writer, frames in responses.items():
+                if not writer.is_closing():
+                    writer.write(b''.join(frames))
+            self._requests += len(batch)
+            self._batches += 1
+            self._largest_batch = max(self._largest_batch, len(batch))
+            for writer in responses:
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    pass
+
+    def execute(self, payload):
+        """
+        Runs a request.
+
+        Parameters
+        ----------
+        payload : bytes
+            The payload of the request frame.
+
+        Returns
+        -------
+        bytes
+            The response frame.
+
+        """
+        request_id = 0
+        try:
+            op, request_id, env_id = REQUEST.unpack_from(payload)
+            if op == CREATE:
+                (seed,) = SEED.unpack_from(payload, REQUEST.size)
+                body = self._create(None if seed < 0 else seed)
+            elif op == STATS:
+                body = json.dumps(self.stats()).encode()
+            else:
+                if env_id not in self.envs:
+                    raise KeyError('unknown environment ' + str(env_id))
+                if op == STEP:
+                    (anum,) = ACTION.unpack_from(payload, REQUEST.size)
+                    if anum >= NUM_JOINT_ACTIONS:
+                        raise ValueError('unknown joint action ' + str(anum))
+                    body = self._run(env_id, self._step, Actions.by_enum(anum))
+                elif op == RESET:
+                    body = self._run(env_id, self._reset)
+                elif op == OBSERVE:
+                    body = self._observe(env_id)
+                elif op == CLOSE:
+                    self._close(env_id)
+                    body = b''
+                else:
+                    raise ValueError('unknown op ' + str(op))
+            status = OK
+        except (struct.error, KeyError, ValueError, MemoryError) as e:
+            self._errors += 1
+            status = ERROR
+            body = str(e.args[0] if e.args else e).encode()
+        response = RESPONSE.pack(status, request_id) + body
+        return LENGTH.pack(len(response)) + response
+
+    def _create(self, seed):
+        """
+        Creates an environment in a new random state.
+        """
+        if len(self.envs) >= self.max_envs:
+            raise MemoryError('the server already has ' + str(self.max_envs) + ' environments')
+        env_id = self._next_id
+        self._next_id += 1
+        self.envs[env_id] = Environment(object())
+        if seed is not None:
+            self._rngs[env_id] = random.Random(seed).getstate()
+        self._times[env_id] = 0
+        self._costs[env_id] = 0
+        return self._run(env_id, self._reset)
+
+    def _run(self, env_id, method, *args):
+        """
+        Runs a method of the server for an environment, with the random
+        number generator state of the environment if it has one.
+        """
+        rng = self._rngs.get(env_id)
+        if rng is None:
+            return method(env_id, *args)
+        saved = random.getstate()
+        random.setstate(rng)
+        try:
+            return method(env_id, *args)
+        finally:
+            self._rngs[env_id] = random.getstate()
+            random.setstate(saved)
+
+    def _reset(self, env_id):
+        """
+        Starts a new episode of an environment.
+        """
+        self.envs[env_id].reset()
+        self._times[env_id] = 0
+        self._costs[env_id] = 0
+        return self._observe(env_id)
+
+    def _step(self, env_id, a):
+        """
+        Simulates a time step of an environment.
+        """
+        env = self.envs[env_id]
+        env.state = env.calculate_state(env.state, a)
+        cost = env.cost
+        env.update_cost()
+        self._times[env_id] += 1
+        self._costs[env_id] = env.cost - cost
+        self._steps += 1
+        return self._observe(env_id)
+
+    def _observe(self, env_id):
+        """
+        Returns the OBSERVATION of an environment.
+        """
+        return OBSERVATION.pack(env_id, self.envs[env_id].state.enum(), self._times[env_id],
+                                self._costs[env_id])
+
+    def _close(self, env_id):
+        """
+        Removes an environment.
+        """
+        del self.envs[env_id]
+        self._rngs.pop(env_id, None)
+        del self._times[env_id]
+        del self._costs[env_id]
+        return
+
+    def stats(self):
+        """
+        Returns the statistics of the server.
+
+        Returns
+        -------
+        dict
+            The number of environments, requests, time steps, batches and
+            errors, the mean and largest number of requests per batch, the
+            time steps and requests per second since the server was created,
+            and the mean, p50, p95, p99 and max of the time in microseconds
+            from receiving a request to writing its response.
+
+        """
+        uptime = time.perf_counter() - self._start
+        sketch = self._latency
+        return {'envs': len(self.envs),
+                'requests': self._requests,
+                'steps': self._steps,
+                'batches': self._batches,
+                'errors': self._errors,
+                'mean_batch': self._requests / self._batches if self._batches else None,
+                'max_batch': self._largest_batch,
+                'steps_per_sec': self._steps / uptime,
+                'requests_per_sec': self._requests / uptime,
+                'latency_us': {'mean': sketch.total / sketch.count if sketch.count else None,
+                               'p50': sketch.quantile(0.5),
+                               'p95': sketch.quantile(0.95),
+                               'p99': sketch.quantile(0.99),
+                               'max': sketch.max if sketch.count else None}}
+
+
+class SimulatorClient:
+    """
+    A blocking client of a SimulatorServer.
+
+    Attributes
+    ----------
+    sock : socket
+        The connection to the server.
+    """
+
+    def __init__(self, path=None, host='127.0.0.1', port=7878):
+        """
+        Connects to a server.
+
+        Parameters
+        ----------
+        path : str, optional
+            The path of the Unix socket of the server instead of a TCP port.
+        host : str
+            The host of the TCP port.
+        port : int
+            The TCP port.
+
+        Returns
+        -------
+        None.
+
+        """
+        if path is not None:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(path)
+        else:
+            self.sock = socket.create_connection((host, port))
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self.sock.makefile('rb')
+        self._next_id = 0
+        return
+
+    def _frame(self, op, env_id=0, body=b''):
+        """
+        Returns the frame of a request.
+        """
+        self._next_id = (self._next_id + 1) % 2**32
+        payload = REQUEST.pack(op, self._next_id, env_id) + body
+        return LENGTH.pack(len(payload)) + payload
+
+    def _receive(self):
+        """
+        Reads a response, raising a RuntimeError if the request failed.
+        """
+        (length,) = LENGTH.unpack(self._file.read(LENGTH.size))
+        payload = self._file.read(length)
+        status, request_id = RESPONSE.unpack_from(payload)
+        body = payload[RESPONSE.size:]
+        if status != OK:
+            raise RuntimeError(body.decode())
+        return body
+
+    def _call(self, frames):
+        """
+        Sends request frames at once and returns the bodies of their
+        responses.
+        """
+        self.sock.sendall(b''.join(frames))
+        return [self._receive() for _ in frames]
+
+    def create(self, seed=None):
+        """
+        Creates an environment in a new random state.
+
+        Parameters
+        ----------
+        seed : int, optional
+            The seed of the environment's own random number generator.
+
+        Returns
+        -------
+        Observation
+            The first observation of the environment.
+
+        """
+        body = SEED.pack(-1 if seed is None else seed)
+        return Observation(*OBSERVATION.unpack(self._call([self._frame(CREATE, 0, body)])[0]))
+
+    def reset(self, env_id):
+        """
+        Starts a new episode of an environment.
+
+        Parameters
+        ----------
+        env_id : int
+            The environment id.
+
+        Returns
+        -------
+        Observation
+            The first observation of the episode.
+
+        """
+        return Observation(*OBSERVATION.unpack(self._call([self._frame(RESET, env_id)])[0]))
+
+    def step(self, env_id, action):
+        """
+        Simulates a time step of an environment.
+
+        Parameters
+        ----------
+        env_id : int
+            The environment id.
+        action : int
+            The enumeration of the joint action, see Actions.enum.
+
+        Returns
+        -------
+        Observation
+            The observation after the time step.
+
+        """
+        return self.step_many([env_id], [action])[0]
+
+    def step_many(self, env_ids, actions):
+        """
+        Simulates a time step of each of several environments, sending all
+        the requests before reading the responses.
+
+        Parameters
+        ----------
+        env_ids : [int]
+            The environment ids.
+        actions : [int]
+            The enumeration of the joint action of each environment.
+
+        Returns
+        -------
+        [Observation]
+            The observation of each environment after its time step.
+
+        """
+        frames = [self._frame(STEP, env_id, ACTION.pack(a)) for env_id, a in zip(env_ids, actions)]
+        return [Observation(*OBSERVATION.unpack(body)) for body in self._call(frames)]
+
+    def observe(self, env_id):
+        """
+        Returns the current observation of an environment.
+
+        Parameters
+        ----------
+        env_id : int
+            The environment id.
+
+        Returns
+        -------
+        Observation
+            The observation.
+
+        """
+        return Observation(*OBSERVATION.unpack(self._call([self._frame(OBSERVE, env_id)])[0]))
+
+    def close_env(self, env_id):
+        """
+        Removes an environment from the server.
+
+        Parameters
+        ----------
+        env_id : int
+            The environment id.
+
+        Returns
+        -------
+        None.
+
+        """
+        self._call([self._frame(CLOSE, env_id)])
+        return
+
+    def stats(self):
+        """
+        Returns the statistics of the server, see SimulatorServer.stats.
+
+        Returns
+        -------
+        dict
+            The statistics.
+
+        """
+        return json.loads(self._call([self._frame(STATS)])[0])
+
+    def close(self):
+        """
+        Closes the connection.
+
+        Returns
+        -------
+        None.
+
+        """
+        self._file.close()
+        self.sock.close()
+        return
+
+
+def benchmark(path=None, host='127.0.0.1', port=7878, n_envs=64, n_steps=200, seed=0):
+    """
+    Steps environments of a server with random actions as fast as possible.
+
+    Parameters
+    ----------
+    path : str, optional
+        The path of the Unix socket of the server.
+    host : str
+        The host of the TCP port of the server.
+    port : int
+        The TCP port of the server.
+    n_envs : int
+        The number of environments, which are stepped together.
+    n_steps : int
+        The number of time steps of each environment.
+    seed : int
+        The seed of the environments and the actions.
+
+    Returns
+    -------
+    dict
+        The number of time steps, the time steps per second and the mean
+        round trip time of a batch of steps in microseconds.
+
+    """
+    client = SimulatorClient(path, host, port)
+    rng = random.Random(seed)
+    env_ids = [client.create(seed * n_envs + i).env_id for i in range(n_envs)]
+    start = time.perf_counter()
+    for _ in range(n_steps):
+        client.step_many(env_ids, [rng.randrange(NUM_JOINT_ACTIONS) for _ in env_ids])
+    elapsed = time.perf_counter() - start
+    for env_id in env_ids:
+        client.close_env(env_id)
+    client.close()
+    return {'steps': n_envs * n_steps,
+            'steps_per_sec': n_envs * n_steps / elapsed,
+            'round_trip_us': elapsed / n_steps * 1e6}
+
+
+def _benchmark_process(results, *args):
+    results.put(benchmark(*args))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the simulator to external controllers.')
+    parser.add_argument('--unix', default=None, help='path of a Unix socket')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7878)
+    parser.add_argument('--max-envs', type=int, default=10000)
+    parser.add_argument('--max-batch', type=int, default=4096)
+    parser.add_argument('--batch-window', type=float, default=0.0,
+                        help='seconds a batch waits for more requests')
+    parser.add_argument('--bench', action='store_true', help='benchmark a running server')
+    parser.add_argument('--clients', type=int, default=1, help='benchmark client processes')
+    parser.add_argument('--envs', type=int, default=64, help='environments per benchmark client')
+    parser.add_argument('--steps', type=int, default=200, help='time steps per environment')
+    args = parser.parse_args()
+
+    if args.bench:
+        results = mp.Queue()
+        clients = [mp.Process(target=_benchmark_process,
+                              args=(results, args.unix, args.host, args.port, args.envs, args.steps, i))
+                   for i in range(args.clients)]
+        for process in clients:
+            process.start()
+        client_results = [results.get() for _ in clients]
+        for process in clients:
+            process.join()
+        for i, result in enumerate(client_results):
+            print('client {}: {:.0f} steps/s, {:.0f} us per batch of {} steps'.format(
+                i, result['steps_per_sec'], result['round_trip_us'], args.envs))
+        client = SimulatorClient(args.unix, args.host, args.port)
+        print(json.dumps(client.stats(), indent=2))
+        client.close()
+    else:
+        server = SimulatorServer(args.max_envs, args.max_batch, args.batch_window)
+        try:
+            asyncio.run(server.serve(args.unix, args.host, args.port))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,315 @@
+import time
+
+from agent import Agent
+from environment import Environment
+from evaluator import SequentialEvaluator
+from latency import OrderLatencyTracker
+from traces import learner
+from warehouse_parameters import EVAL_TOLERANCE, TD_METHOD
+
+class Session:
+    """
+    A training session that keeps 1 set of tables in memory for training,
+    evaluation and saving.
+
+    The tables are read from the csvs once, when the session is created, and
+    are only written by checkpoint. Evaluation uses the tables of the session
+    directly, so it sees every update made by train, and it does not change
+    them unless learn is True.
+
+    Attributes
+    ----------
+    env : Environment
+        The environment used for training. Its agent owns the tables.
+    metrics : TrainingMetrics or None
+        The telemetry of training.
+    monitor : ConvergenceMonitor or None
+        Stops training once it has converged.
+    recorder : TrajectoryRecorder or None
+        Records every time step the tables are updated with, so replaying
+        the recording rebuilds the tables.
+    store : ArtifactStore or None
+        Keeps a copy of the tables at every scored checkpoint.
+    shadow : ShadowEvaluator or None
+        Evaluates the greedy policy in another process during training.
+    steps : int
+        The number of time steps the tables have been updated with since the
+        last checkpoint.
+    reads : int
+        The number of times the tables were read from the csvs.
+    saves : int
+        The number of times the tables were saved to the csvs.
+    evaluation : dict or None
+        The score of the last evaluation, the half-width of its confidence
+        interval and the number of episodes used, and the summary of the 
+        waits of the orders if they were measured.
+    """
+
+    def __init__(self, overwrite=False, metrics=None, monitor=None, recorder=None, store=None,
+                 shadow=None, tables=None, td_method=TD_METHOD):
+        """
+        Creates a Session and reads the saved tables.
+
+        Parameters
+        ----------
+        overwrite : bool
+            If True, start from new tables instead of the saved ones.
+        metrics : TrainingMetrics, optional
+            The telemetry of training.
+        monitor : ConvergenceMonitor, optional
+            Stops training once it has converged.
+        recorder : TrajectoryRecorder, optional
+            Records every time step the tables are updated with.
+        store : ArtifactStore, optional
+            Keeps a copy of the tables at every scored checkpoint.
+        shadow : ShadowEvaluator, optional
+            Evaluates the greedy policy in another process during training.
+        tables : Tables, optional
+            The tables to train. Defaults to new tables.
+        td_method : str
+            How the q-values are updated, see traces.METHODS.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.env = Environment(Agent(tables))
+        self.metrics = metrics
+        self.monitor = monitor
+        self.recorder = recorder
+        self.store = store
+        self.shadow = shadow
+        self.steps = 0
+        self.reads = 0
+        self.saves = 0
+        self.evaluation = None
+        if not overwrite:
+            self.env.agent.tables.read_tables()
+            self.reads += 1
+        self.updater = learner(self.env.agent.tables, td_method)
+        return
+
+    @property
+    def tables(self):
+        """
+        The tables of the session.
+        """
+        return self.env.agent.tables
+
+    @property
+    def converged(self):
+        """
+        Whether the monitor has decided that training has converged.
+        """
+        return self.monitor is not None and self.monitor.reason is not None
+
+    def train(self, n_reps=1000, n_iter=30):
+        """
+        Trains the tables with the min visits policy.
+
+        Parameters
+        ----------
+        n_reps : int
+            The number of episodes.
+        n_iter : int
+            The number of time steps per episode.
+
+        Returns
+        -------
+        bool
+            A boolean value indicating if training stopped because it
+            converged.
+
+        """
+        env = self.env
+        metrics = self.metrics
+        monitor = self.monitor
+        recorder = self.recorder
+        shadow = self.shadow
+        updater = self.updater
+        # the number of iterations in the performance table only changes at
+        # checkpoints, so it is read once
+        iterations = env.agent.tables.iterations()
+        # the enumeration of each state is computed once and reused by the
+        # policy and the update
+        clock = time.perf_counter_ns
+        for rep in range(n_reps):
+            env.state.reset()
+            snum = env.state.enum()
+            for time_step in range(n_iter):
+                t0 = clock()
+                a = env.agent.min_visits_policy(env.state, snum)
+                t1 = clock()
+                previous_state = env.state
+                env.state = env.calculate_state(env.state, a)
+                env.update_cost()
+                t2 = clock()
+                previous_snum = snum
+                snum = env.state.enum()
+                t3 = clock()
+                td_error = updater.update(previous_state, env.state, a, sum(env.state.orders),
+                                          previous_snum, snum)
+                if metrics is not None:
+                    metrics.step(td_error, t1 - t0, t2 - t1, t3 - t2, clock() - t3)
+                if monitor is not None:
+                    monitor.step(previous_snum, td_error)
+                if recorder is not None:
+                    recorder.record(previous_state, env.state, a, sum(env.state.orders),
+                                    previous_snum, snum)
+            self.steps += n_iter
+            if updater is not env.agent.tables:
+                updater.end_episode()
+            if recorder is not None:
+                recorder.end_episode()
+            if metrics is not None:
+                metrics.episode(env.agent.tables)
+            if shadow is not None:
+                shadow.step(env.agent.tables, iterations + self.steps)
+            if monitor is not None and monitor.check(env):
+                break
+        if metrics is not None:
+            metrics.emit(env.agent.tables)
+        return self.converged
+
+    def evaluate(self, n_reps=1000, n_iter=50, show=0, learn=False, tolerance=None, latency=False):
+        """
+        Evaluates the greedy policy of the tables.
+        
+        If a tolerance is given, the evaluation stops once the half-width of
+        the 95% confidence interval of the score is at most tolerance, see 
+        SequentialEvaluator.
+
+        Parameters
+        ----------
+        n_reps : int
+            The largest number of episodes.
+        n_iter : int
+            The number of time steps per episode.
+        show : int
+            The number of time steps to print before the episodes.
+        learn : bool
+            If True, the tables are also updated with the time steps.
+        tolerance : float, optional
+            The largest half-width of the confidence interval of the score.
+        latency : bool
+            If True, also measure how long the orders wait during the 
+            episodes, see OrderLatencyTracker.
+
+        Returns
+        -------
+        float
+            The average cost per time step.
+
+        """
+        # a separate environment, so the state of training is not changed
+        env = Environment(self.env.agent)
+        for time_step in range(show):
+            print('\n')
+            print("t = " + str(time_step))
+            print(env)
+            a = env.agent.greedy_policy(env.state)
+            print("actions = " + str(a))
+            print('state = ' + str(env.state.enum()) + ', action = ' + str(a.enum()))
+            self._evaluation_step(env, a, learn)
+
+        evaluator = SequentialEvaluator(tolerance, min_episodes=min(30, n_reps), max_episodes=n_reps)
+        env.cost = 0
+        if latency:
+            env.latency = OrderLatencyTracker()
+        for rep in range(n_reps):
+            env.reset()
+            cost = env.cost
+            for time_step in range(n_iter):
+                self._evaluation_step(env, env.agent.greedy_policy(env.state), learn)
+            if evaluator.add((env.cost - cost)/n_iter):
+                break
+
+        self.evaluation = evaluator.result()
+        score = env.cost/n_iter/self.evaluation['episodes']
+        print('\nscore = ' + str(score) + ' (' + str(self.evaluation['episodes']) + ' episodes)')
+        if latency:
+            waits = env.latency.summary()
+            self.evaluation['latency'] = waits
+            print('order wait: p50 = ' + str(waits['p50']) + ', p95 = ' + str(waits['p95'])
+                  + ', p99 = ' + str(waits['p99']) + ', max = ' + str(waits['max'])
+                  + ' (' + str(waits['fulfilled']) + ' fulfilled, ' 
+                  + str(waits['unfinished']) + ' unfinished)')
+        return score
+
+    def _evaluation_step(self, env, a, learn):
+        """
+        Simulates 1 time step of evaluation.
+        """
+        previous_state = env.state
+        env.state = env.calculate_state(env.state, a)
+        env.update_cost()
+        if learn:
+            self.tables.update(previous_state, env.state, a, sum(env.state.orders))
+            self.steps += 1
+            # the time steps of a read-only evaluation are not recorded, so
+            # the recording only has the updates of the tables
+            if self.recorder is not None:
+                self.recorder.record(previous_state, env.state, a, sum(env.state.orders),
+                                     one_step=True)
+        return
+
+    def checkpoint(self, score=None, stop=None):
+        """
+        Saves the tables, adding a row to the performance table if a score is
+        given. Scored tables are also added to the store of the session.
+
+        Parameters
+        ----------
+        score : float, optional
+            The score of the greedy policy.
+        stop : str, optional
+            Why training stopped.
+
+        Returns
+        -------
+        None.
+
+        """
+        if score is not None:
+            self.tables.performance_update(self.steps, score, stop)
+            self.steps = 0
+        self.tables.save_tables()
+        self.saves += 1
+        if score is not None and self.store is not None:
+            self.store.put(self.tables)
+        return
+
+    def round(self, n_reps=1000, n_iter=30, eval_reps=1000, eval_iter=50, tolerance=EVAL_TOLERANCE):
+        """
+        Trains, evaluates and saves the tables.
+
+        Parameters
+        ----------
+        n_reps : int
+            The number of training episodes.
+        n_iter : int
+            The number of time steps per training episode.
+        eval_reps : int
+            The number of evaluation episodes.
+        eval_iter : int
+            The number of time steps per evaluation episode.
+        tolerance : float or None
+            The largest half-width of the confidence interval of the score,
+            or None to always simulate eval_reps episodes.
+
+        Returns
+        -------
+        bool
+            A boolean value indicating if training stopped because it
+            converged.
+
+        """
+        converged = self.train(n_reps, n_iter)
+        stop = self.monitor.summary() if self.monitor is not None else None
+        score = self.evaluate(eval_reps, eval_iter, tolerance=tolerance)
+        self.checkpoint(score, stop)
+        if self.metrics is not None:
+            self.metrics.log(event='evaluate', steps=self.metrics.steps, score=score, stop=stop,
+                             episodes=self.evaluation['episodes'])
+        return converged
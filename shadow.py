@@ -0,0 +1,252 @@
+"""
+Continuous evaluation of the greedy policy in a separate process while
+training.
+
+Every `every` training steps, the trainer sends a snapshot of the greedy
+action of each state (Tables.greedy_actions, not the q-values) to a shadow
+process, which scores it with its own simulator and sends back the
+(iteration, score) point. The trainer never waits for the shadow process: a
+snapshot is skipped if the previous one has not been picked up yet, and the
+points are added to Tables.performance whenever the trainer polls for them.
+The simulator of the shadow process is seeded the same way for every
+snapshot, so the points of the learning curve are compared on the same
+episodes and the random numbers of training are not used.
+"""
+import multiprocessing as mp
+import queue
+import random
+
+from evaluator import evaluate
+from pipeline import SharedPolicy
+
+def _run(snapshots, results, num_states, n_reps, n_iter, seed):
+    """
+    Scores the snapshots until it receives None.
+
+    Parameters
+    ----------
+    snapshots : Queue
+        The (iteration, greedy actions) snapshots.
+    results : Queue
+        The (iteration, score) points.
+    num_states : int
+        The number of states.
+    n_reps : int
+        The number of episodes per snapshot.
+    n_iter : int
+        The number of time steps per episode.
+    seed : int
+        The seed of the simulator.
+
+    Returns
+    -------
+    None.
+
+    """
+    policy = SharedPolicy(num_states)
+    while True:
+        snapshot = snapshots.get()
+        if snapshot is None:
+            break
+        iteration, greedy = snapshot
+        policy.publish(greedy)
+        random.seed(seed)
+        result = evaluate(policy.greedy_policy, n_iter, tolerance=None, max_episodes=n_reps)
+        results.put((iteration, result['score']))
+    return
+
+
+class ShadowEvaluator:
+    """
+    Evaluates snapshots of the greedy policy in a shadow process during
+    training.
+
+    Attributes
+    ----------
+    every : int
+        The number of training steps between snapshots.
+    n_reps : int
+        The number of episodes per snapshot.
+    n_iter : int
+        The number of time steps per episode.
+    seed : int
+        The seed of the simulator of the shadow process.
+    submitted : int
+        The number of snapshots sent to the shadow process.
+    skipped : int
+        The number of snapshots skipped because the shadow process was busy.
+    points : [(int, float)]
+        The (iteration, score) points received.
+    """
+
+    def __init__(self, every=10000, n_reps=100, n_iter=50, seed=0):
+        """
+        Creates a ShadowEvaluator. The shadow process is started by start.
+
+        Parameters
+        ----------
+        every : int
+            The number of training steps between snapshots.
+        n_reps : int
+            The number of episodes per snapshot.
+        n_iter : int
+            The number of time steps per episode.
+        seed : int
+            The seed of the simulator of the shadow process.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.every = every
+        self.n_reps = n_reps
+        self.n_iter = n_iter
+        self.seed = seed
+        self.submitted = 0
+        self.skipped = 0
+        self.points = []
+        self._last = None
+        self._process = None
+        return
+
+    def start(self, num_states):
+        """
+        Starts the shadow process.
+
+        Parameters
+        ----------
+        num_states : int
+            The number of states.
+
+        Returns
+        -------
+        None.
+
+        """
+        self._snapshots = mp.Queue(maxsize=1)
+        self._results = mp.Queue()
+        self._process = mp.Process(target=_run, args=(self._snapshots, self._results, num_states,
+                                                      self.n_reps, self.n_iter, self.seed),
+                                   daemon=True)
+        self._process.start()
+        return
+
+    def step(self, tables, iteration):
+        """
+        Sends a snapshot if at least `every` training steps have passed since
+        the last one, and adds the points received so far to the performance
+        table. This never waits for the shadow process.
+
+        Parameters
+        ----------
+        tables : Tables
+            The tables being trained.
+        iteration : int
+            The total number of training steps of the tables.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self._process is None:
+            self.start(tables.num_states)
+        if self._last is None or iteration - self._last >= self.every:
+            self.submit(tables, iteration)
+        self.poll(tables)
+        return
+
+    def submit(self, tables, iteration):
+        """
+        Sends a snapshot of the greedy policy, unless the shadow process has
+        not picked up the previous snapshot yet.
+
+        Parameters
+        ----------
+        tables : Tables
+            The tables being trained.
+        iteration : int
+            The total number of training steps of the tables.
+
+        Returns
+        -------
+        bool
+            A boolean value indicating if the snapshot was sent.
+
+        """
+        iteration = int(iteration)
+        self._last = iteration
+        # the greedy actions are only computed if there is room for them
+        if self._snapshots.full():
+            self.skipped += 1
+            return False
+        try:
+            self._snapshots.put_nowait((iteration, tables.greedy_actions()))
+        except queue.Full:
+            self.skipped += 1
+            return False
+        self.submitted += 1
+        return True
+
+    def poll(self, tables=None):
+        """
+        Adds the points received from the shadow process to the performance
+        table.
+
+        Parameters
+        ----------
+        tables : Tables, optional
+            The tables whose performance table the points are added to.
+
+        Returns
+        -------
+        [(int, float)]
+            The new points.
+
+        """
+        points = []
+        while True:
+            try:
+                points.append(self._results.get_nowait())
+            except queue.Empty:
+                break
+        for iteration, score in points:
+            if tables is not None:
+                tables.performance_point(iteration, score)
+        self.points.extend(points)
+        return points
+
+    def close(self, tables=None):
+        """
+        Waits for the shadow process to score the last snapshot and stops it.
+
+        Parameters
+        ----------
+        tables : Tables, optional
+            The tables whose performance table the last points are added to.
+
+        Returns
+        -------
+        [(int, float)]
+            The points received since the last poll.
+
+        """
+        if self._process is None:
+            return []
+        self._snapshots.put(None)
+        points = []
+        # the points are read before joining, so the shadow process is not
+        # blocked writing them
+        while self._process.is_alive() or not self._results.empty():
+            try:
+                points.append(self._results.get(timeout=0.1))
+            except queue.Empty:
+                pass
+        self._process.join()
+        self._process = None
+        for iteration, score in points:
+            if tables is not None:
+                tables.performance_point(iteration, score)
+        self.points.extend(points)
+        return points
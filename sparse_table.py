@@ -0,0 +1,463 @@
+import tempfile
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+# multiplier used for Fibonacci hashing of the state enumerations
+_GOLDEN = 0x9E3779B97F4A7C15
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+
+_EMPTY = -1
+_DELETED = -2
+
+class SparseTable:
+    """
+    A table with 1 row per state that only allocates the rows of states that
+    have been visited.
+
+    The rows are stored in an arena, a 2D NumPy Array that doubles in size
+    when it runs out of room. An open addressing hash table with linear
+    probing maps the enumeration of each state to the slot of its row in the
+    arena. The first time a row is accessed it is allocated and initialized
+    to a copy of the fill row, or to the row returned by init if it is 
+    given.
+
+    Indexing works like a 2D NumPy Array for a single state. table[s] returns
+    the row of state s as a NumPy Array that can be modified in place, and
+    table[s, a] reads or writes a single value. The view returned by table[s]
+    should not be kept after another row is accessed since the arena may be
+    reallocated.
+
+    If max_rows is given, at most max_rows rows are kept in memory. When
+    another row is needed, the least recently used row is spilled to a file
+    on disk and is read back the next time it is accessed.
+
+    Attributes
+    ----------
+    shape : (int, int)
+        The number of states and the length of each row.
+    dtype : NumPy dtype
+        The type of the values in the table.
+    fill : NumPy Array
+        The values that each row is initialized to.
+    max_rows : int or None
+        The largest number of rows that are kept in memory.
+    """
+
+    def __init__(self, num_states, fill, capacity=1024, max_rows=None, spill_path=None, init=None):
+        """
+        Creates an empty SparseTable.
+
+        Parameters
+        ----------
+        num_states : int
+            The number of states.
+        fill : NumPy Array
+            The row that new rows are initialized to. The dtype of the table
+            is the dtype of this row.
+        capacity : int
+            The number of rows that the arena initially has room for.
+        max_rows : int or None
+            The largest number of rows that are kept in memory. If None, rows
+            are never evicted.
+        spill_path : str or None
+            The file that evicted rows are written to. If None and max_rows is
+            given, a temporary file is used.
+        init : function or None
+            A function that is given an array of state enumerations and 
+            returns their initial rows. If None, rows are initialized to the
+            fill row.
+
+        Returns
+        -------
+        None.
+
+        """
+        if max_rows is not None and max_rows < 2:
+            raise ValueError('max_rows must be at least 2.')
+
+        self.fill = np.array(fill)
+        self.dtype = self.fill.dtype
+        self.shape = (num_states, len(self.fill))
+        self.max_rows = max_rows
+        self.init = init
+
+        if max_rows is not None:
+            capacity = min(capacity, max_rows)
+        self._rows = np.empty((capacity, self.shape[1]), dtype=self.dtype)
+        self._used = 0
+        self._free = []
+        self._size = 0
+
+        self._init_hash(16)
+
+        # least recently used order of the rows in memory
+        self._recent = OrderedDict() if max_rows is not None else None
+
+        # offsets of the rows that have been spilled to disk
+        self._spilled = {}
+        self._spill_path = spill_path
+        self._spill_file = None
+        return
+
+    def _init_hash(self, size):
+        """
+        Replaces the hash table with an empty one that has size buckets.
+
+        Parameters
+        ----------
+        size : int
+            The number of buckets. Must be a power of 2.
+
+        Returns
+        -------
+        None.
+
+        """
+        self._keys = array('q', [_EMPTY]) * size
+        self._slots = array('q', [0]) * size
+        self._shift = 64 - (size.bit_length() - 1)
+        self._filled = 0
+        return
+
+    def _bucket(self, key):
+        """
+        Finds the bucket of a key in the hash table.
+
+        Parameters
+        ----------
+        key : int
+            The enumeration of a state.
+
+        Returns
+        -------
+        int
+            The bucket that contains the key or, if the key is not in the
+            hash table, the bucket the key should be inserted into.
+        bool
+            Boolean value indicating if the key was found.
+
+        """
+        keys = self._keys
+        mask = len(keys) - 1
+        i = ((key * _GOLDEN) & _MASK64) >> self._shift
+        deleted = -1
+        while True:
+            k = keys[i]
+            if k == key:
+                return i, True
+            elif k == _EMPTY:
+                return (i if deleted == -1 else deleted), False
+            elif k == _DELETED and deleted == -1:
+                deleted = i
+            i = (i + 1) & mask
+
+    def _rehash(self, size):
+        """
+        Moves all keys into a new hash table with size buckets.
+
+        Parameters
+        ----------
+        size : int
+            The number of buckets. Must be a power of 2.
+
+        Returns
+        -------
+        None.
+
+        """
+        old_keys = self._keys
+        old_slots = self._slots
+        self._init_hash(size)
+        for k, slot in zip(old_keys, old_slots):
+            if k >= 0:
+                i, _ = self._bucket(k)
+                self._keys[i] = k
+                self._slots[i] = slot
+                self._filled += 1
+        return
+
+    def _slot(self, key):
+        """
+        Returns the slot of a state's row in the arena, allocating the row if
+        the state has not been visited before.
+
+        Parameters
+        ----------
+        key : int
+            The enumeration of a state.
+
+        Returns
+        -------
+        int
+            The slot of the row in the arena.
+
+        """
+        i, found = self._bucket(key)
+        if found:
+            slot = self._slots[i]
+            if self._recent is not None:
+                self._recent.move_to_end(key)
+            return slot
+
+        if not 0 <= key < self.shape[0]:
+            raise IndexError('State ' + str(key) + ' is out of range.')
+
+        if self._recent is not None and self._size >= self.max_rows:
+            self._evict()
+            i, _ = self._bucket(key)
+
+        slot = self._allocate()
+        if key in self._spilled:
+            self._spill_file.seek(self._spilled[key])
+            data = self._spill_file.read(self._rows.itemsize * self.shape[1])
+            self._rows[slot] = np.frombuffer(data, dtype=self.dtype)
+        elif self.init is not None:
+            self._rows[slot] = self.init(np.array([key]))[0]
+        else:
+            self._rows[slot] = self.fill
+
+        if self._keys[i] == _EMPTY:
+            self._filled += 1
+        self._keys[i] = key
+        self._slots[i] = slot
+        self._size += 1
+        if self._recent is not None:
+            self._recent[key] = None
+
+        if self._filled * 10 > len(self._keys) * 7:
+            self._rehash(len(self._keys) * 2 if self._size * 2 > len(self._keys) else len(self._keys))
+        return slot
+
+    def _allocate(self):
+        """
+        Returns an unused slot in the arena, doubling the size of the arena
+        if it is full.
+
+        Returns
+        -------
+        int
+            An unused slot in the arena.
+
+        """
+        if self._free:
+            return self._free.pop()
+        if self._used == len(self._rows):
+            capacity = len(self._rows) * 2
+            if self.max_rows is not None:
+                capacity = min(capacity, self.max_rows)
+            rows = np.empty((capacity, self.shape[1]), dtype=self.dtype)
+            rows[:self._used] = self._rows[:self._used]
+            self._rows = rows
+        self._used += 1
+        return self._used - 1
+
+    def _evict(self):
+        """
+        Spills the least recently used row to disk and frees its slot.
+
+        Returns
+        -------
+        None.
+
+        """
+        key, _ = self._recent.popitem(last=False)
+        i, _ = self._bucket(key)
+        slot = self._slots[i]
+
+        if self._spill_file is None:
+            if self._spill_path is None:
+                self._spill_file = tempfile.TemporaryFile()
+            else:
+                self._spill_file = open(self._spill_path, 'w+b')
+        if key in self._spilled:
+            self._spill_file.seek(self._spilled[key])
+        else:
+            self._spill_file.seek(0, 2)
+            self._spilled[key] = self._spill_file.tell()
+        self._spill_file.write(self._rows[slot].tobytes())
+
+        self._keys[i] = _DELETED
+        self._free.append(slot)
+        self._size -= 1
+        return
+
+    def __contains__(self, key):
+        """
+        Determine if a state has been visited.
+
+        Parameters
+        ----------
+        key : int
+            The enumeration of a state.
+
+        Returns
+        -------
+        bool
+            A boolean value indicating if the state's row has been allocated.
+
+        """
+        return self._bucket(key)[1] or key in self._spilled
+
+    def __len__(self):
+        """
+        Returns the number of states.
+
+        Returns
+        -------
+        int
+            The number of states.
+
+        """
+        return self.shape[0]
+
+    def __getitem__(self, idx):
+        """
+        Returns the row of a state or a single value in the row.
+
+        Parameters
+        ----------
+        idx : int or (int, int)
+            The enumeration of a state, or the enumeration of a state and a
+            column of its row.
+
+        Returns
+        -------
+        NumPy Array or scalar
+            The row of the state or the value in the row.
+
+        """
+        # find the slot before indexing the arena since allocating the row may
+        # reallocate the arena
+        if isinstance(idx, tuple):
+            key, col = idx
+            slot = self._slot(key)
+            return self._rows[slot][col]
+        slot = self._slot(idx)
+        return self._rows[slot]
+
+    def __setitem__(self, idx, value):
+        """
+        Sets the row of a state or a single value in the row.
+
+        Parameters
+        ----------
+        idx : int or (int, int)
+            The enumeration of a state, or the enumeration of a state and a
+            column of its row.
+        value : NumPy Array or scalar
+            The new values.
+
+        Returns
+        -------
+        None.
+
+        """
+        if isinstance(idx, tuple):
+            key, col = idx
+            slot = self._slot(key)
+            self._rows[slot][col] = value
+        else:
+            slot = self._slot(idx)
+            self._rows[slot] = value
+        return
+
+    def items(self):
+        """
+        Iterates over the rows that have been allocated, including the rows
+        that have been spilled to disk.
+
+        Yields
+        ------
+        int
+            The enumeration of a state.
+        NumPy Array
+            A copy of the row of the state.
+
+        """
+        for k, slot in zip(self._keys, self._slots):
+            if k >= 0:
+                yield k, self._rows[slot].copy()
+        for k, offset in self._spilled.items():
+            if not self._bucket(k)[1]:
+                self._spill_file.seek(offset)
+                data = self._spill_file.read(self._rows.itemsize * self.shape[1])
+                yield k, np.frombuffer(data, dtype=self.dtype).copy()
+
+    def count_nonzero(self):
+        """
+        Counts the nonzero values in the rows that have been allocated.
+
+        Returns
+        -------
+        int
+            The number of nonzero values.
+
+        """
+        return sum(int(np.count_nonzero(row)) for _, row in self.items())
+
+    @property
+    def nbytes(self):
+        """
+        The number of bytes of memory used by the arena and the hash table.
+
+        Returns
+        -------
+        int
+            The number of bytes used.
+
+        """
+        return (self._rows.nbytes
+                + self._keys.itemsize * len(self._keys)
+                + self._slots.itemsize * len(self._slots))
+
+    def save(self, path):
+        """
+        Save the allocated rows to a .npz file.
+
+        Parameters
+        ----------
+        path : str
+            The file to save the rows to.
+
+        Returns
+        -------
+        None.
+
+        """
+        keys = []
+        rows = []
+        for k, row in self.items():
+            keys.append(k)
+            rows.append(row)
+        rows = np.array(rows, dtype=self.dtype).reshape(len(keys), self.shape[1])
+        np.savez(path, keys=np.array(keys, dtype=np.int64), rows=rows)
+        return
+
+    def load(self, path):
+        """
+        Overwrite the table with rows saved by the save method.
+
+        Parameters
+        ----------
+        path : str
+            The file to read the rows from.
+
+        Returns
+        -------
+        None.
+
+        """
+        data = np.load(path)
+        self._rows = np.empty((len(self._rows), self.shape[1]), dtype=self.dtype)
+        self._used = 0
+        self._free = []
+        self._size = 0
+        self._init_hash(16)
+        if self._recent is not None:
+            self._recent.clear()
+        self._spilled = {}
+        for k, row in zip(data['keys'], data['rows']):
+            self[int(k)] = row
+        return
@@ -1,10 +1,12 @@
 import random
-import copy
 
 from location import Location
-from util import nCr
+from util import nCr, rank_combination, unrank_combination
 from warehouse_parameters import N_ROWS, N_COLS, N_ROBOTS, N_STACKS, N_ITEMS
 
+POSSIBLE_ORDERS = (N_ITEMS+1)**N_STACKS
+POSSIBLE_STACKS_ORDERS = nCr(N_ROWS * N_COLS + 1, N_STACKS) * POSSIBLE_ORDERS
+
 class State:
     """
     The state of the environment.
@@ -135,8 +137,8 @@ class State:
         values. Second, enumerate the locations of the stacks and multiply
         this value by the number of possible orders values. Last, enumerate 
         the number of possible orders values. Add all these together to get 
-        the final enumeration of the state.
-        
+        the final enumeration of the state. The robot and stack locations are
+        enumerated from their ranks with util.rank_combination.
         
         Returns
         -------
@@ -144,66 +146,50 @@ class State:
             The enumeration of the state.
 
         """
-        ## enumerate the location of robots
-        enum_robots = 0
-        locations = copy.deepcopy(self.valid_locations)
-        for i in range(N_ROBOTS):
-            idx = locations.index(self.robot_locs[i])
-            if i == N_ROBOTS - 1:
-                enum_robots += idx
-            else:
-                locations = locations[1:]
-                for j in range(idx):
-                    enum_robots += nCr(len(locations), N_ROBOTS - i - 1)
-                    locations = locations[1:]
-            
-        possible_stacks_orders = (nCr(N_ROWS * N_COLS + 1, N_STACKS)
-                                  * (N_ITEMS+1)**N_STACKS)
+        n_locs = N_ROWS * N_COLS + 1
+        enum_robots = rank_combination([loc.rank for loc in self.robot_locs], n_locs)
+        enum_stacks = rank_combination([loc.rank for loc in self.stack_locs], n_locs)
         
-        
-        ## enumerate the locations of stacks
-        enum_stacks = 0
-        locations = copy.deepcopy(self.valid_locations)
-        for i in range(N_STACKS):
-            idx = locations.index(self.stack_locs[i])
-            if i == N_STACKS - 1:
-                enum_stacks += idx
-            else:
-                locations = locations[1:]
-                for j in range(idx):
-                    enum_stacks += nCr(len(locations), N_STACKS - i - 1)
-                    locations = locations[1:]
-            
-        possible_orders = (N_ITEMS+1)**N_STACKS
-            
         ## enumerate the order state variable
         enum_orders = 0
         for i in range(N_STACKS):
             enum_orders += self.orders[i] * (N_ITEMS+1)**(N_STACKS-1-i)
             
-        enum = (enum_robots * possible_stacks_orders
-               + enum_stacks * possible_orders
+        enum = (enum_robots * POSSIBLE_STACKS_ORDERS
+               + enum_stacks * POSSIBLE_ORDERS
                + enum_orders)
         return enum
     
     def set_by_enum(self, num):
-        # possible_stacks_orders = (nCr(N_ROWS * N_COLS, N_STACKS)
-        #                           * (ITEMS_PER_STACK+1)**N_STACKS)
-        
-        # possible_orders = (ITEMS_PER_STACK+1)**N_STACKS
-        
-        # enum_robots = int(num / possible_stacks_orders)
-        
-        # cnt = 0
-        # robot_locs = list(range(N_ROBOTS))
-        # for i in range(N_ROBOTS):
-            
-        
-        # enum_stacks = int(num / possible_orders) % possible_stacks_orders
+        """
+        Sets the robot/stack locations and orders to the state with a given 
+        enumeration. This is the inverse of the enum method.
+
+        Parameters
+        ----------
+        num : int
+            The enumeration of the state.
+
+        Returns
+        -------
+        None.
+
+        """
+        n_locs = N_ROWS * N_COLS + 1
+        possible_stacks_orders = nCr(n_locs, N_STACKS) * (N_ITEMS+1)**N_STACKS
+        possible_orders = (N_ITEMS+1)**N_STACKS
         
-        # enum_orders = num % possible_orders
+        enum_robots = num // possible_stacks_orders
+        enum_stacks = num % possible_stacks_orders // possible_orders
+        enum_orders = num % possible_orders
         
-        return 
+        self.robot_locs = [self.valid_locations[idx] 
+                           for idx in unrank_combination(enum_robots, n_locs, N_ROBOTS)]
+        self.stack_locs = [self.valid_locations[idx] 
+                           for idx in unrank_combination(enum_stacks, n_locs, N_STACKS)]
+        self.orders = [enum_orders // (N_ITEMS+1)**(N_STACKS-1-i) % (N_ITEMS+1) 
+                       for i in range(N_STACKS)]
+        return
     
     def grid(self):
         """
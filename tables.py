@@ -2,8 +2,18 @@ import numpy as np
 import pandas as pd
 
 from actions import Actions
-from util import nCr
-from warehouse_parameters import N_ROWS, N_COLS, N_ROBOTS, N_STACKS, N_ITEMS, LEARNING_RATE, DISCOUNT_FACTOR
+from capacity import available_memory, backend_bytes, recommend
+from heuristic import DistanceHeuristic
+from memmap_table import MemmapTable
+from sparse_table import SparseTable
+from util import config_name, state_count
+from warehouse_parameters import N_ROWS, N_COLS, N_ROBOTS, N_STACKS, LEARNING_RATE, DISCOUNT_FACTOR
+from warehouse_parameters import QVALS_DTYPE, QVALS_INIT, VISITS_DTYPE, TABLE_BACKEND, SPARSE_MAX_ROWS
+from warehouse_parameters import MEMMAP_ROW_ORDER, MEMMAP_CACHE_ROWS
+
+# a fixed-width record of 1 time step, with the arguments of update_enums
+TRANSITION_DTYPE = np.dtype([('s1', np.int64), ('s2', np.int64), ('a', np.int32),
+                             ('cost', np.int32), ('same_locs', np.bool_)])
 
 class Tables:
     """
@@ -16,8 +26,35 @@ class Tables:
     not change the robot/stack locations each time an action does not change 
     the robot/stack locations.
     
+    The number of states grows combinatorially with the size of the grid, so 
+    the tables are stored as compactly as possible. The q-values are stored 
+    as QVALS_DTYPE (float32 by default, float16 is also supported), the 
+    visits are stored as VISITS_DTYPE (uint32 by default) and saturate 
+    instead of overflowing, and the same_locs table is stored as a packed bit
+    array with 1 bit per action. The same_locs_row, set_same_locs and 
+    add_visits methods should be used to read and write these tables.
+    
+    With the 'dense' backend every table is a NumPy Array that is allocated 
+    up front. With the 'sparse' backend every table is a SparseTable that 
+    only allocates the rows of states that have been visited, which allows 
+    training on grids whose state space is too large to allocate. With the 
+    'memmap' backend the qvals and visits tables are MemmapTables stored in 
+    temporary files in the Memmap folder with a small cache of rows in 
+    memory, which allows training with tables that are larger than the 
+    available memory. All backends are indexed the same way, e.g. qvals[s] is
+    the row of q-values for state s and qvals[s, a] is the q-value of action 
+    a. The rows of the memmap backend are read-only, so values are changed 
+    with qvals[s, a] = value.
+    
     Attributes
     ----------
+    backend : str
+        The storage backend of the tables, either 'dense', 'sparse' or 
+        'memmap'.
+    num_states : int
+        The number of states.
+    num_actions : int
+        The number of actions.
     qvals : NumPy Array
         An array containing estimates of the q-value for each state and 
         action. The array has 1 row for each state and 1 column for each 
@@ -26,25 +63,43 @@ class Tables:
         An array containing the number of times each action has been taken in
         each state. The array has 1 row for each state and 1 column for each 
         action.
+    max_visits : int or float
+        The largest count that the visits table can hold. Visit counts stop 
+        increasing once they reach this value.
     same_locs : NumPy Array
-        An array that indicates which actions do not change the locations of
-        the robots/stacks for each state. A 1 indicates the location stays the 
-        same after taking an action in a state. A 0 indicates the location 
-        changes after taking an action in a state or that the action has not
-        been tried in that state yet. The array has 1 row for each state and 1 
-        column for each action.
+        A packed bit array that indicates which actions do not change the 
+        locations of the robots/stacks for each state. A 1 indicates the 
+        location stays the same after taking an action in a state. A 0 
+        indicates the location changes after taking an action in a state or 
+        that the action has not been tried in that state yet. The array has 1 
+        row for each state and 1 bit for each action, with the bits of each 
+        row packed into bytes by np.packbits.
+    visited : int
+        The number of state/action pairs that have been visited at least 
+        once.
     performance : Pandas DataFrame
         A dataframe indicating the performance of the greedy policy after 
-        training for some number of iterations.
+        training for some number of iterations, and why training stopped if 
+        it was stopped early. The rows added by a ShadowEvaluator during 
+        training have the source 'shadow'.
     """
     
-    def __init__(self):
+    def __init__(self, qvals_dtype=QVALS_DTYPE, visits_dtype=VISITS_DTYPE, 
+                 backend=TABLE_BACKEND, max_rows=SPARSE_MAX_ROWS, 
+                 row_order=MEMMAP_ROW_ORDER, cache_rows=MEMMAP_CACHE_ROWS, 
+                 qvals_init=QVALS_INIT):
         """
         Initializes the tables.
         
         The q-values are initialized to a value of 10 since 10 seemed like an
         average q-value after the first 100000 iterations of training.
         
+        If qvals_init is 'distance', the q-values of each state are instead 
+        initialized to a lower bound of its cost-to-go computed from the 
+        shortest path distances of the grid, see DistanceHeuristic. The 
+        dense and memmap backends fill every row in bulk and the sparse 
+        backend computes each row when it is first used.
+        
         The visits are initialized to zero since no actions have been taken 
         yet.
 
@@ -55,25 +110,109 @@ class Tables:
         
         Many times these tables are overwritten by csvs that have been saved
         after many iterations of training.
+        
+        Before the dense and memmap backends allocate their tables, the memory
+        they need is compared to the available memory, and a MemoryError 
+        that names a backend that fits is raised if there is not enough, 
+        instead of running out of memory part way through the allocation. 
+        See capacity.py.
+        
+        Parameters
+        ----------
+        qvals_dtype : str or NumPy dtype
+            The floating point type used to store the q-values.
+        visits_dtype : str or NumPy dtype
+            The type used to store the visits. Integer types saturate at their
+            largest value.
+        backend : str
+            The storage backend of the tables, either 'dense', 'sparse' or 
+            'memmap'.
+        max_rows : int or None
+            The largest number of rows of each table that the sparse backend 
+            keeps in memory before spilling the least recently used rows to
+            disk. If None, rows are never spilled.
+        row_order : str
+            The order of the rows in the files of the memmap backend, either
+            'robots' or 'stacks'. See MemmapTable.
+        cache_rows : int
+            The number of rows of each table that the memmap backend keeps in
+            memory.
+        qvals_init : str
+            How the q-values are initialized, either 'constant' or 
+            'distance'.
     
         Returns
         -------
         None.
 
         """
-        num_states = (nCr(N_ROWS*N_COLS+1, N_ROBOTS) 
-                      * nCr(N_ROWS*N_COLS+1, N_STACKS)    
-                      * (N_ITEMS+1)**N_STACKS)
-        num_actions = len(Actions().valid_actions)**N_ROBOTS
+        self.num_states = state_count()
+        self.num_actions = len(Actions().valid_actions)**N_ROBOTS
+        
+        self.backend = backend
         
-        self.qvals = np.ones((num_states, num_actions)) * (N_ROWS + N_COLS - 1) * N_STACKS
-        self.visits = np.zeros((num_states, num_actions))
-        self.same_locs = np.concatenate((np.ones((1, num_states)), 
-                                         np.zeros((num_actions-1, num_states)))).transpose()
-        self.performance = pd.DataFrame([], columns=['iters', 'score'])
+        if backend in ('dense', 'memmap'):
+            memory, disk = backend_bytes(backend, self.num_states, self.num_actions, 
+                                         qvals_dtype, visits_dtype, cache_rows=cache_rows)
+            available = available_memory()
+            if available is not None and memory > available:
+                # the sparse backend is sized for 10 million training steps
+                suggestion, reason = recommend(self.num_states, self.num_actions, 10**7, 
+                                               available, None, qvals_dtype, visits_dtype,
+                                               max_rows)
+                raise MemoryError('the ' + backend + ' tables need ' + str(memory) 
+                                  + ' bytes of memory but only ' + str(available) 
+                                  + ' bytes are available; '
+                                  + ('use TABLE_BACKEND=' + suggestion + ', ' 
+                                     if suggestion is not None else '') + reason)
+        
+        qvals_row = np.full(self.num_actions, (N_ROWS + N_COLS - 1) * N_STACKS, dtype=qvals_dtype)
+        if qvals_init == 'constant':
+            init = None
+        elif qvals_init == 'distance':
+            heuristic = DistanceHeuristic()
+            init = lambda snums: heuristic.rows(snums, self.num_actions, qvals_row.dtype)
+        else:
+            raise ValueError('Unknown q-value initialization: ' + str(qvals_init))
+        visits_row = np.zeros(self.num_actions, dtype=visits_dtype)
+        # the bits are packed most significant bit first, so the first action
+        # of each row is the 0x80 bit of the first byte
+        same_locs_row = np.zeros((self.num_actions + 7) // 8, dtype=np.uint8)
+        same_locs_row[0] = 0x80
+        
+        if backend == 'dense':
+            if init is None:
+                self.qvals = np.tile(qvals_row, (self.num_states, 1))
+            else:
+                self.qvals = np.empty((self.num_states, self.num_actions), dtype=qvals_row.dtype)
+                for start in range(0, self.num_states, 65536):
+                    snums = np.arange(start, min(start + 65536, self.num_states))
+                    self.qvals[snums] = init(snums)
+            self.visits = np.zeros((self.num_states, self.num_actions), dtype=visits_dtype)
+            self.same_locs = np.tile(same_locs_row, (self.num_states, 1))
+        elif backend == 'sparse':
+            self.qvals = SparseTable(self.num_states, qvals_row, max_rows=max_rows, init=init)
+            self.visits = SparseTable(self.num_states, visits_row, max_rows=max_rows)
+            self.same_locs = SparseTable(self.num_states, same_locs_row, max_rows=max_rows)
+        elif backend == 'memmap':
+            name = config_name()
+            self.qvals = MemmapTable('Memmap', self.num_states, qvals_row, row_order=row_order,
+                                     cache_rows=cache_rows, init=init, prefix='qtable_' + name + '_')
+            self.visits = MemmapTable('Memmap', self.num_states, visits_row, row_order=row_order,
+                                      cache_rows=cache_rows, prefix='visits_' + name + '_')
+            self.same_locs = np.tile(same_locs_row, (self.num_states, 1))
+        else:
+            raise ValueError('Unknown table backend: ' + str(backend))
+        
+        if np.issubdtype(self.visits.dtype, np.integer):
+            self.max_visits = np.iinfo(self.visits.dtype).max
+        else:
+            self.max_visits = np.inf
+        self.visited = 0
+        self.performance = pd.DataFrame([], columns=['iters', 'score', 'stop', 'source'])
         return
     
-    def update(self, s1, s2, a, c):
+    def update(self, s1, s2, a, c, s1num=None, s2num=None):
         """
         Update the values in the Q-table after a time step.
 
@@ -87,10 +226,15 @@ class Tables:
             The actions taken.
         c : int
             The cost recieved at that time step.
+        s1num : int, optional
+            The enumeration of the previous state, if it is already known.
+        s2num : int, optional
+            The enumeration of the resulting state, if it is already known.
 
         Returns
         -------
-        None.
+        float
+            The temporal difference error of the action taken.
 
         """
         # check if locations are the same
@@ -99,31 +243,153 @@ class Tables:
             if s1.robot_locs[i] != s2.robot_locs[i]:
                 same_locs = False
                 break
+        # every stack is compared, not only the stack with the index of the
+        # last robot
         if same_locs:
             for j in range(N_STACKS):
-                if s1.stack_locs[i] != s2.stack_locs[i]:
+                if s1.stack_locs[j] != s2.stack_locs[j]:
                     same_locs = False
                     break
         
-        s1num = s1.enum()
-        s2num = s2.enum()
+        if s1num is None:
+            s1num = s1.enum()
+        if s2num is None:
+            s2num = s2.enum()
         
+        return self.update_enums(s1num, s2num, a.enum(), c, same_locs)
+    
+    def update_enums(self, s1num, s2num, anum, c, same_locs, update_taken=True):
+        """
+        Update the values in the Q-table after a time step given the 
+        enumerations of the states and action.
+        
+        If update_taken is False, the q-value of the action taken is left 
+        unchanged, so that a multi-step method can update it instead. The 
+        visits and same_locs tables, and the q-values of the other actions 
+        that leave the locations unchanged, are still updated.
+
+        Parameters
+        ----------
+        s1num : int
+            The enumeration of the previous state.
+        s2num : int
+            The enumeration of the resulting state.
+        anum : int
+            The enumeration of the actions taken.
+        c : int
+            The cost recieved at that time step.
+        same_locs : bool
+            Whether the robot/stack locations are the same in both states.
+        update_taken : bool
+            Whether the q-value of the action taken is updated.
+
+        Returns
+        -------
+        float
+            The temporal difference error of the action taken.
+
+        """
         if not same_locs:
-            anum = a.enum()
-            self.same_locs[s1num][anum] = 0
+            self.set_same_locs(s1num, anum, False)
             old_val = self.qvals[s1num][anum]
             min_val = min(self.qvals[s2num])
-            self.qvals[s1num][anum] += LEARNING_RATE*(c + DISCOUNT_FACTOR*(min_val) - old_val)
-            self.visits[s1num][anum] += 1
+            td_error = c + DISCOUNT_FACTOR*(min_val) - old_val
+            if update_taken:
+                self.qvals[s1num, anum] += LEARNING_RATE*td_error
+            self.add_visits(s1num, anum)
         else:
             # vectorize updates using numpy arrays
-            self.same_locs[s1num][a.enum()] = 1
-            anums = np.argwhere(self.same_locs[s1num] == 1).flatten()
-            old_vals = self.qvals[s1num][anums]
+            self.set_same_locs(s1num, anum, True)
+            anums = np.flatnonzero(self.same_locs_row(s1num))
+            self.add_visits(s1num, anums)
             min_val = min(self.qvals[s2num])
-            self.qvals[s1num][anums] += LEARNING_RATE*(c + DISCOUNT_FACTOR*(min_val) - old_vals)
-            self.visits[s1num][anums] += 1
+            td_error = c + DISCOUNT_FACTOR*(min_val) - self.qvals[s1num][anum]
+            if not update_taken:
+                anums = anums[anums != anum]
+            old_vals = self.qvals[s1num][anums]
+            self.qvals[s1num, anums] += LEARNING_RATE*(c + DISCOUNT_FACTOR*(min_val) - old_vals)
+
+        return float(td_error)
+    
+    def close(self):
+        """
+        Deletes the temporary files of the memmap backend. The tables can not
+        be used afterwards.
+
+        Returns
+        -------
+        None.
 
+        """
+        if self.backend == 'memmap':
+            self.qvals.close()
+            self.visits.close()
+        return
+    
+    def same_locs_row(self, snum):
+        """
+        Unpack the row of the same_locs table for a state.
+
+        Parameters
+        ----------
+        snum : int
+            The enumeration of the state.
+
+        Returns
+        -------
+        NumPy Array
+            A boolean array with 1 value for each action. True indicates that
+            the action does not change the robot/stack locations.
+
+        """
+        return np.unpackbits(self.same_locs[snum], count=self.num_actions).view(bool)
+    
+    def set_same_locs(self, snum, anum, value):
+        """
+        Set the bit of the same_locs table for a state and action.
+
+        Parameters
+        ----------
+        snum : int
+            The enumeration of the state.
+        anum : int
+            The enumeration of the action.
+        value : bool
+            Whether the action leaves the robot/stack locations unchanged.
+
+        Returns
+        -------
+        None.
+
+        """
+        mask = 0x80 >> (anum & 7)
+        if value:
+            self.same_locs[snum, anum >> 3] |= mask
+        else:
+            self.same_locs[snum, anum >> 3] &= ~mask & 0xFF
+        return
+    
+    def add_visits(self, snum, anums):
+        """
+        Add 1 to the visits of the given actions in a state. Counts that have
+        reached max_visits are left unchanged. The number of visited cells is
+        updated for any action that had not been visited before.
+
+        Parameters
+        ----------
+        snum : int
+            The enumeration of the state.
+        anums : int or NumPy Array
+            The enumeration of the action, or an array of action enumerations.
+
+        Returns
+        -------
+        None.
+
+        """
+        counts = self.visits[snum, anums]
+        self.visited += np.count_nonzero(counts == 0)
+        self.visits[snum, anums] = counts + (counts < self.max_visits)
         return
     
     def read_tables(self):
@@ -131,25 +397,43 @@ class Tables:
         Overwrite the tables with csvs that contain more accurate q-value 
         estimates.
         
-        Read the csvs into Pandas DataFrames and convert these to NumPy Arrays.
+        Read the csvs into Pandas DataFrames and convert these to NumPy Arrays
+        with the dtypes of the tables. The same_locs csv is stored with 1 
+        column per action and is packed into bits when it is read.
+        
+        The sparse backend stores the rows that have been visited in .npz 
+        files instead of csvs. The memmap backend stores the tables in .npy 
+        files, which are copied into the tables' own files in chunks.
 
         Returns
         -------
         None.
 
         """
-        name = (str(N_ROWS) + 'x' + str(N_COLS) + 'grid_' 
-                + str(N_ROBOTS) + 'robots_' + str(N_STACKS) + 'stacks_'
-                + str(N_ITEMS) + 'items')
+        name = config_name()
+        
+        self.performance = pd.read_csv('Performance/performance_' + name + '.csv')
+        if self.backend == 'sparse':
+            self.qvals.load('Q-Tables/qtable_' + name + '.npz')
+            self.visits.load('Visits/visits_' + name + '.npz')
+            self.same_locs.load('SameLocs/samelocs_' + name + '.npz')
+            self.visited = self.visits.count_nonzero()
+            return
+        elif self.backend == 'memmap':
+            self.qvals.load('Q-Tables/qtable_' + name + '.npy')
+            self.visits.load('Visits/visits_' + name + '.npy')
+            self.same_locs = np.load('SameLocs/samelocs_' + name + '.npy')
+            self.visited = self.visits.count_nonzero()
+            return
         
         qvals = pd.read_csv('Q-Tables/qtable_' + name + '.csv')
         visits = pd.read_csv('Visits/visits_' + name + '.csv')
         same_locs = pd.read_csv('SameLocs/samelocs_' + name + '.csv')
-        self.performance = pd.read_csv('Performance/performance_' + name + '.csv')
         
-        self.qvals = np.asarray(qvals)
-        self.visits = np.asarray(visits)
-        self.same_locs = np.asarray(same_locs)
+        self.qvals = np.asarray(qvals, dtype=self.qvals.dtype)
+        self.visits = np.minimum(np.asarray(visits), self.max_visits).astype(self.visits.dtype)
+        self.same_locs = np.packbits(np.asarray(same_locs) != 0, axis=1)
+        self.visited = np.count_nonzero(self.visits)
         return
     
     def save_tables(self):
@@ -157,32 +441,161 @@ class Tables:
         Save the tables to use again later on.
         
         Convert the NumPy Arrays to Pandas DataFrames and save these as csvs.
+        The same_locs table is unpacked so that the csv has 1 column per 
+        action.
+        
+        The sparse backend saves the rows that have been visited to .npz 
+        files instead of csvs. The memmap backend saves the tables to .npy 
+        files.
 
         Returns
         -------
         None.
 
         """
-        name = (str(N_ROWS) + 'x' + str(N_COLS) + 'grid_' 
-                + str(N_ROBOTS) + 'robots_' + str(N_STACKS) + 'stacks_'
-                + str(N_ITEMS) + 'items')
+        name = config_name()
+        
+        self.performance.to_csv('Performance/performance_' + name + '.csv', index=False)
+        if self.backend == 'sparse':
+            self.qvals.save('Q-Tables/qtable_' + name + '.npz')
+            self.visits.save('Visits/visits_' + name + '.npz')
+            self.same_locs.save('SameLocs/samelocs_' + name + '.npz')
+            return
+        elif self.backend == 'memmap':
+            self.qvals.save('Q-Tables/qtable_' + name + '.npy')
+            self.visits.save('Visits/visits_' + name + '.npy')
+            np.save('SameLocs/samelocs_' + name + '.npy', self.same_locs)
+            return
         
         qvals = pd.DataFrame(self.qvals)
         visits = pd.DataFrame(self.visits)
-        same_locs = pd.DataFrame(self.same_locs)
+        same_locs = pd.DataFrame(np.unpackbits(self.same_locs, axis=1, count=self.num_actions))
         
         qvals.to_csv('Q-Tables/qtable_' + name + '.csv', index=False)
         visits.to_csv('Visits/visits_' + name + '.csv', index=False)
         same_locs.to_csv('SameLocs/samelocs_' + name + '.csv', index=False)
-        self.performance.to_csv('Performance/performance_' + name + '.csv', index=False)
         return
     
-    def performance_update(self, iters, score):
-        if len(self.performance) == 0:
-            old_iters = 0
+    def coverage(self):
+        """
+        Returns the fraction of state/action pairs that have been visited at
+        least once.
+
+        Returns
+        -------
+        float
+            The fraction of state/action pairs that have been visited.
+
+        """
+        return self.visited / (self.num_states * self.num_actions)
+    
+    def greedy_actions(self, chunk_rows=65536):
+        """
+        Returns the enumeration of the action with the lowest q-value estimate
+        in every state, as chosen by Agent.greedy_policy.
+        
+        The sparse backend only stores the rows that have been visited. Every 
+        q-value of the other rows is the same, so their greedy action is 0.
+
+        Parameters
+        ----------
+        chunk_rows : int
+            The number of rows of the memmap backend read at a time.
+
+        Returns
+        -------
+        NumPy Array
+            The greedy action of each state.
+
+        """
+        if self.backend == 'dense':
+            return self.qvals.argmin(axis=1).astype(np.int32)
+        
+        greedy = np.zeros(self.num_states, dtype=np.int32)
+        if self.backend == 'sparse':
+            for snum, row in self.qvals.items():
+                greedy[snum] = row.argmin()
         else:
-            old_iters = self.performance.iloc[-1, :]['iters']
-        self.performance = self.performance.append({'iters': iters + old_iters,'score': score}, ignore_index=True)
+            self.qvals.flush()
+            for start in range(0, self.num_states, chunk_rows):
+                snums = np.arange(start, min(start + chunk_rows, self.num_states), dtype=np.int64)
+                greedy[snums] = self.qvals.read_rows(snums).argmin(axis=1)
+        return greedy
+    
+    def storage_stats(self):
+        """
+        Returns statistics about the memory used by the tables.
+        
+        For the memmap backend, the cache and paging statistics of the qvals 
+        and visits tables are included. See MemmapTable.stats.
+
+        Returns
+        -------
+        dict
+            The backend and the number of bytes of memory used by the tables.
+
+        """
+        stats = {'backend': self.backend,
+                 'nbytes': self.qvals.nbytes + self.visits.nbytes + self.same_locs.nbytes}
+        if self.backend == 'memmap':
+            stats['qvals'] = self.qvals.stats()
+            stats['visits'] = self.visits.stats()
+        return stats
+    
+    def performance_update(self, iters, score, stop=None):
+        self.performance.loc[len(self.performance)] = pd.Series({'iters': iters + self.iterations(), 
+                                                                 'score': score, 'stop': stop, 
+                                                                 'source': 'evaluate'})
+        return
+    
+    def performance_point(self, iters, score, source='shadow'):
+        """
+        Adds a score of the greedy policy that was measured during training to
+        the performance table.
+
+        Parameters
+        ----------
+        iters : int
+            The total number of iterations the tables had been trained for.
+        score : float
+            The score of the greedy policy.
+        source : str
+            What measured the score.
+
+        Returns
+        -------
+        None.
+
+        """
+        self._performance_columns()
+        self.performance.loc[len(self.performance)] = pd.Series({'iters': iters, 'score': score,
+                                                                 'stop': None, 'source': source})
+        return
+    
+    def iterations(self):
+        """
+        Returns the number of iterations the tables had been trained for at
+        the last row of the performance table that was not added during 
+        training.
+
+        Returns
+        -------
+        int
+            The number of iterations.
+
+        """
+        self._performance_columns()
+        rows = self.performance[self.performance['source'] != 'shadow']
+        if len(rows) == 0:
+            return 0
+        return rows.iloc[-1]['iters']
+    
+    def _performance_columns(self):
+        # performance files saved before early stopping have no stop column,
+        # and files saved before shadow evaluation have no source column
+        for column in ('stop', 'source'):
+            if column not in self.performance.columns:
+                self.performance[column] = None
         return
         
     
\ No newline at end of file
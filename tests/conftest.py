@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TABLE_DIRS = ('Q-Tables', 'Visits', 'SameLocs', 'Performance', 'Memmap')
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    Runs a test in an empty directory with the folders the tables are saved
+    in, so the saved tables of the repository are not changed.
+    """
+    for name in TABLE_DIRS:
+        (tmp_path / name).mkdir()
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
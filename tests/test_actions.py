@@ -0,0 +1,50 @@
+import os
+import random
+import subprocess
+import sys
+
+from actions import Actions, VALID_ACTIONS, NUM_JOINT_ACTIONS, decode
+from conftest import ROOT
+from warehouse_parameters import N_ROBOTS
+
+def baseline_codes(num):
+    # Actions.set_by_enum of the original code, with integer division
+    return [num // len(VALID_ACTIONS)**(N_ROBOTS - 1 - i) % len(VALID_ACTIONS)
+            for i in range(N_ROBOTS)]
+
+
+def baseline_enum(actions):
+    return sum(VALID_ACTIONS.index(actions[i]) * len(VALID_ACTIONS)**(N_ROBOTS - 1 - i)
+               for i in range(N_ROBOTS))
+
+
+def test_decode_matches_baseline():
+    for num in range(NUM_JOINT_ACTIONS):
+        assert decode(num) == baseline_codes(num)
+        a = Actions.by_enum(num)
+        assert list(a.codes()) == baseline_codes(num)
+        assert a.enum() == num == baseline_enum(a.actions)
+
+
+def test_random_actions_enum_matches_baseline():
+    random.seed(0)
+    for _ in range(100):
+        a = Actions()
+        assert a.enum() == baseline_enum(a.actions)
+        assert Actions.by_enum(a.enum()).actions == tuple(a.actions)
+
+
+def test_many_robots_do_not_overflow():
+    # 9**21 does not fit in 64 bits, so there is no decode table
+    code = ('import random\n'
+            'from actions import Actions, NUM_JOINT_ACTIONS, DECODE_TABLE\n'
+            'assert DECODE_TABLE is None and NUM_JOINT_ACTIONS > 2**63\n'
+            'random.seed(0)\n'
+            'for num in [NUM_JOINT_ACTIONS - 1] + [random.randrange(NUM_JOINT_ACTIONS) for _ in range(200)]:\n'
+            '    assert Actions.by_enum(num).enum() == num\n'
+            '    a = Actions()\n'
+            '    assert Actions.by_enum(a.enum()).actions == tuple(a.actions)\n')
+    env = dict(os.environ, WAREHOUSE_N_ROBOTS='25')
+    proc = subprocess.run([sys.executable, '-c', code], env=env, cwd=ROOT, capture_output=True,
+                          text=True, timeout=120)
+    assert proc.returncode == 0, proc.stderr
@@ -0,0 +1,39 @@
+import random
+
+import numpy as np
+
+from actions import Actions
+from convergence import ConvergenceMonitor
+from environment import Environment
+from session import Session
+from state import State
+from tables import Tables
+from warehouse_parameters import DISCOUNT_FACTOR
+
+def test_monitor_does_not_change_training(workdir):
+    random.seed(0)
+    plain = Session(overwrite=True)
+    plain.train(100, 30)
+    random.seed(0)
+    monitored = Session(overwrite=True, monitor=ConvergenceMonitor(check_every=300, n_samples=20))
+    monitored.train(100, 30)
+    assert len(monitored.monitor.history) > 1
+    assert np.array_equal(monitored.tables.qvals, plain.tables.qvals)
+
+
+def test_bellman_target_is_the_expectation():
+    tables = Tables()
+    tables.qvals[:] = np.random.default_rng(0).uniform(0, 5, tables.qvals.shape)
+    monitor = ConvergenceMonitor()
+    env = Environment(object())
+    state = State()
+    random.seed(1)
+    for snum, anum in [(17, 3), (101, 0), (250, 8)]:
+        exact = monitor._bellman_target(tables, snum, anum, env.order_prob)
+        state.set_by_enum(snum)
+        draws = []
+        for draw in range(20000):
+            new_state = env.calculate_state(state, Actions.by_enum(anum))
+            draws.append(sum(new_state.orders)
+                         + DISCOUNT_FACTOR * float(min(tables.qvals[new_state.enum()])))
+        assert abs(np.mean(draws) - exact) < 4 * np.std(draws) / np.sqrt(len(draws)) + 1e-6
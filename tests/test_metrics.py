@@ -0,0 +1,27 @@
+import json
+
+from metrics import TrainingMetrics
+from session import Session
+from tables import Tables
+
+def records(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_memmap_records_include_storage_stats(workdir):
+    metrics = TrainingMetrics('metrics.jsonl', interval=300)
+    session = Session(overwrite=True, metrics=metrics, tables=Tables(backend='memmap', cache_rows=16))
+    session.train(20, 30)
+    metrics.close()
+    storage = records('metrics.jsonl')[-1]['storage']
+    assert storage['backend'] == 'memmap'
+    assert storage['qvals']['accesses'] > 0 and storage['visits']['writes'] > 0
+
+
+def test_dense_records_have_no_storage_stats(workdir):
+    metrics = TrainingMetrics('metrics.jsonl', interval=300)
+    session = Session(overwrite=True, metrics=metrics, tables=Tables(backend='dense'))
+    session.train(20, 30)
+    metrics.close()
+    assert all('storage' not in record for record in records('metrics.jsonl'))
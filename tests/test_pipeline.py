@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+import threading
+
+import numpy as np
+
+from conftest import ROOT
+from pipeline import TransitionBuffer
+from tables import TRANSITION_DTYPE
+
+def test_put_larger_than_capacity():
+    buffer = TransitionBuffer(capacity=50)
+    records = np.zeros(120, dtype=TRANSITION_DTYPE)
+    records['s1'] = np.arange(120)
+    writer = threading.Thread(target=buffer.put, args=(records,))
+    writer.start()
+    received = []
+    while sum(len(r) for r in received) < 120:
+        received.append(buffer.get(64, timeout=1.0))
+    writer.join(timeout=10)
+    assert not writer.is_alive()
+    assert np.array_equal(np.concatenate(received)['s1'], np.arange(120))
+
+
+def test_train_with_small_capacity(workdir):
+    # each actor writes 120 records at a time, which used to never fit
+    proc = subprocess.run([sys.executable, os.path.join(ROOT, 'pipeline.py'), '--actors', '2',
+                           '--steps', '3000', '--capacity', '100', '--overwrite'],
+                          capture_output=True, text=True, timeout=300)
+    assert proc.returncode == 0, proc.stderr
+    assert "'steps': 3000" in proc.stdout
@@ -0,0 +1,14 @@
+from profiler import Profiler
+from session import Session
+
+def test_trace_updates_are_hooked(workdir):
+    session = Session(overwrite=True, td_method='n_step')
+    profiler = Profiler(sample_every=0)
+    profiler.enable()
+    try:
+        session.train(10, 30)
+    finally:
+        profiler.disable()
+    assert profiler.stats['TraceLearner.update'].calls == 10 * 30
+    assert profiler.stats['Tables.update_enums'].calls == 10 * 30
+    assert profiler.stats['Tables.update'].calls == 0
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from recorder import TrajectoryRecorder, replay
+from session import Session
+from tables import TRANSITION_DTYPE
+
+def test_replay_reproduces_training(workdir):
+    recorder = TrajectoryRecorder('run')
+    session = Session(overwrite=True, recorder=recorder)
+    session.train(50, 30)
+    session.evaluate(20, 50)
+    recorder.close()
+    assert recorder.records == 50 * 30
+    tables = replay(['run'])
+    assert np.array_equal(tables.qvals, session.tables.qvals)
+    assert np.array_equal(tables.visits, session.tables.visits)
+    assert np.array_equal(tables.same_locs, session.tables.same_locs)
+
+
+def test_replay_includes_learning_evaluation(workdir):
+    recorder = TrajectoryRecorder('run')
+    session = Session(overwrite=True, recorder=recorder)
+    session.train(20, 30)
+    session.evaluate(5, 50, learn=True)
+    recorder.close()
+    assert recorder.records == 20 * 30 + 5 * 50
+    assert np.array_equal(replay(['run']).qvals, session.tables.qvals)
+
+
+@pytest.mark.parametrize('method', ['n_step', 'watkins'])
+def test_replay_reproduces_trace_training(workdir, method):
+    recorder = TrajectoryRecorder('run', chunk_records=30)
+    session = Session(overwrite=True, recorder=recorder, td_method=method)
+    session.train(20, 30)
+    session.evaluate(5, 50, learn=True)
+    session.train(10, 30)
+    recorder.close()
+    tables = replay(['run'], method=method)
+    assert np.array_equal(tables.qvals, session.tables.qvals)
+    assert np.array_equal(tables.visits, session.tables.visits)
+
+
+def test_replay_refuses_chunks_without_episode_ends(workdir):
+    np.save('chunk.npy', np.zeros(10, dtype=TRANSITION_DTYPE))
+    replay(['chunk.npy'], method='one_step')
+    with pytest.raises(ValueError):
+        replay(['chunk.npy'], method='n_step')
@@ -0,0 +1,68 @@
+import os
+import random
+import subprocess
+import sys
+
+from conftest import ROOT
+from state import State
+from util import nCr
+from warehouse_parameters import N_ROWS, N_COLS, N_ROBOTS, N_STACKS, N_ITEMS
+
+def baseline_enum(state):
+    # State.enum of the original code
+    def enum_locs(locs, k):
+        enum = 0
+        locations = list(state.valid_locations)
+        for i in range(k):
+            idx = locations.index(locs[i])
+            if i == k - 1:
+                enum += idx
+            else:
+                locations = locations[1:]
+                for j in range(idx):
+                    enum += nCr(len(locations), k - i - 1)
+                    locations = locations[1:]
+        return enum
+
+    possible_orders = (N_ITEMS+1)**N_STACKS
+    possible_stacks_orders = nCr(N_ROWS * N_COLS + 1, N_STACKS) * possible_orders
+    enum_orders = sum(state.orders[i] * (N_ITEMS+1)**(N_STACKS-1-i) for i in range(N_STACKS))
+    return (enum_locs(state.robot_locs, N_ROBOTS) * possible_stacks_orders
+            + enum_locs(state.stack_locs, N_STACKS) * possible_orders + enum_orders)
+
+
+def check_random_states(n=2000, seed=0):
+    random.seed(seed)
+    state = State()
+    other = State()
+    for _ in range(n):
+        state.reset()
+        state.orders = [random.randint(0, N_ITEMS) for _ in range(N_STACKS)]
+        snum = state.enum()
+        assert snum == baseline_enum(state)
+        other.set_by_enum(snum)
+        assert (other.robot_locs, other.stack_locs, other.orders) == \
+            (state.robot_locs, state.stack_locs, state.orders)
+
+
+def test_enum_matches_baseline_for_every_state():
+    from tables import Tables
+    state = State()
+    for snum in range(Tables().num_states):
+        state.set_by_enum(snum)
+        assert state.enum() == snum
+        assert baseline_enum(state) == snum
+
+
+def test_random_states_round_trip():
+    check_random_states()
+
+
+def test_random_states_round_trip_with_more_robots_and_items():
+    env = dict(os.environ, WAREHOUSE_N_ROWS='4', WAREHOUSE_N_COLS='3', WAREHOUSE_N_ROBOTS='3',
+               WAREHOUSE_N_STACKS='4', WAREHOUSE_N_ITEMS='2')
+    code = ('import sys; sys.path[:0] = [%r, %r]\n' % (ROOT, os.path.join(ROOT, 'tests'))
+            + 'from test_state import check_random_states\ncheck_random_states()\n')
+    proc = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True,
+                          timeout=120)
+    assert proc.returncode == 0, proc.stderr
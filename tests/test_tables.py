@@ -0,0 +1,99 @@
+import os
+import random
+
+import numpy as np
+import pytest
+
+from actions import Actions
+from environment import Environment
+from tables import Tables
+
+def train(tables, n_steps=2000, seed=0):
+    random.seed(seed)
+    env = Environment(object())
+    snum = env.state.enum()
+    for step in range(n_steps):
+        a = Actions.by_enum(int(np.argmin(tables.visits[snum])))
+        previous_state = env.state
+        env.state = env.calculate_state(env.state, a)
+        previous_snum = snum
+        snum = env.state.enum()
+        tables.update(previous_state, env.state, a, sum(env.state.orders), previous_snum, snum)
+    return tables
+
+
+def rows(table, num_states):
+    return np.array([table[s] for s in range(num_states)])
+
+
+@pytest.mark.parametrize('backend', ['dense', 'sparse', 'memmap'])
+def test_save_and_read_tables(workdir, backend):
+    tables = train(Tables(backend=backend, cache_rows=16))
+    tables.performance_update(2000, 1.0)
+    tables.save_tables()
+    read = Tables(backend=backend, cache_rows=16)
+    read.read_tables()
+    n = tables.num_states
+    assert np.array_equal(rows(read.qvals, n), rows(tables.qvals, n))
+    assert np.array_equal(rows(read.visits, n), rows(tables.visits, n))
+    assert np.array_equal(rows(read.same_locs, n), rows(tables.same_locs, n))
+    assert read.visited == tables.visited
+    assert read.iterations() == 2000
+
+
+@pytest.mark.parametrize('backend', ['sparse', 'memmap'])
+def test_backend_matches_dense(workdir, backend):
+    dense = train(Tables(backend='dense'))
+    other = train(Tables(backend=backend, cache_rows=16))
+    n = dense.num_states
+    assert np.array_equal(rows(other.qvals, n), dense.qvals)
+    assert np.array_equal(rows(other.visits, n), dense.visits)
+    assert np.array_equal(rows(other.same_locs, n), dense.same_locs)
+
+
+def test_memmap_tables_do_not_share_files(workdir):
+    first = train(Tables(backend='memmap', cache_rows=16))
+    qvals = rows(first.qvals, first.num_states)
+    second = Tables(backend='memmap', cache_rows=16)
+    first.qvals.flush()
+    first.qvals._cache.clear()
+    assert first.qvals.path != second.qvals.path
+    assert np.array_equal(rows(first.qvals, first.num_states), qvals)
+    path = first.qvals.path
+    first.close()
+    assert not os.path.exists(path)
+    second.close()
+    assert os.listdir('Memmap') == []
+
+
+def test_memmap_reads_do_not_write(workdir):
+    tables = Tables(backend='memmap', cache_rows=16)
+    for s in range(tables.num_states):
+        tables.qvals[s].argmin()
+    tables.qvals.flush()
+    assert tables.qvals.evictions > 0
+    assert tables.qvals.writes == 0
+    with pytest.raises(ValueError):
+        tables.qvals[0][0] = 1
+    tables.qvals[0, 0] = 1
+    tables.qvals.flush()
+    assert tables.qvals.writes == 1
+    assert tables.qvals.read_rows(np.array([0]))[0, 0] == 1
+
+
+def test_update_compares_every_stack():
+    from location import Location
+    from state import State
+    tables = Tables()
+    s1 = State()
+    s1.robot_locs = [Location(1, 1)]
+    s1.stack_locs = [Location(0, 0), Location(2, 0)]
+    s1.orders = [0, 0]
+    s2 = State()
+    s2.robot_locs = [Location(1, 1)]
+    s2.stack_locs = [Location(0, 0), Location(2, 1)]
+    s2.orders = [0, 0]
+    a = Actions.by_enum(1)
+    tables.update(s1, s2, a, 0)
+    assert not tables.same_locs_row(s1.enum())[a.enum()]
+    assert tables.visits[s1.enum()].sum() == 1
@@ -0,0 +1,46 @@
+import random
+
+import numpy as np
+
+from actions import Actions
+from environment import Environment
+from tables import Tables
+from traces import TraceLearner
+from warehouse_parameters import LEARNING_RATE, DISCOUNT_FACTOR
+
+def transitions(n_steps=3000, seed=0):
+    random.seed(seed)
+    env = Environment(object())
+    steps = []
+    for step in range(n_steps):
+        if step % 30 == 0:
+            env.state.reset()
+        a = Actions.by_enum(random.randrange(Tables().num_actions))
+        previous_state = env.state
+        env.state = env.calculate_state(env.state, a)
+        steps.append((previous_state, env.state, a, sum(env.state.orders)))
+    return steps
+
+
+def test_one_step_return_matches_one_step_update():
+    one_step = Tables()
+    n_step = TraceLearner(Tables(), 'n_step', n=1)
+    for s1, s2, a, c in transitions():
+        one_step.update(s1, s2, a, c)
+        n_step.update(s1, s2, a, c)
+    assert np.allclose(n_step.tables.qvals, one_step.qvals, atol=1e-4)
+    assert np.array_equal(n_step.tables.visits, one_step.visits)
+
+
+def test_n_step_updates_each_visit_once():
+    tables = Tables()
+    learner = TraceLearner(tables, 'n_step', n=3)
+    (s1, s2, a, c), = transitions(1)
+    s1num, anum = s1.enum(), a.enum()
+    old_val = float(tables.qvals[s1num][anum])
+    min_val = float(min(tables.qvals[s2.enum()]))
+    learner.update(s1, s2, a, c)
+    assert tables.qvals[s1num][anum] == old_val
+    learner.end_episode()
+    expected = old_val + LEARNING_RATE * (c + DISCOUNT_FACTOR * min_val - old_val)
+    assert np.isclose(tables.qvals[s1num][anum], expected, atol=1e-4)
@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+def run(code, backend, rows, cols, check=True):
+    env = dict(os.environ, WAREHOUSE_N_ROWS=str(rows), WAREHOUSE_N_COLS=str(cols),
+               WAREHOUSE_TABLE_BACKEND=backend)
+    proc = subprocess.run([sys.executable, '-c', 'import sys; sys.path.insert(0, %r)\n' % ROOT + code],
+                          env=env, capture_output=True, text=True, timeout=300)
+    if not check:
+        assert proc.returncode != 0
+        return proc.stderr
+    assert proc.returncode == 0, proc.stderr
+    return proc.stdout
+
+
+TRAIN = '''
+from session import Session
+session = Session(overwrite=True)
+session.train(1, 10)
+session.checkpoint(1.0)
+'''
+
+TRANSFER = '''
+from transfer import transfer
+tables = transfer(2, 2, overwrite=True)
+if tables.backend == 'sparse':
+    rows = list(tables.qvals.items())
+    print(len(rows), tables.num_states)
+    for snum, row in rows:
+        print(snum, ' '.join(map(str, row.tolist())))
+else:
+    for snum in range(tables.num_states):
+        print(snum, ' '.join(map(str, tables.qvals[snum].tolist())))
+'''
+
+def test_sparse_transfer_only_writes_visited_rows(workdir):
+    run(TRAIN, 'dense', 2, 2)
+    sparse = run(TRANSFER, 'sparse', 3, 2).splitlines()
+    rows, num_states = map(int, sparse[0].split())
+    assert 0 < rows < num_states
+    dense = {int(line.split()[0]): line for line in run(TRANSFER, 'dense', 3, 2).splitlines()}
+    for line in sparse[1:]:
+        assert dense[int(line.split()[0])] == line
+
+def test_transfer_keeps_saved_target_tables(workdir):
+    run(TRAIN, 'dense', 2, 2)
+    run(TRAIN, 'dense', 3, 2)
+    saved = {name: open(os.path.join('Q-Tables', name)).read() for name in os.listdir('Q-Tables')}
+    stderr = run('from transfer import transfer\ntransfer(2, 2)\n', 'dense', 3, 2, check=False)
+    assert 'FileExistsError' in stderr
+    assert saved == {name: open(os.path.join('Q-Tables', name)).read() for name in os.listdir('Q-Tables')}
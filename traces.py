@@ -0,0 +1,357 @@
+import time
+
+import numpy as np
+
+from warehouse_parameters import N_ROBOTS, N_STACKS, LEARNING_RATE, DISCOUNT_FACTOR
+from warehouse_parameters import TD_METHOD, TRACE_LAMBDA, N_STEP
+
+METHODS = ('one_step', 'n_step', 'watkins')
+
+class TraceLearner:
+    """
+    Updates the Q-table of a Tables object with multi-step returns, so that
+    the cost of an ordered item reaching the picking station is passed back
+    along the path of the robot in 1 episode instead of 1 step per visit.
+
+    With method 'n_step', the q-value of each state/action is updated n time
+    steps later with the discounted sum of the next n costs plus the
+    discounted minimum q-value of the state reached. Since the later costs
+    only estimate the q-value if the later actions are greedy, the returns
+    are cut at the first action that is not greedy, and end with the
+    minimum q-value of the state where it was taken.
+
+    With method 'watkins', Watkins' Q(lambda) is used. Each state/action
+    that was visited recently has an eligibility trace, which is set to 1
+    when it is visited and multiplied by DISCOUNT_FACTOR * lam at every time
+    step. The temporal difference error of each time step updates every
+    state/action in proportion to its trace. All traces are cut when an
+    action that is not greedy is taken, since the later costs no longer
+    follow the greedy policy.
+
+    The traces are kept as arrays of the state enumerations, action
+    enumerations and eligibilities of the state/actions whose traces are at
+    least threshold, so the decay and the update of all traces are done
+    with 1 NumPy operation per time step. Since a trace falls below the
+    threshold after log(threshold) / log(DISCOUNT_FACTOR * lam) time steps,
+    the arrays stay short.
+
+    Each time step goes through Tables.update_enums, which updates the
+    visits and same_locs tables and gives the actions that leave the
+    locations unchanged the one step update. With method 'watkins' the
+    action taken also gets the one step update, and the traces pass its
+    temporal difference error on to the earlier state/actions. With method
+    'n_step' the q-value of the action taken is only updated with its n step
+    return, so it is updated once per visit.
+
+    Attributes
+    ----------
+    tables : Tables
+        The tables being trained.
+    method : str
+        Either 'n_step' or 'watkins'.
+    lam : float
+        The decay of the eligibility traces, in addition to the discount.
+    n : int
+        The number of costs in each return of method 'n_step'.
+    threshold : float
+        The smallest eligibility that is kept.
+    """
+
+    def __init__(self, tables, method=TD_METHOD, lam=TRACE_LAMBDA, n=N_STEP, threshold=1e-3):
+        """
+        Creates a TraceLearner with no traces.
+
+        Parameters
+        ----------
+        tables : Tables
+            The tables to train.
+        method : str
+            Either 'n_step' or 'watkins'.
+        lam : float
+            The decay of the eligibility traces.
+        n : int
+            The number of costs in each return of method 'n_step'.
+        threshold : float
+            The smallest eligibility that is kept.
+
+        Returns
+        -------
+        None.
+
+        """
+        if method not in ('n_step', 'watkins'):
+            raise ValueError('Unknown trace method: ' + str(method))
+        self.tables = tables
+        self.method = method
+        self.lam = lam
+        self.n = n
+        self.threshold = threshold
+
+        # the state/actions with traces, or the last n time steps for n_step
+        if method == 'watkins':
+            capacity = max(1, int(np.ceil(np.log(threshold) / np.log(DISCOUNT_FACTOR * lam))) + 1)
+        else:
+            capacity = n
+        self.snums = np.zeros(capacity, dtype=np.int64)
+        self.anums = np.zeros(capacity, dtype=np.int64)
+        self.traces = np.zeros(capacity, dtype=np.float64)
+        self.costs = np.zeros(capacity, dtype=np.float64)
+        self.length = 0
+        self.last_min = 0.0
+        self.discounts = DISCOUNT_FACTOR ** np.arange(n + 1)
+        return
+
+    def update(self, s1, s2, a, c, s1num=None, s2num=None):
+        """
+        Update the values in the Q-table after a time step. The parameters
+        are the same as Tables.update.
+
+        Parameters
+        ----------
+        s1 : State
+            The previous state.
+        s2 : State
+            The resulting state after taking an action.
+        a : Actions
+            The actions taken.
+        c : int
+            The cost recieved at that time step.
+        s1num : int, optional
+            The enumeration of the previous state, if it is already known.
+        s2num : int, optional
+            The enumeration of the resulting state, if it is already known.
+
+        Returns
+        -------
+        float
+            The one step temporal difference error of the action taken, so
+            that it can be compared with Tables.update.
+
+        """
+        same_locs = (all(s1.robot_locs[i] == s2.robot_locs[i] for i in range(N_ROBOTS))
+                     and all(s1.stack_locs[j] == s2.stack_locs[j] for j in range(N_STACKS)))
+        if s1num is None:
+            s1num = s1.enum()
+        if s2num is None:
+            s2num = s2.enum()
+        return self.update_enums(s1num, s2num, a.enum(), c, same_locs)
+
+    def update_enums(self, s1num, s2num, anum, c, same_locs):
+        """
+        Update the values in the Q-table after a time step given the
+        enumerations of the states and action.
+
+        Parameters
+        ----------
+        s1num : int
+            The enumeration of the previous state.
+        s2num : int
+            The enumeration of the resulting state.
+        anum : int
+            The enumeration of the actions taken.
+        c : int
+            The cost recieved at that time step.
+        same_locs : bool
+            Whether the robot/stack locations are the same in both states.
+
+        Returns
+        -------
+        float
+            The one step temporal difference error of the action taken.
+
+        """
+        row = self.tables.qvals[s1num]
+        greedy = anum == int(np.argmin(row))
+        min_val = float(min(self.tables.qvals[s2num]))
+        # the actions that have the same effect get the one step update, and
+        # so does the action taken unless its n step return will update it
+        td_error = self.tables.update_enums(s1num, s2num, anum, c, same_locs,
+                                            update_taken=self.method == 'watkins')
+
+        if self.method == 'watkins':
+            if not greedy:
+                self.length = 0
+            k = self.length
+            others = (self.snums[:k] != s1num) | (self.anums[:k] != anum)
+            self._add(self.snums[:k][others], self.anums[:k][others],
+                      LEARNING_RATE*td_error*self.traces[:k][others])
+            self._visit(s1num, anum)
+            k = self.length
+            self.traces[:k] *= DISCOUNT_FACTOR*self.lam
+            self._prune()
+        else:
+            if self.length > 0 and not greedy:
+                # the earlier returns are cut at this state
+                self._flush(self.last_min, self.length)
+            k = self.length
+            self.snums[k] = s1num
+            self.anums[k] = anum
+            self.costs[k] = c
+            self.length += 1
+            self.last_min = min_val
+            if self.length == self.n:
+                self._flush(min_val, 1)
+        return td_error
+
+    def end_episode(self):
+        """
+        Finish the episode. The returns of the last time steps of method
+        'n_step' are truncated at the last state, and the traces of method
+        'watkins' are cut.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.method == 'n_step' and self.length > 0:
+            self._flush(self.last_min, self.length)
+        self.length = 0
+        return
+
+    def _visit(self, snum, anum):
+        """
+        Set the trace of a state/action to 1, adding it if it has no trace.
+        """
+        k = self.length
+        found = np.flatnonzero((self.snums[:k] == snum) & (self.anums[:k] == anum))
+        if len(found):
+            self.traces[found[0]] = 1.0
+            return
+        if k == len(self.traces):
+            # replace the smallest trace
+            k = int(np.argmin(self.traces))
+        else:
+            self.length += 1
+        self.snums[k] = snum
+        self.anums[k] = anum
+        self.traces[k] = 1.0
+        return
+
+    def _prune(self):
+        """
+        Remove the traces that are smaller than the threshold.
+        """
+        k = self.length
+        keep = np.flatnonzero(self.traces[:k] >= self.threshold)
+        if len(keep) < k:
+            m = len(keep)
+            self.snums[:m] = self.snums[keep]
+            self.anums[:m] = self.anums[keep]
+            self.traces[:m] = self.traces[keep]
+            self.length = m
+        return
+
+    def _flush(self, min_val, count):
+        """
+        Update the oldest count stored time steps of method 'n_step' with the
+        returns up to the newest stored time step, and remove them.
+
+        Parameters
+        ----------
+        min_val : float
+            The minimum q-value of the state after the newest time step.
+        count : int
+            The number of time steps to update.
+
+        Returns
+        -------
+        None.
+
+        """
+        k = self.length
+        snums = self.snums[:k]
+        anums = self.anums[:k]
+        # the return of time step j is sum_i gamma^(i-j) c_i + gamma^(k-j) min_val
+        offsets = np.arange(k)[None, :] - np.arange(count)[:, None]
+        weights = np.where(offsets >= 0, self.discounts[np.clip(offsets, 0, self.n)], 0.0)
+        returns = weights @ self.costs[:k] + self.discounts[k - np.arange(count)] * min_val
+        old_vals = self._get(snums[:count], anums[:count])
+        self._add(snums[:count], anums[:count], LEARNING_RATE*(returns - old_vals))
+
+        remaining = k - count
+        self.snums[:remaining] = snums[count:]
+        self.anums[:remaining] = anums[count:]
+        self.costs[:remaining] = self.costs[count:k]
+        self.length = remaining
+        return
+
+    def _get(self, snums, anums):
+        """
+        Returns the q-values of state/actions.
+        """
+        qvals = self.tables.qvals
+        if self.tables.backend == 'dense':
+            return qvals[snums, anums].astype(np.float64)
+        return np.array([qvals[int(s)][int(a)] for s, a in zip(snums, anums)], dtype=np.float64)
+
+    def _add(self, snums, anums, deltas):
+        """
+        Add to the q-values of state/actions. A state/action that appears more
+        than once gets the sum of its changes.
+        """
+        qvals = self.tables.qvals
+        if self.tables.backend == 'dense':
+            np.add.at(qvals, (snums, anums), deltas.astype(qvals.dtype))
+        else:
+            for s, a, d in zip(snums, anums, deltas):
+                qvals[int(s), int(a)] += d
+        return
+
+
+def learner(tables, method=TD_METHOD):
+    """
+    Returns the object whose update method trains the tables with a method.
+
+    Parameters
+    ----------
+    tables : Tables
+        The tables to train.
+    method : str
+        One of METHODS.
+
+    Returns
+    -------
+    Tables or TraceLearner
+        The tables themselves for method 'one_step', otherwise a
+        TraceLearner.
+
+    """
+    if method == 'one_step':
+        return tables
+    return TraceLearner(tables, method)
+
+
+def compare(target, methods=METHODS, **kwargs):
+    """
+    Reports how many training time steps, and how much time, each method
+    needs to reach a score.
+
+    Parameters
+    ----------
+    target : float
+        The score to reach.
+    methods : [str]
+        The methods to compare.
+    **kwargs
+        Passed to heuristic.steps_to_score.
+
+    Returns
+    -------
+    dict
+        The number of time steps and seconds needed with each method.
+
+    """
+    from heuristic import steps_to_score
+    from warehouse_parameters import QVALS_INIT
+
+    result = {}
+    for method in methods:
+        start = time.perf_counter()
+        steps = steps_to_score(QVALS_INIT, target, td_method=method, **kwargs)
+        result[method] = (steps, time.perf_counter() - start)
+    print('time steps to reach a score of ' + str(target) + ':')
+    for method, (steps, seconds) in result.items():
+        print('    ' + method + ': ' + (str(steps) if steps is not None else 'not reached')
+              + ' (' + format(seconds, '.1f') + ' s)')
+    return result
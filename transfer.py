@@ -0,0 +1,232 @@
+"""
+Warm-start the Q-table of the current warehouse configuration from a table
+trained on a smaller grid.
+
+Each state of the current (target) grid is projected onto a representative
+state of the smaller (source) grid and its row of q-values is copied from
+that state. The source table must have been saved as a csv by
+Tables.save_tables and must have the same numbers of robots and stacks. The
+transferred tables are saved for the target configuration, so training with
+overwrite=False continues from them, e.g.
+
+    WAREHOUSE_N_ROWS=4 WAREHOUSE_N_COLS=3 python transfer.py 3 2
+
+Saved tables of the target configuration are only replaced with
+--overwrite.
+"""
+import argparse
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+
+from tables import Tables
+from util import nCr, config_name, rank_combination
+from warehouse_parameters import N_ROWS, N_COLS, N_ROBOTS, N_STACKS, N_ITEMS
+
+MODES = ('scale', 'clamp')
+
+def project_cell(idx, src_rows, src_cols, mode='scale'):
+    """
+    Projects a cell of the target grid onto the source grid.
+
+    The picking station stays at (0, -1) and the top row stays the top row,
+    so the path to the picking station keeps its shape. With mode 'scale'
+    the other rows and columns are scaled so that each cell keeps its
+    position relative to the picking column and the far edges of the grid.
+    With mode 'clamp' the cells near the picking station are kept and the
+    rows and columns beyond the edge of the source grid are clamped to it.
+
+    Parameters
+    ----------
+    idx : int
+        The index of the cell in the target grid, see Location.idx.
+    src_rows : int
+        The number of rows of the source grid.
+    src_cols : int
+        The number of columns of the source grid.
+    mode : str
+        Either 'scale' or 'clamp'.
+
+    Returns
+    -------
+    int
+        The index of the cell in the source grid.
+
+    """
+    if idx == -1:
+        return -1
+    row, col = divmod(idx, N_COLS)
+    if mode == 'clamp':
+        return min(row, src_rows - 1) * src_cols + min(col, src_cols - 1)
+
+    if row == 0 or src_rows == 1:
+        src_row = 0
+    elif N_ROWS == 2:
+        src_row = 1
+    else:
+        src_row = 1 + int((row - 1) * (src_rows - 2) / (N_ROWS - 2) + 0.5)
+    if N_COLS == 1:
+        src_col = 0
+    else:
+        src_col = int(col * (src_cols - 1) / (N_COLS - 1) + 0.5)
+    return src_row * src_cols + src_col
+
+def project_combination(positions, cell_map, n_src):
+    """
+    Projects the sorted positions of robots or stacks in the list of valid
+    locations of the target grid onto the source grid. If 2 of them are
+    projected onto the same cell, the later one is moved to the nearest free
+    cell.
+
+    Parameters
+    ----------
+    positions : [int]
+        The positions in the target grid in ascending order.
+    cell_map : [int]
+        The source position of each target position.
+    n_src : int
+        The number of valid locations of the source grid.
+
+    Returns
+    -------
+    [int]
+        The positions in the source grid in ascending order.
+    [int]
+        For each source position, the index in positions of the robot or
+        stack that was projected onto it.
+
+    """
+    taken = {}
+    for i, pos in enumerate(positions):
+        src = cell_map[pos]
+        dist = 1
+        while src in taken:
+            if cell_map[pos] + dist < n_src and cell_map[pos] + dist not in taken:
+                src = cell_map[pos] + dist
+            elif cell_map[pos] - dist >= 0 and cell_map[pos] - dist not in taken:
+                src = cell_map[pos] - dist
+            dist += 1
+        taken[src] = i
+    src_positions = sorted(taken)
+    return src_positions, [taken[src] for src in src_positions]
+
+def transfer(src_rows, src_cols, src_items=N_ITEMS, mode='scale', chunk_rows=65536, overwrite=False):
+    """
+    Creates the tables of the current configuration with q-values copied from
+    the saved Q-table of a smaller grid, and saves them.
+
+    The states are enumerated as in State.enum, so the projection of a state
+    only depends on the ranks of its robot locations, its stack locations and
+    its orders. The projections of these ranks are computed once each and the
+    rows of the table are filled in chunks of chunk_rows states. The orders
+    of each stack are clipped to src_items, and the q-values are scaled by
+    the ratio of the initial q-values of the 2 configurations, which is
+    proportional to the distance across the grid.
+
+    The visits and same_locs tables are left at their initial values, so
+    exploration based on the visits is not affected.
+
+    The sparse backend only gets the rows whose source state was visited,
+    according to the saved visits of the source grid. The other rows keep
+    the initial q-values of the table, so they are not allocated.
+
+    Parameters
+    ----------
+    src_rows : int
+        The number of rows of the source grid.
+    src_cols : int
+        The number of columns of the source grid.
+    src_items : int
+        The number of items per stack of the source configuration.
+    mode : str
+        How cells are projected, either 'scale' or 'clamp'. See project_cell.
+    chunk_rows : int
+        The number of rows filled at a time.
+    overwrite : bool
+        If True, replace the saved tables of the target configuration.
+        Otherwise a FileExistsError is raised if they exist.
+
+    Returns
+    -------
+    Tables
+        The transferred tables.
+
+    """
+    if mode not in MODES:
+        raise ValueError('Unknown projection mode: ' + str(mode))
+
+    name = config_name()
+    saved = [path for path in ['Performance/performance_' + name + '.csv']
+             + ['Q-Tables/qtable_' + name + ext for ext in ('.csv', '.npz', '.npy')]
+             if os.path.exists(path)]
+    if saved and not overwrite:
+        raise FileExistsError('the tables of ' + name + ' are already saved in '
+                              + ', '.join(saved) + '; use overwrite=True to replace them')
+
+    src_name = config_name(src_rows, src_cols, N_ROBOTS, N_STACKS, src_items)
+    src_qvals = np.asarray(pd.read_csv('Q-Tables/qtable_' + src_name + '.csv'))
+    src_visited = np.asarray(pd.read_csv('Visits/visits_' + src_name + '.csv')).any(axis=1)
+
+    n_src = src_rows * src_cols + 1
+    n_tgt = N_ROWS * N_COLS + 1
+    cell_map = [project_cell(idx, src_rows, src_cols, mode) + 1 for idx in range(-1, n_tgt - 1)]
+
+    # project the robot locations, stack locations and orders separately
+    robot_map = np.array([rank_combination(project_combination(c, cell_map, n_src)[0], n_src)
+                          for c in itertools.combinations(range(n_tgt), N_ROBOTS)], dtype=np.int64)
+    stack_map = []
+    stack_perm = []
+    for c in itertools.combinations(range(n_tgt), N_STACKS):
+        src_positions, perm = project_combination(c, cell_map, n_src)
+        stack_map.append(rank_combination(src_positions, n_src))
+        stack_perm.append(perm)
+    stack_map = np.array(stack_map, dtype=np.int64)
+    stack_perm = np.array(stack_perm, dtype=np.int64).reshape(len(stack_map), N_STACKS)
+    order_digits = np.array(list(itertools.product(range(N_ITEMS + 1), repeat=N_STACKS)),
+                            dtype=np.int64).reshape(-1, N_STACKS)
+    src_weights = (src_items + 1) ** np.arange(N_STACKS - 1, -1, -1, dtype=np.int64)
+
+    tgt_orders = (N_ITEMS + 1)**N_STACKS
+    tgt_stacks_orders = len(stack_map) * tgt_orders
+    src_orders = (src_items + 1)**N_STACKS
+    src_stacks_orders = nCr(n_src, N_STACKS) * src_orders
+    scale = (N_ROWS + N_COLS - 1) / (src_rows + src_cols - 1)
+
+    tables = Tables()
+    for start in range(0, tables.num_states, chunk_rows):
+        snums = np.arange(start, min(start + chunk_rows, tables.num_states), dtype=np.int64)
+        robots = snums // tgt_stacks_orders
+        stacks = snums % tgt_stacks_orders // tgt_orders
+        orders = snums % tgt_orders
+        # the orders follow their stacks to their sorted source positions
+        digits = np.take_along_axis(order_digits[orders], stack_perm[stacks], axis=1)
+        src_snums = (robot_map[robots] * src_stacks_orders
+                     + stack_map[stacks] * src_orders
+                     + np.minimum(digits, src_items) @ src_weights)
+        if tables.backend == 'dense':
+            tables.qvals[snums] = src_qvals[src_snums] * scale
+            continue
+        if tables.backend == 'sparse':
+            visited = src_visited[src_snums]
+            snums = snums[visited]
+            src_snums = src_snums[visited]
+        for snum, row in zip(snums.tolist(), src_qvals[src_snums] * scale):
+            tables.qvals[snum] = row
+    tables.save_tables()
+    return tables
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Warm-start the Q-table of the current configuration from a smaller grid.')
+    parser.add_argument('rows', type=int, help='rows of the source grid')
+    parser.add_argument('cols', type=int, help='columns of the source grid')
+    parser.add_argument('--items', type=int, default=N_ITEMS,
+                        help='items per stack of the source configuration')
+    parser.add_argument('--mode', choices=MODES, default='scale')
+    parser.add_argument('--overwrite', action='store_true',
+                        help='replace the saved tables of the current configuration')
+    args = parser.parse_args()
+    transfer(args.rows, args.cols, args.items, args.mode, overwrite=args.overwrite)
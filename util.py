@@ -1,9 +1,13 @@
-from math import factorial
+from functools import lru_cache
+from math import comb
+
+from warehouse_parameters import N_ROWS, N_COLS, N_ROBOTS, N_STACKS, N_ITEMS
 
 def nCr(n, r):
     """
     Determine the number of combinations that r objects can form out of a set
-    of n objects.
+    of n objects. The count is computed with exact integer arithmetic, so it
+    is exact for configurations of any size.
 
     Parameters
     ----------
@@ -19,4 +23,146 @@ def nCr(n, r):
         of n objects.
 
     """
-    return int(factorial(n) / factorial(r) / factorial(n-r))
\ No newline at end of file
+    return comb(n, r)
+
+def state_count(n_rows=N_ROWS, n_cols=N_COLS, n_robots=N_ROBOTS, n_stacks=N_STACKS, 
+                n_items=N_ITEMS):
+    """
+    Determine the exact number of states of the current warehouse 
+    parameters, or of other parameters if they are given. This is the number
+    of rows of the tables and the range of State.enum.
+
+    Parameters
+    ----------
+    n_rows : int
+        The number of rows of the grid.
+    n_cols : int
+        The number of columns of the grid.
+    n_robots : int
+        The number of robots.
+    n_stacks : int
+        The number of stacks.
+    n_items : int
+        The number of items per stack.
+
+    Returns
+    -------
+    int
+        The number of states.
+
+    """
+    n_locs = n_rows * n_cols + 1
+    return nCr(n_locs, n_robots) * nCr(n_locs, n_stacks) * (n_items + 1)**n_stacks
+
+@lru_cache(maxsize=None)
+def _rank_offsets(n, k):
+    """
+    Returns offsets[i][x], the number of combinations of k objects out of n
+    that come before the combinations whose i-th object is x and whose first
+    i objects are 0, ..., i-1. The rank of a combination is the sum over its
+    objects of the difference between the offsets of the object and the
+    object after the previous one.
+
+    Returns
+    -------
+    [[int]]
+        The offsets of each position in the combination.
+
+    """
+    offsets = []
+    for i in range(k):
+        row = [0]
+        for j in range(n):
+            row.append(row[-1] + nCr(n - j - 1, k - i - 1) if n - j - 1 >= k - i - 1 else row[-1])
+        offsets.append(row)
+    return offsets
+
+def rank_combination(idxs, n):
+    """
+    Determine the rank of a combination in the lexicographic order of all
+    combinations of len(idxs) objects out of a set of n objects. This is the
+    order used by State.enum to enumerate the robot and stack locations.
+
+    Parameters
+    ----------
+    idxs : [int]
+        The chosen objects in ascending order, each in range(n).
+    n : int
+        The number of objects chosen from.
+
+    Returns
+    -------
+    int
+        The rank of the combination.
+
+    """
+    offsets = _rank_offsets(n, len(idxs))
+    rank = 0
+    prev = -1
+    for i, idx in enumerate(idxs):
+        row = offsets[i]
+        rank += row[idx] - row[prev + 1]
+        prev = idx
+    return rank
+
+def unrank_combination(rank, n, k):
+    """
+    Determine the combination with a given rank in the lexicographic order of
+    all combinations of k objects out of a set of n objects. This is the 
+    inverse of rank_combination.
+
+    Parameters
+    ----------
+    rank : int
+        The rank of the combination.
+    n : int
+        The number of objects chosen from.
+    k : int
+        The number of objects chosen.
+
+    Returns
+    -------
+    [int]
+        The chosen objects in ascending order.
+
+    """
+    idxs = []
+    x = 0
+    for i in range(k):
+        count = nCr(n - x - 1, k - i - 1)
+        while rank >= count:
+            rank -= count
+            x += 1
+            count = nCr(n - x - 1, k - i - 1)
+        idxs.append(x)
+        x += 1
+    return idxs
+
+def config_name(n_rows=N_ROWS, n_cols=N_COLS, n_robots=N_ROBOTS, n_stacks=N_STACKS, 
+                n_items=N_ITEMS):
+    """
+    Determine the name used in the file names of the tables for the current 
+    warehouse parameters, or for other parameters if they are given.
+
+    Parameters
+    ----------
+    n_rows : int
+        The number of rows of the grid.
+    n_cols : int
+        The number of columns of the grid.
+    n_robots : int
+        The number of robots.
+    n_stacks : int
+        The number of stacks.
+    n_items : int
+        The number of items per stack.
+
+    Returns
+    -------
+    str
+        The name of the configuration, e.g. 3x2grid_1robots_2stacks_1items.
+
+    """
+    return (str(n_rows) + 'x' + str(n_cols) + 'grid_' 
+            + str(n_robots) + 'robots_' + str(n_stacks) + 'stacks_'
+            + str(n_items) + 'items')
\ No newline at end of file
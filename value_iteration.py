@@ -0,0 +1,544 @@
+"""
+Exact value iteration of the q-values, with the states sharded across worker
+processes by the locations of the robots.
+
+State.enum numbers the states robot locations first, so the states whose
+robots are in the same locations are contiguous, and splitting the ranks of
+the robot locations into ranges splits the states into contiguous shards.
+Each worker builds the transitions of its own shard from Environment.move
+and the order probabilities, and only keeps its own shard of the values and
+transitions in memory. The workers connect to a coordinator with
+multiprocessing.connection, locally or from other nodes. Each round, every
+worker sweeps its shard with the values of the states of other shards that
+its transitions lead to, and sends the coordinator the values of its own
+states that other shards need, which the coordinator passes on. Only these
+boundary values are exchanged. Once the values change by less than the
+tolerance, the q-values are collected shard by shard, e.g.
+
+    python value_iteration.py --workers 4 --save
+
+or with workers on other nodes, started after the coordinator:
+
+    python value_iteration.py --workers 2 --address 0.0.0.0:6000 --remote
+    python value_iteration.py --worker --address coordinator:6000
+"""
+import argparse
+import multiprocessing as mp
+import time
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+from actions import Actions, NUM_JOINT_ACTIONS
+from environment import Environment
+from state import State, POSSIBLE_ORDERS, POSSIBLE_STACKS_ORDERS
+from util import nCr, rank_combination, unrank_combination
+from warehouse_parameters import N_ROWS, N_COLS, N_ROBOTS, N_STACKS, N_ITEMS, ORDER_PROB
+from warehouse_parameters import DISCOUNT_FACTOR
+
+N_LOCS = N_ROWS * N_COLS + 1
+POSSIBLE_ROBOTS = nCr(N_LOCS, N_ROBOTS)
+POSSIBLE_STACKS = nCr(N_LOCS, N_STACKS)
+NUM_STATES = POSSIBLE_ROBOTS * POSSIBLE_STACKS_ORDERS
+
+# the orders of each enumeration of the orders, and the arrivals of each
+# outcome of a time step, with 1 column per stack
+ORDERS = np.array([[code // (N_ITEMS+1)**(N_STACKS-1-i) % (N_ITEMS+1) for i in range(N_STACKS)]
+                   for code in range(POSSIBLE_ORDERS)], dtype=np.int64)
+ARRIVALS = np.array([[outcome >> (N_STACKS-1-i) & 1 for i in range(N_STACKS)]
+                     for outcome in range(2**N_STACKS)], dtype=bool)
+ORDER_WEIGHTS = (N_ITEMS+1)**np.arange(N_STACKS - 1, -1, -1, dtype=np.int64)
+
+AUTHKEY = b'warehouse'
+
+def shard_bounds(n_shards):
+    """
+    Splits the states into contiguous shards by the rank of the robot
+    locations.
+
+    Parameters
+    ----------
+    n_shards : int
+        The number of shards.
+
+    Returns
+    -------
+    [(int, int)]
+        The first state and 1 past the last state of each shard.
+
+    """
+    n_shards = min(n_shards, POSSIBLE_ROBOTS)
+    cuts = [POSSIBLE_ROBOTS * i // n_shards for i in range(n_shards + 1)]
+    return [(cuts[i] * POSSIBLE_STACKS_ORDERS, cuts[i+1] * POSSIBLE_STACKS_ORDERS)
+            for i in range(n_shards)]
+
+
+def location_transitions(env, state, prob=ORDER_PROB):
+    """
+    Determines the transitions of every state with the robot and stack
+    locations of a state, for every action.
+
+    Environment.move only depends on the locations, so it is called once per
+    action, and the outcomes of the orders are computed for every
+    enumeration of the orders at once. Each stack that is not returned gets a
+    new order with probability prob, so there are 2**N_STACKS outcomes, some
+    of which have probability 0.
+
+    Parameters
+    ----------
+    env : Environment
+        The environment whose move method is used.
+    state : State
+        A state with the robot and stack locations.
+    prob : float
+        The probability that a stack gets a new order.
+
+    Returns
+    -------
+    succ : NumPy Array
+        The enumeration of the next state of each enumeration of the orders,
+        action and outcome, with shape (POSSIBLE_ORDERS, NUM_JOINT_ACTIONS,
+        2**N_STACKS).
+    probs : NumPy Array
+        The probability of each action and outcome, with shape
+        (NUM_JOINT_ACTIONS, 2**N_STACKS).
+    costs : NumPy Array
+        The expected cost of each enumeration of the orders and action, with
+        shape (POSSIBLE_ORDERS, NUM_JOINT_ACTIONS).
+
+    """
+    succ = np.empty((POSSIBLE_ORDERS, NUM_JOINT_ACTIONS, len(ARRIVALS)), dtype=np.int64)
+    probs = np.empty((NUM_JOINT_ACTIONS, len(ARRIVALS)))
+    costs = np.empty((POSSIBLE_ORDERS, NUM_JOINT_ACTIONS))
+    for anum in range(NUM_JOINT_ACTIONS):
+        succ[:, anum], probs[anum], costs[:, anum] = action_transitions(
+            env, state, Actions.by_enum(anum), ORDERS, prob)
+    return succ, probs, costs
+
+
+def action_transitions(env, state, a, orders, prob=ORDER_PROB):
+    """
+    Determines the transitions of taking an action in the states with the
+    robot and stack locations of a state and the given orders.
+
+    Parameters
+    ----------
+    env : Environment
+        The environment whose move method is used.
+    state : State
+        A state with the robot and stack locations.
+    a : Actions
+        The action taken.
+    orders : NumPy Array
+        The orders of each stack, with 1 row per state.
+    prob : float
+        The probability that a stack gets a new order.
+
+    Returns
+    -------
+    succ : NumPy Array
+        The enumeration of the next state of each row of orders and outcome,
+        with shape (len(orders), 2**N_STACKS).
+    probs : NumPy Array
+        The probability of each outcome.
+    costs : NumPy Array
+        The expected cost of each row of orders.
+
+    """
+    robot_locs, stack_locs, returned = env.move(state, a)
+    returned = np.array(returned)
+    stack_order = sorted(range(N_STACKS), key=stack_locs.__getitem__)
+    enum_robots = rank_combination(sorted(loc.rank for loc in robot_locs), N_LOCS)
+    enum_stacks = rank_combination([stack_locs[i].rank for i in stack_order], N_LOCS)
+
+    # the returned stacks lose an order whether or not they get a new one
+    new_orders = np.where(returned, np.maximum(orders[:, None, :] - 1, 0),
+                          np.where(ARRIVALS, np.minimum(orders[:, None, :] + 1, N_ITEMS),
+                                   orders[:, None, :]))
+    probs = np.where(returned, ~ARRIVALS, np.where(ARRIVALS, prob, 1 - prob)).prod(axis=1)
+    succ = (enum_robots * POSSIBLE_STACKS_ORDERS + enum_stacks * POSSIBLE_ORDERS
+            + new_orders[:, :, stack_order] @ ORDER_WEIGHTS)
+    costs = new_orders.sum(axis=2) @ probs
+    return succ, probs, costs
+
+
+class Shard:
+    """
+    The states of a range of robot locations and their transitions.
+
+    The transitions are stored as indices into the values of the shard
+    followed by the boundary values, the values of the states of other shards
+    that the transitions lead to.
+
+    Attributes
+    ----------
+    start : int
+        The first state of the shard.
+    stop : int
+        1 past the last state of the shard.
+    values : NumPy Array
+        The values of the states of the shard followed by the boundary
+        values.
+    boundary : NumPy Array
+        The enumerations of the states of the boundary values, in ascending
+        order.
+    """
+
+    def __init__(self, start, stop, discount=DISCOUNT_FACTOR, prob=ORDER_PROB):
+        """
+        Builds the transitions of the states of a shard.
+
+        Parameters
+        ----------
+        start : int
+            The first state of the shard, a multiple of
+            POSSIBLE_STACKS_ORDERS.
+        stop : int
+            1 past the last state of the shard, a multiple of
+            POSSIBLE_STACKS_ORDERS.
+        discount : float
+            The discount factor.
+        prob : float
+            The probability that a stack gets a new order.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.start = start
+        self.stop = stop
+        self.discount = discount
+        n_configs = (stop - start) // POSSIBLE_ORDERS
+        n_outcomes = len(ARRIVALS)
+        succ = np.empty((n_configs, POSSIBLE_ORDERS, NUM_JOINT_ACTIONS, n_outcomes), dtype=np.int64)
+        self._probs = np.empty((n_configs, 1, NUM_JOINT_ACTIONS, n_outcomes))
+        self._costs = np.empty((n_configs, POSSIBLE_ORDERS, NUM_JOINT_ACTIONS))
+
+        env = Environment(object())
+        state = State()
+        valid_locations = state.valid_locations
+        config = 0
+        for enum_robots in range(start // POSSIBLE_STACKS_ORDERS, stop // POSSIBLE_STACKS_ORDERS):
+            state.robot_locs = [valid_locations[idx]
+                                for idx in unrank_combination(enum_robots, N_LOCS, N_ROBOTS)]
+            for enum_stacks in range(POSSIBLE_STACKS):
+                state.stack_locs = [valid_locations[idx]
+                                    for idx in unrank_combination(enum_stacks, N_LOCS, N_STACKS)]
+                (succ[config], self._probs[config, 0],
+                 self._costs[config]) = location_transitions(env, state, prob)
+                config += 1
+
+        outside = (succ < start) | (succ >= stop)
+        self.boundary = np.unique(succ[outside])
+        index = succ - start
+        index[outside] = (stop - start) + np.searchsorted(self.boundary, succ[outside])
+        self._index = index.astype(np.int32 if len(self.boundary) + stop - start < 2**31
+                                   else np.int64)
+        self.values = np.zeros(stop - start + len(self.boundary))
+        return
+
+    def needs(self, bounds):
+        """
+        Groups the boundary states by the shard they belong to.
+
+        Parameters
+        ----------
+        bounds : [(int, int)]
+            The first state and 1 past the last state of each shard.
+
+        Returns
+        -------
+        dict
+            The enumerations of the boundary states of each other shard.
+
+        """
+        needs = {}
+        for shard, (start, stop) in enumerate(bounds):
+            lo, hi = np.searchsorted(self.boundary, [start, stop])
+            if hi > lo:
+                needs[shard] = self.boundary[lo:hi]
+        return needs
+
+    def set_boundary(self, enums, values):
+        """
+        Sets boundary values.
+
+        Parameters
+        ----------
+        enums : NumPy Array
+            The enumerations of the states, in ascending order.
+        values : NumPy Array
+            Their values.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.values[self.stop - self.start + np.searchsorted(self.boundary, enums)] = values
+        return
+
+    def qvals(self, configs=slice(None)):
+        """
+        Computes the q-values of the states of the shard from the current
+        values.
+
+        Parameters
+        ----------
+        configs : slice
+            The robot and stack locations of the shard to compute the
+            q-values of.
+
+        Returns
+        -------
+        NumPy Array
+            The q-values, with 1 row per state and 1 column per action.
+
+        """
+        q = (self._costs[configs]
+             + self.discount * (self._probs[configs] * self.values[self._index[configs]]).sum(axis=3))
+        return q.reshape(-1, NUM_JOINT_ACTIONS)
+
+    def sweep(self, chunk_configs=4096):
+        """
+        Updates the values of the states of the shard to the smallest q-value
+        of each state.
+
+        Parameters
+        ----------
+        chunk_configs : int
+            The number of robot and stack locations updated at a time, which
+            bounds the temporary memory.
+
+        Returns
+        -------
+        float
+            The largest change of a value.
+
+        """
+        n_configs = len(self._costs)
+        new_values = np.empty(self.stop - self.start)
+        for c in range(0, n_configs, chunk_configs):
+            configs = slice(c, min(c + chunk_configs, n_configs))
+            new_values[c * POSSIBLE_ORDERS:configs.stop * POSSIBLE_ORDERS] = self.qvals(configs).min(axis=1)
+        residual = float(np.abs(new_values - self.values[:len(new_values)]).max())
+        self.values[:len(new_values)] = new_values
+        return residual
+
+
+def run_worker(address, authkey=AUTHKEY):
+    """
+    Connects to a coordinator and solves a shard until it is told to stop.
+
+    The messages from the coordinator are:
+        ('init', shard, bounds, discount, prob, num_states)
+        ('serve', {shard: enums})
+        ('sweep', {shard: (enums, values)}, local_sweeps)
+        ('collect', chunk_configs)
+        ('stop',)
+
+    Parameters
+    ----------
+    address : (str, int)
+        The address of the coordinator.
+    authkey : bytes
+        The key that authenticates the connection.
+
+    Returns
+    -------
+    None.
+
+    """
+    conn = Client(address, authkey=authkey)
+    shard = None
+    serve = {}
+    while True:
+        message = conn.recv()
+        kind = message[0]
+        if kind == 'init':
+            _, shard_id, bounds, discount, prob, num_states = message
+            if num_states != NUM_STATES:
+                conn.send(('error', 'the worker has ' + str(NUM_STATES) + ' states, not '
+                           + str(num_states) + '; check its warehouse parameters'))
+                break
+            start, stop = bounds[shard_id]
+            shard = Shard(start, stop, discount, prob)
+            conn.send(('needs', shard.needs(bounds)))
+        elif kind == 'serve':
+            serve = message[1]
+            conn.send(('ready',))
+        elif kind == 'sweep':
+            _, incoming, local_sweeps = message
+            for enums, values in incoming.values():
+                shard.set_boundary(enums, values)
+            residual = max(shard.sweep() for _ in range(local_sweeps))
+            outgoing = {other: shard.values[enums - shard.start] for other, enums in serve.items()}
+            conn.send(('values', residual, outgoing))
+        elif kind == 'collect':
+            n_configs = len(shard._costs)
+            for c in range(0, n_configs, message[1]):
+                configs = slice(c, min(c + message[1], n_configs))
+                conn.send(('q', shard.start + c * POSSIBLE_ORDERS,
+                           shard.qvals(configs).astype(np.float32)))
+            conn.send(('done',))
+        elif kind == 'stop':
+            break
+    conn.close()
+    return
+
+
+def solve(n_workers=2, tolerance=1e-4, max_rounds=1000, local_sweeps=1, tables=None,
+          address=('localhost', 0), authkey=AUTHKEY, spawn=True, discount=DISCOUNT_FACTOR,
+          prob=ORDER_PROB, chunk_configs=4096):
+    """
+    Solves for the q-values with value iteration sharded across workers.
+
+    Parameters
+    ----------
+    n_workers : int
+        The number of workers, and of shards.
+    tolerance : float
+        Value iteration stops once no value changes by more than tolerance in
+        a round.
+    max_rounds : int
+        The largest number of rounds.
+    local_sweeps : int
+        The number of sweeps each worker makes per round with the same
+        boundary values, which reduces the number of exchanges.
+    tables : Tables, optional
+        The tables whose q-values are overwritten with the solution. Each
+        shard is written as it is collected.
+    address : (str, int)
+        The address the coordinator listens on. Port 0 picks a free port.
+    authkey : bytes
+        The key that authenticates the connections.
+    spawn : bool
+        If True, the workers are started as local processes. Otherwise the
+        coordinator waits for n_workers workers to connect, see run_worker.
+    discount : float
+        The discount factor.
+    prob : float
+        The probability that a stack gets a new order.
+    chunk_configs : int
+        The number of robot and stack locations per message when the
+        q-values are collected.
+
+    Returns
+    -------
+    dict
+        The number of rounds, the largest change of a value in the last
+        round, the number of boundary values exchanged per round, the number
+        of seconds taken, and the values of the states if no tables were
+        given.
+
+    """
+    start_time = time.perf_counter()
+    bounds = shard_bounds(n_workers)
+    listener = Listener(address, authkey=authkey)
+    processes = []
+    if spawn:
+        for _ in bounds:
+            process = mp.Process(target=run_worker, args=(listener.address, authkey), daemon=True)
+            process.start()
+            processes.append(process)
+    else:
+        print('waiting for ' + str(len(bounds)) + ' workers on ' + str(listener.address))
+    conns = [listener.accept() for _ in bounds]
+    try:
+        for shard_id, conn in enumerate(conns):
+            conn.send(('init', shard_id, bounds, discount, prob, NUM_STATES))
+        serves = [{} for _ in bounds]
+        for shard_id, conn in enumerate(conns):
+            message = conn.recv()
+            if message[0] == 'error':
+                raise RuntimeError(message[1])
+            for owner, enums in message[1].items():
+                serves[owner][shard_id] = enums
+        for conn, serve in zip(conns, serves):
+            conn.send(('serve', serve))
+        for conn in conns:
+            conn.recv()
+        exchanged = sum(len(enums) for serve in serves for enums in serve.values())
+
+        incoming = [{} for _ in bounds]
+        for rounds in range(1, max_rounds + 1):
+            for conn, messages in zip(conns, incoming):
+                conn.send(('sweep', messages, local_sweeps))
+            incoming = [{} for _ in bounds]
+            residual = 0.0
+            for shard_id, conn in enumerate(conns):
+                _, shard_residual, outgoing = conn.recv()
+                residual = max(residual, shard_residual)
+                for other, values in outgoing.items():
+                    incoming[other][shard_id] = (serves[shard_id][other], values)
+            if residual < tolerance:
+                break
+
+        result = {'rounds': rounds, 'residual': residual, 'exchanged': exchanged}
+        values = None if tables is not None else np.empty(NUM_STATES)
+        for conn in conns:
+            conn.send(('collect', chunk_configs))
+            while True:
+                message = conn.recv()
+                if message[0] == 'done':
+                    break
+                _, first, q = message
+                if tables is None:
+                    values[first:first + len(q)] = q.min(axis=1)
+                elif tables.backend == 'dense':
+                    tables.qvals[first:first + len(q)] = q
+                else:
+                    for i, row in enumerate(q):
+                        tables.qvals[first + i] = row
+        if values is not None:
+            result['values'] = values
+    finally:
+        for conn in conns:
+            conn.send(('stop',))
+            conn.close()
+        listener.close()
+        for process in processes:
+            process.join()
+    result['seconds'] = time.perf_counter() - start_time
+    return result
+
+
+def _address(text):
+    host, port = text.rsplit(':', 1)
+    return host, int(port)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Solve for the q-values with sharded value iteration.')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--tolerance', type=float, default=1e-4)
+    parser.add_argument('--max-rounds', type=int, default=1000)
+    parser.add_argument('--local-sweeps', type=int, default=1)
+    parser.add_argument('--address', type=_address, default=('localhost', 0), help='host:port')
+    parser.add_argument('--authkey', default=AUTHKEY.decode())
+    parser.add_argument('--remote', action='store_true',
+                        help='wait for workers started on other nodes instead of starting them')
+    parser.add_argument('--worker', action='store_true', help='run a worker')
+    parser.add_argument('--save', action='store_true', help='save the solved tables')
+    parser.add_argument('--evaluate', type=int, default=0,
+                        help='evaluate the greedy policy for this many episodes')
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.address, args.authkey.encode())
+    else:
+        from agent import Agent
+        from evaluator import evaluate
+
+        agent = Agent()
+        result = solve(args.workers, args.tolerance, args.max_rounds, args.local_sweeps,
+                       agent.tables, args.address, args.authkey.encode(), not args.remote)
+        print('{} states in {} shards: {} rounds, residual {:.2e}, {} boundary values per round, '
+              '{:.1f} s'.format(NUM_STATES, len(shard_bounds(args.workers)), result['rounds'],
+                                result['residual'], result['exchanged'], result['seconds']))
+        if args.save:
+            agent.tables.save_tables()
+        if args.evaluate:
+            print(evaluate(agent.greedy_policy, tolerance=None, max_episodes=args.evaluate,
+                           agent=agent))
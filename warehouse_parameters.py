@@ -1,9 +1,61 @@
-N_ROWS = 3
-N_COLS = 2
-N_ROBOTS = 1
-N_STACKS = 2
-N_ITEMS = 1
-ORDER_PROB = 0.1
-
-LEARNING_RATE = 0.4
-DISCOUNT_FACTOR = 0.9
\ No newline at end of file
+import os
+
+def _param(name, default):
+    """
+    Returns the value of a parameter. The default value can be overridden by
+    setting the environment variable WAREHOUSE_<name>, which allows scripts
+    such as benchmark.py to run the simulator with other parameters in a new
+    process.
+
+    Parameters
+    ----------
+    name : str
+        The name of the parameter.
+    default : int, float, str, bool or None
+        The value of the parameter if the environment variable is not set.
+        The environment variable is converted to the type of this value.
+
+    Returns
+    -------
+    int, float, str, bool or None
+        The value of the parameter.
+
+    """
+    value = os.environ.get('WAREHOUSE_' + name)
+    if value is None:
+        return default
+    elif value.lower() == 'none':
+        return None
+    elif isinstance(default, bool):
+        return value.lower() in ('1', 'true', 'yes')
+    elif default is None:
+        return int(value)
+    else:
+        return type(default)(value)
+
+N_ROWS = _param('N_ROWS', 3)
+N_COLS = _param('N_COLS', 2)
+N_ROBOTS = _param('N_ROBOTS', 1)
+N_STACKS = _param('N_STACKS', 2)
+N_ITEMS = _param('N_ITEMS', 1)
+ORDER_PROB = _param('ORDER_PROB', 0.1)
+
+LEARNING_RATE = _param('LEARNING_RATE', 0.4)
+DISCOUNT_FACTOR = _param('DISCOUNT_FACTOR', 0.9)
+TD_METHOD = _param('TD_METHOD', 'one_step')
+TRACE_LAMBDA = _param('TRACE_LAMBDA', 0.8)
+N_STEP = _param('N_STEP', 4)
+EVAL_TOLERANCE = _param('EVAL_TOLERANCE', 0.05)
+
+QVALS_DTYPE = _param('QVALS_DTYPE', 'float32')
+QVALS_INIT = _param('QVALS_INIT', 'constant')
+VISITS_DTYPE = _param('VISITS_DTYPE', 'uint32')
+
+TABLE_BACKEND = _param('TABLE_BACKEND', 'dense')
+SPARSE_MAX_ROWS = _param('SPARSE_MAX_ROWS', None)
+MEMMAP_ROW_ORDER = _param('MEMMAP_ROW_ORDER', 'robots')
+MEMMAP_CACHE_ROWS = _param('MEMMAP_CACHE_ROWS', 4096)
+
+PROFILE = _param('PROFILE', False)
+SHADOW_EVAL = _param('SHADOW_EVAL', False)
+METRICS = _param('METRICS', False)